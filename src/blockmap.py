@@ -0,0 +1,284 @@
+# src/blockmap.py
+import os, struct, hashlib
+from multiprocessing import Pool
+from .img_reader import DiskImage, get_default_throttle, set_default_throttle
+from .ext4_parser import read_superblock, read_group_descriptors, parse_inode_bytes
+
+# ------------------------------------------------------------
+# Mapas de hashes por bloque ("block maps")
+#
+# Un block map guarda un hash corto (BLAKE2b truncado) por cada
+# bloque de la imagen. Comparando el mapa de dos adquisiciones del
+# mismo servidor se obtienen los bloques que cambiaron, y los
+# escáneres solo necesitan releer esos rangos: el coste pasa a ser
+# proporcional a la actividad ("churn") y no al tamaño del volumen.
+#
+# Formato del archivo (<imagen>.blockmap):
+#   cabecera: magic(8) | block_size(u32) | digest_size(u8) | image_size(u64)
+#   cuerpo  : digest_size bytes por bloque, en orden
+# ------------------------------------------------------------
+BLOCKMAP_MAGIC = b"BLKMAP1\0"
+HEADER = struct.Struct("<8sIBQ")
+
+DEFAULT_BLOCK_SIZE = 4096
+DEFAULT_DIGEST_SIZE = 8
+SEGMENT_SIZE = 64 * 1024 * 1024     # bytes que hashea cada tarea del pool
+
+# Al comparar mapas se compara primero por grupos de bloques completos
+COMPARE_GROUP = 4096
+
+
+def blockmap_path(image_path):
+    """
+    Ruta por defecto del block map: junto a la imagen.
+    """
+    return image_path + ".blockmap"
+
+
+# ------------------------------------------------------------
+# Construcción (en paralelo)
+# ------------------------------------------------------------
+def _hash_segment(task):
+    """
+    Tarea del pool: hashea los bloques de un segmento de la imagen.
+    Retorna los digests concatenados.
+    """
+    image_path, offset, length, block_size, digest_size = task
+    out = bytearray()
+    with DiskImage(image_path).open() as f:
+        f.seek(offset)
+        data = f.read(length)
+    view = memoryview(data)
+    for pos in range(0, len(data), block_size):
+        out += hashlib.blake2b(view[pos:pos + block_size], digest_size=digest_size).digest()
+    return bytes(out)
+
+
+def build_blockmap(image_path, out_path=None, block_size=DEFAULT_BLOCK_SIZE,
+                   digest_size=DEFAULT_DIGEST_SIZE, workers=None):
+    """
+    Calcula el block map de una imagen y lo guarda en disco.
+
+    Parámetros:
+      image_path  : ruta a la imagen
+      out_path    : destino (por defecto <imagen>.blockmap)
+      block_size  : tamaño del bloque hasheado
+      digest_size : bytes de hash por bloque (8 → 2 MB por GB de imagen a 4K)
+      workers     : procesos del pool (por defecto, todos los CPUs)
+
+    Los segmentos se hashean en paralelo y se escriben en orden, así que
+    la memoria usada es de unos pocos segmentos en vuelo.
+
+    Retorna la ruta del block map.
+    """
+    if out_path is None:
+        out_path = blockmap_path(image_path)
+
+    size = os.path.getsize(image_path)
+    # Cada segmento debe ser múltiplo del tamaño de bloque
+    segment = max(block_size, SEGMENT_SIZE // block_size * block_size)
+    tasks = [(image_path, off, min(segment, size - off), block_size, digest_size)
+             for off in range(0, size, segment)]
+
+    with open(out_path, "wb") as out:
+        out.write(HEADER.pack(BLOCKMAP_MAGIC, block_size, digest_size, size))
+        if workers == 1 or len(tasks) <= 1:
+            for t in tasks:
+                out.write(_hash_segment(t))
+        else:
+            # El límite de lectura se reparte entre los procesos del pool
+            throttle = get_default_throttle()
+            if throttle is not None:
+                throttle = throttle.split(workers or os.cpu_count() or 1)
+            with Pool(workers, initializer=set_default_throttle, initargs=(throttle,)) as pool:
+                for digests in pool.imap(_hash_segment, tasks):
+                    out.write(digests)
+
+    return out_path
+
+
+def read_blockmap_header(map_path):
+    """
+    Lee la cabecera de un block map.
+    Retorna un dict: block_size, digest_size, image_size, blocks.
+    """
+    with open(map_path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError("blockmap too small")
+
+    magic, block_size, digest_size, image_size = HEADER.unpack(raw)
+    if magic != BLOCKMAP_MAGIC:
+        raise ValueError("not a blockmap file")
+
+    return {
+        "block_size": block_size,
+        "digest_size": digest_size,
+        "image_size": image_size,
+        "blocks": -(-image_size // block_size)
+    }
+
+
+# ------------------------------------------------------------
+# Comparación de mapas
+# ------------------------------------------------------------
+def diff_blockmaps(old_map, new_map):
+    """
+    Compara dos block maps y devuelve los bloques modificados como
+    tramos [(bloque_inicial, cantidad), ...] del mapa NUEVO.
+
+    Los bloques que no existían en la imagen anterior cuentan como
+    modificados. Ambos mapas deben usar el mismo block_size y digest_size.
+
+    La comparación es jerárquica: primero se comparan grupos de
+    COMPARE_GROUP digests de una vez y solo se baja al nivel de
+    bloque en los grupos que difieren.
+    """
+    old_h = read_blockmap_header(old_map)
+    new_h = read_blockmap_header(new_map)
+
+    if (old_h["block_size"], old_h["digest_size"]) != (new_h["block_size"], new_h["digest_size"]):
+        raise ValueError("blockmaps use different block or digest sizes")
+
+    ds = new_h["digest_size"]
+    total = new_h["blocks"]
+    group_bytes = COMPARE_GROUP * ds
+
+    ranges = []
+
+    def mark(block):
+        if ranges and ranges[-1][0] + ranges[-1][1] == block:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + 1)
+        else:
+            ranges.append((block, 1))
+
+    with open(old_map, "rb") as fo, open(new_map, "rb") as fn:
+        fo.seek(HEADER.size)
+        fn.seek(HEADER.size)
+
+        block = 0
+        while block < total:
+            a = fo.read(group_bytes)
+            b = fn.read(group_bytes)
+            if not b:
+                break
+            if a != b:
+                n = len(b) // ds
+                for i in range(n):
+                    if a[i * ds:(i + 1) * ds] != b[i * ds:(i + 1) * ds]:
+                        mark(block + i)
+            block += len(b) // ds
+
+    return ranges
+
+
+def blocks_to_byte_ranges(ranges, block_size, image_size=None):
+    """
+    Convierte tramos de bloques en tramos de bytes [(offset, longitud), ...].
+    """
+    out = []
+    for start, count in ranges:
+        offset = start * block_size
+        length = count * block_size
+        if image_size is not None:
+            length = min(length, image_size - offset)
+        if length > 0:
+            out.append((offset, length))
+    return out
+
+
+# ------------------------------------------------------------
+# Inodos afectados por los cambios
+# ------------------------------------------------------------
+def changed_inode_spans(sb, gds, byte_ranges):
+    """
+    Cruza los tramos de bytes modificados con las tablas de inodos.
+
+    Ordena ambos (tablas por posición, tramos por offset) y los recorre
+    en paralelo (merge), así el coste es O(grupos + tramos) y no su
+    producto. Retorna [(grupo, primer_índice, último_índice), ...] con
+    los índices de inodo (0-based dentro del grupo) afectados, ordenado
+    y sin solapes.
+    """
+    block_size = sb["s_block_size"]
+    inode_size = sb["s_inode_size"]
+    table_size = sb["s_inodes_per_group"] * inode_size
+
+    tables = sorted((gd["bg_inode_table"] * block_size, g) for g, gd in enumerate(gds))
+    ranges = []
+    for start, end in sorted((off, off + length) for off, length in byte_ranges if length > 0):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(end, ranges[-1][1]))
+        else:
+            ranges.append((start, end))
+
+    spans = []
+    t = r = 0
+    while t < len(tables) and r < len(ranges):
+        t_start, g = tables[t]
+        t_end = t_start + table_size
+        lo = max(ranges[r][0], t_start)
+        hi = min(ranges[r][1], t_end)
+        if lo < hi:
+            spans.append((g, (lo - t_start) // inode_size, (hi - 1 - t_start) // inode_size))
+        # Avanza el que termina antes (el otro puede solapar con el siguiente)
+        if ranges[r][1] <= t_end:
+            r += 1
+        else:
+            t += 1
+
+    # Unir spans solapados o contiguos del mismo grupo
+    merged = []
+    for g, first, last in sorted(spans):
+        if merged and merged[-1][0] == g and first <= merged[-1][2] + 1:
+            merged[-1] = (g, merged[-1][1], max(last, merged[-1][2]))
+        else:
+            merged.append((g, first, last))
+    return merged
+
+
+def inodes_in_ranges(image_path, byte_ranges, sb=None, gds=None):
+    """
+    Devuelve los números de inodo cuya entrada en la tabla de inodos
+    cae dentro de los tramos de bytes modificados.
+    """
+    if sb is None:
+        sb = read_superblock(image_path)
+    if gds is None:
+        gds = read_group_descriptors(image_path, sb)
+
+    ipg = sb["s_inodes_per_group"]
+    inodes = []
+    for g, first, last in changed_inode_spans(sb, gds, byte_ranges):
+        inodes.extend(g * ipg + i + 1 for i in range(first, last + 1))
+    return [i for i in inodes if i <= sb["s_inodes_count"]]
+
+
+def read_changed_inodes(image_path, byte_ranges):
+    """
+    Parsea solo los inodos afectados por los tramos modificados.
+    Cada tramo de la tabla de inodos que cambió se lee con UNA lectura.
+    """
+    sb = read_superblock(image_path)
+    block_size = sb["s_block_size"]
+    inode_size = sb["s_inode_size"]
+    ipg = sb["s_inodes_per_group"]
+    gds = read_group_descriptors(image_path, sb)
+
+    results = []
+    with DiskImage(image_path).open(sequential=False, drop_cache=False) as f:
+        for g, first, last in changed_inode_spans(sb, gds, byte_ranges):
+            f.seek(gds[g]["bg_inode_table"] * block_size + first * inode_size)
+            data = f.read((last - first + 1) * inode_size)
+            for i in range(first, last + 1):
+                inode_num = g * ipg + i + 1
+                if inode_num > sb["s_inodes_count"]:
+                    break
+                raw = data[(i - first) * inode_size:(i - first + 1) * inode_size]
+                # Inodos nunca usados (i_mode = 0): nada que reportar
+                if len(raw) < inode_size or raw[:2] == b"\0\0":
+                    continue
+                inode = {"inode_num": inode_num}
+                inode.update(parse_inode_bytes(raw, inode_size))
+                results.append(inode)
+    return results
@@ -0,0 +1,385 @@
+# src/checksums.py
+import os, struct
+from multiprocessing import Pool
+from .img_reader import DiskImage, get_default_throttle, set_default_throttle
+from .ext4_parser import read_superblock, group_descriptor_size, group_count, \
+    read_gdt_bytes, \
+    RO_COMPAT_METADATA_CSUM, RO_COMPAT_GDT_CSUM, INCOMPAT_CSUM_SEED, BG_INODE_UNINIT, BG_BLOCK_UNINIT, \
+    EXT4_EXTENTS_FL, EXT4_EXTENT_MAGIC
+
+# ------------------------------------------------------------
+# Verificación de checksums de metadatos (metadata_csum)
+#
+# Con la feature metadata_csum, EXT4 guarda un CRC32C en:
+#   - el superblock          (s_checksum, sobre los 1020 bytes previos)
+#   - cada descriptor        (16 bits: semilla + nº de grupo + descriptor)
+#   - los bitmaps            (en el descriptor: 16 o 32 bits)
+#   - cada inodo             (semilla + nº de inodo + i_generation + inodo)
+#   - los bloques de extents (cola de 4 bytes tras las eh_max entradas)
+#
+# Un checksum correcto distingue los metadatos vivos de los dañados o
+# de copias viejas que no pertenecen a esa posición: por eso sirve
+# también para filtrar inodos "carveados" (p. ej. del journal).
+#
+# El CRC32C está implementado en Python puro con tablas slicing-by-8
+# (8 bytes por iteración). Las tablas de inodos se desempaquetan en
+# palabras de 64 bits bloque a bloque, con un único struct.unpack por
+# bloque de la tabla, y los grupos se verifican en paralelo.
+#
+# Convención de ext4: registro inicial ~0 y SIN inversión final.
+# ------------------------------------------------------------
+CRC32C_POLY = 0x82F63B78         # Castagnoli, forma reflejada
+CRC32C_INIT = 0xFFFFFFFF
+CSUM_TYPE_CRC32C = 1
+
+SB_CHECKSUM_OFFSET = 0x3FC
+GD_CHECKSUM_OFFSET = 0x1E
+INODE_CSUM_LO_WORD = 0x7C // 8   # l_i_checksum_lo: bytes 4-5 de la palabra 15
+INODE_CSUM_HI_WORD = 0x82 // 8   # i_checksum_hi: bytes 2-3 de la palabra 16
+EXTENT_HEADER_SIZE = 12
+EXTENT_DEPTH_LIMIT = 8
+
+
+def _crc32c_tables():
+    # T0 es la tabla clásica byte a byte; Tk[i] = CRC de i seguido de k ceros
+    t0 = []
+    for i in range(256):
+        c = i
+        for _ in range(8):
+            c = (c >> 1) ^ (CRC32C_POLY if c & 1 else 0)
+        t0.append(c)
+    tables = [t0]
+    for _ in range(7):
+        tables.append([(c >> 8) ^ t0[c & 0xFF] for c in tables[-1]])
+    return tuple(tables)
+
+
+CRC32C_TABLES = _crc32c_tables()
+
+
+def _crc32c_words(crc, words):
+    """
+    Slicing-by-8: procesa palabras de 64 bits little-endian (8 bytes
+    de datos cada una) con 8 consultas de tabla por palabra.
+    """
+    t0, t1, t2, t3, t4, t5, t6, t7 = CRC32C_TABLES
+    for w in words:
+        x = crc ^ w
+        crc = (t7[x & 0xFF] ^ t6[(x >> 8) & 0xFF] ^ t5[(x >> 16) & 0xFF]
+               ^ t4[(x >> 24) & 0xFF] ^ t3[(x >> 32) & 0xFF] ^ t2[(x >> 40) & 0xFF]
+               ^ t1[(x >> 48) & 0xFF] ^ t0[x >> 56])
+    return crc
+
+
+def crc32c(data, crc=CRC32C_INIT):
+    """
+    CRC32C de data partiendo del registro crc (convención ext4: sin
+    inversión final). Para el CRC32C "estándar": crc32c(data) ^ 0xFFFFFFFF.
+    """
+    n = len(data) // 8
+    if n:
+        crc = _crc32c_words(crc, struct.unpack_from(f"<{n}Q", data))
+    t0 = CRC32C_TABLES[0]
+    for b in bytes(data[n * 8:]):
+        crc = t0[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+# ------------------------------------------------------------
+# Semilla y comprobaciones individuales
+# ------------------------------------------------------------
+def metadata_csum_enabled(sb):
+    """
+    True si el sistema de archivos usa metadata_csum con crc32c.
+    """
+    return bool(sb.get("s_feature_ro_compat", 0) & RO_COMPAT_METADATA_CSUM) \
+        and sb.get("s_checksum_type") == CSUM_TYPE_CRC32C
+
+
+def csum_seed(sb):
+    """
+    Semilla de todos los checksums: s_checksum_seed si la feature
+    csum_seed está activa (el UUID se cambió sin recalcular), o el
+    CRC32C del UUID. Retorna None si el FS no usa metadata_csum.
+    """
+    if not metadata_csum_enabled(sb):
+        return None
+    if sb.get("s_feature_incompat", 0) & INCOMPAT_CSUM_SEED:
+        return sb["s_checksum_seed"]
+    return crc32c(bytes.fromhex(sb["s_uuid"]))
+
+
+def superblock_checksum_ok(raw):
+    """
+    Verifica el checksum de los 1024 bytes de un superblock.
+    """
+    stored = struct.unpack_from("<I", raw, SB_CHECKSUM_OFFSET)[0]
+    return crc32c(raw[:SB_CHECKSUM_OFFSET]) == stored
+
+
+def group_descriptor_checksum_ok(desc, group, seed):
+    """
+    Verifica bg_checksum (16 bits bajos del CRC32C de semilla + número
+    de grupo + descriptor con el propio campo a cero).
+    """
+    stored = struct.unpack_from("<H", desc, GD_CHECKSUM_OFFSET)[0]
+    crc = crc32c(struct.pack("<I", group), seed)
+    crc = crc32c(bytes(desc[:GD_CHECKSUM_OFFSET]) + b"\0\0" + bytes(desc[GD_CHECKSUM_OFFSET + 2:]), crc)
+    return crc & 0xFFFF == stored
+
+
+def bitmap_checksums(desc):
+    """
+    Checksums guardados de los bitmaps en un descriptor:
+    (bloques, inodos, bits). Con descriptores de 32 bytes solo existe
+    la mitad baja (16 bits).
+    """
+    block_lo, inode_lo = struct.unpack_from("<HH", desc, 0x18)
+    if len(desc) >= 0x3C:
+        block_hi, inode_hi = struct.unpack_from("<HH", desc, 0x38)
+        return block_lo | block_hi << 16, inode_lo | inode_hi << 16, 32
+    return block_lo, inode_lo, 16
+
+
+def _inode_words_checksum_ok(words, inode_num, seed):
+    """
+    Checksum de un inodo dado como tupla de palabras de 64 bits.
+
+    Cubre: nº de inodo (le32) + i_generation (le32) + inodo completo
+    con l_i_checksum_lo e i_checksum_hi a cero. i_checksum_hi solo
+    existe si i_extra_isize lo alcanza; si no, el checksum es de 16 bits.
+    """
+    w15 = words[INODE_CSUM_LO_WORD]
+    stored = (w15 >> 32) & 0xFFFF
+    body = list(words)
+    body[INODE_CSUM_LO_WORD] = w15 & ~(0xFFFF << 32)
+
+    has_hi = len(words) > 16 and (words[16] & 0xFFFF) >= 4
+    if has_hi:
+        stored |= ((words[INODE_CSUM_HI_WORD] >> 16) & 0xFFFF) << 16
+        body[INODE_CSUM_HI_WORD] &= ~(0xFFFF << 16)
+
+    # nº de inodo + i_generation (offset 0x64) forman una palabra
+    crc = _crc32c_words(seed, [inode_num | (words[12] >> 32) << 32])
+    crc = _crc32c_words(crc, body)
+    return (crc if has_hi else crc & 0xFFFF) == stored
+
+
+def inode_checksum_ok(raw, inode_num, seed):
+    """
+    Verifica el checksum de los bytes crudos de un inodo.
+
+    Pensado para filtrar candidatos (copias del journal, inodos
+    carveados): una copia solo pasa si es exactamente el inodo
+    inode_num tal como lo escribió el kernel. Un inodo todo a ceros
+    se considera válido (nunca se usó).
+    """
+    if len(raw) < 128 or len(raw) % 8:
+        return False
+    words = struct.unpack_from(f"<{len(raw) // 8}Q", raw)
+    if not any(words):
+        return True
+    return _inode_words_checksum_ok(words, inode_num, seed)
+
+
+def inode_seed(seed, inode_num, generation):
+    """
+    Semilla por inodo (usada por los bloques de extents).
+    """
+    return _crc32c_words(seed, [inode_num | generation << 32])
+
+
+def extent_block_checksum_ok(block, seed_inode):
+    """
+    Verifica la cola (ext4_extent_tail) de un bloque del árbol de
+    extents: CRC32C de la cabecera y las eh_max entradas.
+    """
+    magic, _entries, eh_max, _depth = struct.unpack_from("<HHHH", block, 0)
+    tail = EXTENT_HEADER_SIZE + eh_max * 12
+    if magic != EXT4_EXTENT_MAGIC or tail + 4 > len(block):
+        return False
+    return crc32c(block[:tail], seed_inode) == struct.unpack_from("<I", block, tail)[0]
+
+
+# ------------------------------------------------------------
+# Verificación por grupo (tarea del pool)
+# ------------------------------------------------------------
+_worker_ctx = None
+
+
+def _init_worker(image_path, sb, gdt, throttle=None):
+    # Cada proceso recibe el superblock y la GDT cruda una sola vez
+    global _worker_ctx
+    _worker_ctx = {"path": image_path, "sb": sb, "gdt": gdt,
+                   "seed": csum_seed(sb), "desc_size": group_descriptor_size(sb)}
+    if throttle is not None:
+        set_default_throttle(throttle)
+
+
+def _extent_blocks(d, i_block, block_size, seed_inode, depth_limit=EXTENT_DEPTH_LIMIT):
+    """
+    Recorre los nodos internos del árbol de extents de un inodo.
+    Genera (bloque, checksum_ok) por cada bloque del árbol (la raíz
+    vive en i_block y no lleva checksum).
+    """
+    magic, entries, _max, depth = struct.unpack_from("<HHHH", i_block, 0)
+    if magic != EXT4_EXTENT_MAGIC or depth == 0 or depth_limit <= 0:
+        return
+    for i in range(entries):
+        _ei_block, leaf_lo, leaf_hi = struct.unpack_from("<IIH", i_block, EXTENT_HEADER_SIZE + i * 12)
+        child = (leaf_hi << 32) | leaf_lo
+        data = d.read(child * block_size, block_size)
+        ok = len(data) == block_size and extent_block_checksum_ok(data, seed_inode)
+        yield child, ok
+        if ok:
+            yield from _extent_blocks(d, data, block_size, seed_inode, depth_limit - 1)
+
+
+def _verify_group(g):
+    """
+    Verifica descriptor, bitmaps, inodos y bloques de extents de un grupo.
+    """
+    ctx = _worker_ctx
+    sb, seed, desc_size = ctx["sb"], ctx["seed"], ctx["desc_size"]
+    block_size = sb["s_block_size"]
+    inode_size = sb["s_inode_size"]
+    ipg = sb["s_inodes_per_group"]
+    desc = ctx["gdt"][g * desc_size:(g + 1) * desc_size]
+
+    bg_block_bitmap, bg_inode_bitmap, bg_inode_table = struct.unpack_from("<III", desc, 0)
+    bg_flags, = struct.unpack_from("<H", desc, 0x12)
+    itable_unused, = struct.unpack_from("<H", desc, 0x1C)
+    if desc_size >= 64:
+        hi = struct.unpack_from("<III", desc, 0x20)
+        bg_block_bitmap |= hi[0] << 32
+        bg_inode_bitmap |= hi[1] << 32
+        bg_inode_table |= hi[2] << 32
+        itable_unused |= struct.unpack_from("<H", desc, 0x32)[0] << 16
+
+    report = {"group": g, "descriptor": group_descriptor_checksum_ok(desc, g, seed),
+              "block_bitmap": None, "inode_bitmap": None,
+              "inodes_checked": 0, "bad_inodes": [],
+              "extent_blocks_checked": 0, "bad_extent_blocks": []}
+
+    block_csum, inode_csum, bits = bitmap_checksums(desc)
+    mask = (1 << bits) - 1
+    d = DiskImage(ctx["path"])
+
+    # --- Bitmaps (los grupos *_UNINIT no tienen bitmap en disco) ---
+    if not bg_flags & BG_BLOCK_UNINIT:
+        bitmap = d.read(bg_block_bitmap * block_size, sb["s_blocks_per_group"] // 8)
+        report["block_bitmap"] = crc32c(bitmap, seed) & mask == block_csum
+    if bg_flags & BG_INODE_UNINIT:
+        return report
+    ibitmap = d.read(bg_inode_bitmap * block_size, ipg // 8)
+    report["inode_bitmap"] = crc32c(ibitmap, seed) & mask == inode_csum
+
+    # --- Inodos: solo la parte inicializada de la tabla ---
+    used = max(0, min(ipg - itable_unused, sb["s_inodes_count"] - g * ipg))
+    per_block = block_size // inode_size
+    words_per_inode = inode_size // 8
+    first_inode = g * ipg + 1
+
+    with d.open() as f:
+        f.seek(bg_inode_table * block_size)
+        for start in range(0, used, per_block):
+            table_block = f.read(block_size)
+            want = min(per_block, used - start)
+            n = min(want, len(table_block) // inode_size)
+            # Un único unpack por bloque de la tabla de inodos
+            words = struct.unpack_from(f"<{n * words_per_inode}Q", table_block)
+            for i in range(n):
+                w = words[i * words_per_inode:(i + 1) * words_per_inode]
+                if not any(w):
+                    continue
+                idx = start + i
+                inode_num = first_inode + idx
+                report["inodes_checked"] += 1
+                if not _inode_words_checksum_ok(w, inode_num, seed):
+                    report["bad_inodes"].append(inode_num)
+                    continue
+
+                # Árbol de extents de los inodos en uso (según el bitmap)
+                flags = w[4] & 0xFFFFFFFF
+                in_use = ibitmap[idx >> 3] & (1 << (idx & 7)) if idx >> 3 < len(ibitmap) else 0
+                if in_use and flags & EXT4_EXTENTS_FL:
+                    i_block = table_block[i * inode_size + 40:i * inode_size + 100]
+                    seed_inode = inode_seed(seed, inode_num, w[12] >> 32)
+                    for block, ok in _extent_blocks(d, i_block, block_size, seed_inode):
+                        report["extent_blocks_checked"] += 1
+                        if not ok:
+                            report["bad_extent_blocks"].append([inode_num, block])
+            if n < want:            # imagen truncada
+                break
+    return report
+
+
+def verify_metadata(image_path, sb=None, workers=None, groups=None):
+    """
+    Verifica en bloque todos los checksums de metadatos del FS.
+
+    Parámetros:
+      image_path : ruta a la imagen
+      sb         : superblock ya leído (por defecto read_superblock())
+      workers    : procesos del pool (por defecto, todos los CPUs)
+      groups     : lista de grupos a verificar (por defecto, todos)
+
+    Retorna un dict con:
+      - superblock : True/False (checksum de la copia usada)
+      - groups     : un informe por grupo (descriptor, block_bitmap,
+                     inode_bitmap → True/False/None si no hay bitmap;
+                     inodes_checked, bad_inodes, extent_blocks_checked,
+                     bad_extent_blocks → [[inodo, bloque], ...])
+      - summary    : totales de todo lo verificado
+
+    Lanza ValueError si el FS no usa metadata_csum (crc32c).
+    """
+    if sb is None:
+        sb = read_superblock(image_path)
+    if not metadata_csum_enabled(sb):
+        if sb.get("s_feature_ro_compat", 0) & RO_COMPAT_GDT_CSUM:
+            raise ValueError("filesystem does not use metadata_csum (only gdt_csum)")
+        raise ValueError("filesystem does not use metadata_csum")
+
+    d = DiskImage(image_path)
+    raw_sb = d.read(sb.get("s_offset", 1024), 1024)
+    desc_size = group_descriptor_size(sb)
+    n_groups = group_count(sb)
+    gdt = read_gdt_bytes(d, sb)
+    if len(gdt) < n_groups * desc_size:
+        raise ValueError("group descriptor table truncated")
+
+    tasks = list(range(n_groups)) if groups is None else list(groups)
+
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(image_path, sb, gdt)
+        reports = [_verify_group(g) for g in tasks]
+    else:
+        # El límite de lectura se reparte entre los procesos del pool
+        throttle = get_default_throttle()
+        if throttle is not None:
+            throttle = throttle.split(workers or os.cpu_count() or 1)
+        with Pool(workers, initializer=_init_worker,
+                  initargs=(image_path, sb, gdt, throttle)) as pool:
+            reports = pool.map(_verify_group, tasks)
+
+    summary = {
+        "groups": len(reports),
+        "bad_groups": sum(1 for r in reports if not group_ok(r)),
+        "bad_descriptors": sum(1 for r in reports if not r["descriptor"]),
+        "bad_bitmaps": sum((r["block_bitmap"] is False) + (r["inode_bitmap"] is False) for r in reports),
+        "inodes_checked": sum(r["inodes_checked"] for r in reports),
+        "bad_inodes": sum(len(r["bad_inodes"]) for r in reports),
+        "extent_blocks_checked": sum(r["extent_blocks_checked"] for r in reports),
+        "bad_extent_blocks": sum(len(r["bad_extent_blocks"]) for r in reports)
+    }
+    return {"superblock": superblock_checksum_ok(raw_sb), "groups": reports, "summary": summary}
+
+
+def group_ok(report):
+    """
+    True si todos los checksums verificados de un grupo son correctos.
+    """
+    return (report["descriptor"] and report["block_bitmap"] is not False
+            and report["inode_bitmap"] is not False
+            and not report["bad_inodes"] and not report["bad_extent_blocks"])
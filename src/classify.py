@@ -0,0 +1,342 @@
+# src/classify.py
+import os, re, math, struct
+from collections import Counter
+from multiprocessing import Pool
+from .img_reader import DiskImage, get_default_throttle, set_default_throttle
+
+# ------------------------------------------------------------
+# Mapa de clases por bloque ("class map")
+#
+# Cada bloque de la imagen se clasifica según estadísticas baratas
+# de su contenido:
+#   - todo ceros / un único byte repetido
+#   - proporción de caracteres imprimibles (texto)
+#   - entropía de Shannon por byte (0..8 bits)
+#
+# El resultado ocupa 1 byte por bloque (256 KB por GB a 4K) y sirve
+# para priorizar el carving: los escáneres pueden saltarse las zonas
+# vacías o cifradas, y el analista puede ver un mapa de calor de la
+# distribución del contenido.
+#
+# Formato del archivo (<imagen>.classmap):
+#   cabecera: magic(8) | block_size(u32) | image_size(u64)
+#   cuerpo  : 1 byte (clase) por bloque, en orden
+# ------------------------------------------------------------
+CLASSMAP_MAGIC = b"BLKCLS1\0"
+HEADER = struct.Struct("<8sIQ")
+
+DEFAULT_BLOCK_SIZE = 4096
+SEGMENT_SIZE = 64 * 1024 * 1024     # bytes que clasifica cada tarea del pool
+
+# Clases (valor del byte en el mapa)
+CLASS_ZERO = 0           # todo ceros
+CLASS_UNIFORM = 1        # un único byte repetido (0xFF, relleno...)
+CLASS_LOW_ENTROPY = 2    # estructuras dispersas, tablas, metadatos
+CLASS_TEXT = 3           # texto ASCII/UTF-8 mayormente imprimible
+CLASS_BINARY = 4         # binario "normal" (ejecutables, documentos)
+CLASS_HIGH_ENTROPY = 5   # comprimido o cifrado
+
+CLASS_NAMES = ("zero", "uniform", "low-entropy", "text", "binary", "high-entropy")
+HEATMAP_CHARS = " .-t#@"
+
+# Umbrales de clasificación
+TEXT_MIN_PRINTABLE = 0.95
+LOW_ENTROPY_MAX = 3.0
+HIGH_ENTROPY_MIN = 7.5
+
+# Bytes imprimibles: ASCII 0x20-0x7E, tab, CR, LF y los bytes >= 0x80 de UTF-8
+PRINTABLE = bytes(range(0x20, 0x7F)) + b"\t\r\n" + bytes(range(0x80, 0x100))
+# Tabla de translate: imprimible → 0, no imprimible → 1
+NONPRINTABLE_TABLE = bytes(0 if b in PRINTABLE else 1 for b in range(256))
+
+# Por defecto los escáneres solo se saltan los bloques sin información
+DEFAULT_SKIP = (CLASS_ZERO, CLASS_UNIFORM)
+
+
+def classmap_path(image_path):
+    """
+    Ruta por defecto del class map: junto a la imagen.
+    """
+    return image_path + ".classmap"
+
+
+def parse_classes(text):
+    """
+    Convierte "zero,high-entropy" en la tupla de clases correspondiente.
+    """
+    classes = []
+    for name in text.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in CLASS_NAMES:
+            raise ValueError(f"unknown block class: {name}")
+        classes.append(CLASS_NAMES.index(name))
+    return tuple(classes)
+
+
+# ------------------------------------------------------------
+# Estadísticas de un bloque
+# ------------------------------------------------------------
+def _xlogx_table(n):
+    # c * log2(c) precalculado para cada recuento posible
+    return [0.0] + [c * math.log2(c) for c in range(1, n + 1)]
+
+
+def block_entropy(data, xlogx=None):
+    """
+    Entropía de Shannon por byte (bits): H = log2(n) - Σ c·log2(c) / n
+    """
+    n = len(data)
+    if n == 0:
+        return 0.0
+    if xlogx is None or len(xlogx) <= n:
+        xlogx = _xlogx_table(n)
+    return math.log2(n) - sum(map(xlogx.__getitem__, Counter(data).values())) / n
+
+
+def classify_block(data, xlogx=None):
+    """
+    Clasifica un bloque. Las comprobaciones van de la más barata a la
+    más cara: la entropía (histograma de bytes) solo se calcula para
+    los bloques que no son vacíos ni texto.
+    """
+    n = len(data)
+    if data.count(0) == n:
+        return CLASS_ZERO
+    if data.count(data[:1]) == n:
+        return CLASS_UNIFORM
+
+    # Bytes no imprimibles = los que quedan al borrar los imprimibles
+    printable = 1 - len(data.translate(None, PRINTABLE)) / n
+    if printable >= TEXT_MIN_PRINTABLE:
+        return CLASS_TEXT
+
+    return _entropy_class(data, xlogx)
+
+
+def _entropy_class(data, xlogx):
+    # Última comprobación: clase según la entropía del bloque
+    entropy = block_entropy(data, xlogx)
+    if entropy < LOW_ENTROPY_MAX:
+        return CLASS_LOW_ENTROPY
+    if entropy >= HIGH_ENTROPY_MIN:
+        return CLASS_HIGH_ENTROPY
+    return CLASS_BINARY
+
+
+# ------------------------------------------------------------
+# Construcción (en paralelo)
+# ------------------------------------------------------------
+def classify_blocks(data, block_size, xlogx=None):
+    """
+    Clasifica todos los bloques de un trozo de la imagen; equivale a
+    classify_block() bloque a bloque, pero las estadísticas baratas se
+    calculan sobre el trozo completo:
+      - un trozo todo ceros se resuelve con un único count
+      - el translate a imprimible/no imprimible se hace una sola vez y
+        cada bloque solo cuenta sus no imprimibles (count con rango)
+      - ceros y byte repetido también usan count con rango, sin copiar
+    Solo los bloques que quedan sin resolver pasan por el histograma
+    (Counter, el recuento de bytes más rápido de la biblioteca estándar).
+
+    Retorna un byte de clase por bloque.
+    """
+    n = len(data)
+    if data.count(0) == n:
+        return bytes(-(-n // block_size))
+    if xlogx is None:
+        xlogx = _xlogx_table(block_size)
+
+    nonprintable = data.translate(NONPRINTABLE_TABLE)
+    out = bytearray()
+    for pos in range(0, n, block_size):
+        end = min(pos + block_size, n)
+        size = end - pos
+        if data.count(0, pos, end) == size:
+            out.append(CLASS_ZERO)
+        elif data.count(data[pos:pos + 1], pos, end) == size:
+            out.append(CLASS_UNIFORM)
+        elif 1 - nonprintable.count(1, pos, end) / size >= TEXT_MIN_PRINTABLE:
+            out.append(CLASS_TEXT)
+        else:
+            out.append(_entropy_class(data[pos:end], xlogx))
+    return bytes(out)
+
+
+def _classify_segment(task):
+    """
+    Tarea del pool: clasifica los bloques de un segmento de la imagen.
+    Retorna un byte de clase por bloque.
+    """
+    image_path, offset, length, block_size = task
+    with DiskImage(image_path).open() as f:
+        f.seek(offset)
+        data = f.read(length)
+    return classify_blocks(data, block_size)
+
+
+def build_classmap(image_path, out_path=None, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Clasifica todos los bloques de la imagen y guarda el class map.
+
+    Parámetros:
+      image_path : ruta a la imagen
+      out_path   : destino (por defecto <imagen>.classmap)
+      block_size : tamaño del bloque clasificado
+      workers    : procesos del pool (por defecto, todos los CPUs)
+
+    Retorna un dict con: path, blocks y counts ({clase: bloques}).
+    """
+    if out_path is None:
+        out_path = classmap_path(image_path)
+
+    size = os.path.getsize(image_path)
+    segment = max(block_size, SEGMENT_SIZE // block_size * block_size)
+    tasks = [(image_path, off, min(segment, size - off), block_size)
+             for off in range(0, size, segment)]
+
+    counts = [0] * len(CLASS_NAMES)
+
+    def write(out, classes):
+        out.write(classes)
+        for c in range(len(CLASS_NAMES)):
+            counts[c] += classes.count(c)
+
+    with open(out_path, "wb") as out:
+        out.write(HEADER.pack(CLASSMAP_MAGIC, block_size, size))
+        if workers == 1 or len(tasks) <= 1:
+            for t in tasks:
+                write(out, _classify_segment(t))
+        else:
+            # El límite de lectura se reparte entre los procesos del pool
+            throttle = get_default_throttle()
+            if throttle is not None:
+                throttle = throttle.split(workers or os.cpu_count() or 1)
+            with Pool(workers, initializer=set_default_throttle, initargs=(throttle,)) as pool:
+                for classes in pool.imap(_classify_segment, tasks):
+                    write(out, classes)
+
+    return {
+        "path": out_path,
+        "blocks": sum(counts),
+        "counts": {CLASS_NAMES[c]: n for c, n in enumerate(counts)}
+    }
+
+
+def read_classmap_header(map_path):
+    """
+    Lee la cabecera de un class map.
+    Retorna un dict: block_size, image_size, blocks.
+    """
+    with open(map_path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError("classmap too small")
+
+    magic, block_size, image_size = HEADER.unpack(raw)
+    if magic != CLASSMAP_MAGIC:
+        raise ValueError("not a classmap file")
+
+    return {
+        "block_size": block_size,
+        "image_size": image_size,
+        "blocks": -(-image_size // block_size)
+    }
+
+
+def _iter_classes(map_path, chunk=1024 * 1024):
+    # Recorre el cuerpo del mapa por trozos: (primer_bloque, bytes)
+    with open(map_path, "rb") as f:
+        f.seek(HEADER.size)
+        block = 0
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            yield block, data
+            block += len(data)
+
+
+# ------------------------------------------------------------
+# Uso del mapa
+# ------------------------------------------------------------
+def classmap_ranges(map_path, skip_classes=DEFAULT_SKIP):
+    """
+    Devuelve los tramos de bytes [(offset, longitud), ...] cuyos bloques
+    NO pertenecen a skip_classes, listos para scan_for_signatures(ranges=...).
+    """
+    h = read_classmap_header(map_path)
+    bs = h["block_size"]
+
+    # Cada clase se traduce a 0 (saltar) o 1 (escanear) y los tramos de
+    # unos se buscan con una regex: todo el trabajo por bloque queda en C
+    keep = bytes(0 if c in skip_classes else 1 for c in range(256))
+    ranges = []
+    for first, data in _iter_classes(map_path):
+        for m in re.finditer(rb"\x01+", data.translate(keep)):
+            offset = (first + m.start()) * bs
+            length = min((m.end() - m.start()) * bs, h["image_size"] - offset)
+            # Unir con el tramo anterior si el trozo del mapa lo partió
+            if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((offset, length))
+    return ranges
+
+
+def intersect_ranges(a, b):
+    """
+    Intersección de dos listas ordenadas de tramos (offset, longitud).
+    """
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        lo = max(a[i][0], b[j][0])
+        hi = min(a[i][0] + a[i][1], b[j][0] + b[j][1])
+        if lo < hi:
+            out.append((lo, hi - lo))
+        if a[i][0] + a[i][1] < b[j][0] + b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+def classmap_summary(map_path):
+    """
+    Cuenta los bloques de cada clase. Retorna {nombre_clase: bloques}.
+    """
+    counts = [0] * len(CLASS_NAMES)
+    for _first, data in _iter_classes(map_path):
+        for c in range(len(CLASS_NAMES)):
+            counts[c] += data.count(c)
+    return {CLASS_NAMES[c]: n for c, n in enumerate(counts)}
+
+
+def render_heatmap(map_path, width=64, rows=32):
+    """
+    Dibuja el mapa como texto: cada celda cubre un tramo de bloques y
+    muestra la clase más frecuente en él (leyenda en HEATMAP_CHARS).
+
+    Retorna una lista de líneas "offset |celdas|".
+    """
+    h = read_classmap_header(map_path)
+    cells = width * rows
+    per_cell = max(1, -(-h["blocks"] // cells))
+
+    with open(map_path, "rb") as f:
+        f.seek(HEADER.size)
+        chars = []
+        while True:
+            data = f.read(per_cell)
+            if not data:
+                break
+            dominant = max(range(len(CLASS_NAMES)), key=data.count)
+            chars.append(HEATMAP_CHARS[dominant])
+
+    lines = []
+    for row in range(0, len(chars), width):
+        offset = row * per_cell * h["block_size"]
+        lines.append(f"{offset:>14} |{''.join(chars[row:row + width]).ljust(width)}|")
+    return lines
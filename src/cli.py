@@ -1,7 +1,19 @@
-import argparse, json, os
+import argparse, json, os, sys
 from .unallocated_scanner import scan_for_signatures
-from .reconstructor import extract_from_offset
-from .ext4_parser import parse_superblock
+from .img_reader import ReadThrottle, set_default_throttle
+from .reconstructor import extract_from_offset, extract_batch, extract_reassembled
+from .sinks import open_sink
+from .blockmap import build_blockmap, blockmap_path, read_blockmap_header, \
+    diff_blockmaps, blocks_to_byte_ranges, read_changed_inodes
+from .sector_hash import build_reference_index, match_image
+from .keyword_search import search_image, ENCODINGS
+from .ext4_parser import read_superblock, find_backup_superblock
+from .journal import build_journal_index, read_inode_versions
+from .timeline import write_timeline
+from .recover_deleted import recover_deleted
+from .classify import build_classmap, render_heatmap, parse_classes, HEATMAP_CHARS, CLASS_NAMES, \
+    classmap_path, read_classmap_header, classmap_summary
+from .checksums import verify_metadata, group_ok
 
 # ------------------------------------------------------------
 # Comando: SCAN
@@ -11,8 +23,10 @@ from .ext4_parser import parse_superblock
 def cmd_scan(args):
     print(f"Scanning image: {args.image}")
 
-    # Ejecuta el escáner de firmas contra la imagen
-    results = scan_for_signatures(args.image)
+    # Ejecuta el escáner de firmas contra la imagen (opcionalmente
+    # saltando las clases de bloque indicadas según el class map)
+    results = scan_for_signatures(args.image, class_map=args.classmap,
+                                  skip_classes=parse_classes(args.skip_classes))
 
     print(f"Found {len(results)} candidate signatures.")
 
@@ -32,38 +46,383 @@ def cmd_scan(args):
 # Usado para recuperar restos de archivos detectados en 'scan'.
 # ------------------------------------------------------------
 def cmd_extract(args):
-    out_path, sha = extract_from_offset(
-        args.image,
-        args.offset,
-        max_size=args.maxsize,
-        out_dir=args.outdir,
-        ext=args.ext or ".bin"
-    )
+    # Destino: carpeta (por defecto) o contenedor .tar/.pack
+    with open_sink(args.archive, out_dir=args.outdir, append=args.append) as sink:
+        if args.reassemble:
+            # JPEG/PNG fragmentado: se buscan y unen sus fragmentos
+            out_path, sha, result = extract_reassembled(
+                args.image, args.offset, ext=args.ext, sink=sink, max_size=args.maxsize)
+            print(f"Reassembly: {result['status']} ({result['format']}, {result['size']} bytes)")
+            for off, length in result["fragments"]:
+                print(f"  fragment @ {off} ({length} bytes)")
+        else:
+            out_path, sha = extract_from_offset(
+                args.image,
+                args.offset,
+                max_size=args.maxsize,
+                ext=args.ext or ".bin",
+                sink=sink
+            )
 
     print(f"Extracted to: {out_path}")
     print(f"SHA256: {sha}")
 
+# ------------------------------------------------------------
+# Comando: CARVE
+# Extracción por lotes de todos los hallazgos de 'scan' (o de un
+# JSON guardado con 'scan --out') hacia una carpeta o contenedor.
+# ------------------------------------------------------------
+def cmd_carve(args):
+    if args.scan:
+        with open(args.scan) as f:
+            results = json.load(f)
+    else:
+        results = scan_for_signatures(args.image)
+
+    # Con --append se reanuda: los artefactos ya presentes se saltan
+    with open_sink(args.archive, out_dir=args.outdir, append=args.append) as sink:
+        extracted = extract_batch(args.image, results, sink, max_size=args.maxsize,
+                                  resume=args.append, reassemble_images=args.reassemble)
+
+    skipped = sum(1 for e in extracted if e["skipped"])
+    print(f"Extracted {len(extracted) - skipped} artifacts ({skipped} already present).")
+    if args.reassemble:
+        for e in extracted:
+            if "status" in e:
+                print(f"- {e['offset']}: {e['status']}, {len(e['fragments'])} fragment(s)")
+    if args.archive:
+        print(f"Archive: {args.archive} (index: {args.archive}.idx)")
+
 # ------------------------------------------------------------
 # Comando: SUPERBLOCK
 # Lee y muestra los campos más importantes del superblock EXT4.
 # ------------------------------------------------------------
 def cmd_superblock(args):
-    sb = parse_superblock(args.image)
+    if args.backup:
+        # Ignora el primario y busca las copias de respaldo
+        found = find_backup_superblock(args.image)
+        if found is None:
+            print("No backup superblock found")
+            return
+        print(f"Backup superblocks: {len(found['copies'])} valid copies")
+        for g, off in found["copies"]:
+            print(f"  group {g} @ offset {off}")
+        print(f"Using group {found['group']} ({found['votes']} consistent copies), "
+              f"GDT from group {found['gdt_group']} (score {found['gdt_score']})")
+        sb = found["superblock"]
+    else:
+        try:
+            sb = read_superblock(args.image)
+        except ValueError as e:
+            # Imagen no EXT (o sin ninguna copia válida del superblock)
+            print(f"Cannot read superblock of {args.image}: {e}")
+            return
     print("Superblock summary:")
     for k, v in sb.items():
         print(f"  {k}: {v}")
 
+# ------------------------------------------------------------
+# Comando: JOURNAL
+# Indexa el journal jbd2 (inodo 8) y, opcionalmente, muestra las
+# versiones históricas de un inodo guardadas en él.
+# ------------------------------------------------------------
+def cmd_journal(args):
+    index = build_journal_index(args.image)
+    jsb = index["journal"]
+
+    print("Journal summary:")
+    print(f"  blocksize: {jsb['s_blocksize']}  maxlen: {jsb['s_maxlen']}  "
+          f"sequence: {jsb['s_sequence']}  start: {jsb['s_start']}")
+    print(f"  transactions: {len(index['transactions'])}")
+    print(f"  journaled fs blocks: {len(index['blocks'])}")
+    print(f"  revoked fs blocks: {len(index['revoked'])}")
+
+    # Versiones históricas de un inodo concreto (consulta O(1) sobre el índice)
+    if args.inode:
+        versions = read_inode_versions(args.image, args.inode, index=index)
+        print(f"Found {len(versions)} journaled versions of inode {args.inode}.")
+        for v in versions:
+            print(f"- txn {v['transaction']} (committed={v['committed']}): "
+                  f"mode {v['i_mode']} size {v['i_size']} "
+                  f"links {v['i_links_count']} dtime {v['i_dtime']}")
+            if v["csum_ok"] is False:
+                print("  note: this copy fails the inode checksum")
+
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(versions, f, indent=2)
+            print(f"Saved results to {args.out}")
+
+# ------------------------------------------------------------
+# Comando: TIMELINE
+# Genera la timeline MAC(B) de todos los inodos, ordenada por
+# tiempo, en CSV o NDJSON (a un archivo o a stdout).
+# ------------------------------------------------------------
+def cmd_timeline(args):
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            n = write_timeline(args.image, f, fmt=args.format,
+                               max_events=args.max_events, tmp_dir=args.tmpdir)
+        print(f"Wrote {n} events to {args.out}")
+    else:
+        write_timeline(args.image, sys.stdout, fmt=args.format,
+                       max_events=args.max_events, tmp_dir=args.tmpdir)
+
+# ------------------------------------------------------------
+# Comando: HASHMAP
+# Calcula el mapa de hashes por bloque de una imagen (en paralelo)
+# y lo guarda junto a ella como <imagen>.blockmap.
+# ------------------------------------------------------------
+def cmd_hashmap(args):
+    out = build_blockmap(args.image, out_path=args.out, block_size=args.block_size,
+                         workers=args.workers)
+    h = read_blockmap_header(out)
+    print(f"Block map saved to {out} ({h['blocks']} blocks of {h['block_size']} bytes)")
+
+# ------------------------------------------------------------
+# Comando: DIFFSCAN
+# Compara la imagen con el block map de una adquisición previa y
+# ejecuta el escáner de firmas y el parser de inodos SOLO sobre los
+# bloques que cambiaron.
+# ------------------------------------------------------------
+def cmd_diffscan(args):
+    prev = read_blockmap_header(args.prev)
+
+    # Reutilizar el block map de la imagen actual si ya existe, está al
+    # día y usa la misma geometría (tamaño de bloque y de digest) que prev
+    cur_map = blockmap_path(args.image)
+    stale = not os.path.exists(cur_map) or os.path.getmtime(cur_map) < os.path.getmtime(args.image)
+    if not stale:
+        try:
+            h = read_blockmap_header(cur_map)
+            stale = (h["block_size"], h["digest_size"]) != (prev["block_size"], prev["digest_size"])
+        except ValueError:
+            stale = True
+    if stale:
+        build_blockmap(args.image, block_size=prev["block_size"],
+                       digest_size=prev["digest_size"], workers=args.workers)
+
+    changed = diff_blockmaps(args.prev, cur_map)
+    cur = read_blockmap_header(cur_map)
+    byte_ranges = blocks_to_byte_ranges(changed, cur["block_size"], cur["image_size"])
+    changed_bytes = sum(length for _off, length in byte_ranges)
+    print(f"Changed: {changed_bytes} bytes in {len(byte_ranges)} ranges "
+          f"({changed_bytes * 100 / max(cur['image_size'], 1):.2f}% of image)")
+
+    results = scan_for_signatures(args.image, ranges=byte_ranges)
+    print(f"Found {len(results)} candidate signatures in changed blocks.")
+    for r in results:
+        print(f"- {r['name']} at offset {r['offset']} (ext {r['ext']})")
+
+    # El parser de inodos solo es aplicable si la imagen es EXT
+    try:
+        inodes = read_changed_inodes(args.image, byte_ranges)
+    except ValueError:
+        inodes = []
+    print(f"Changed inodes: {len(inodes)}")
+    for ino in inodes:
+        print(f"- inode {ino['inode_num']}: mode {ino['i_mode']} size {ino['i_size']} "
+              f"links {ino['i_links_count']} dtime {ino['i_dtime']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"ranges": byte_ranges, "signatures": results, "inodes": inodes},
+                      f, indent=2)
+        print(f"Saved results to {args.out}")
+
+# ------------------------------------------------------------
+# Comando: HASHSET
+# Hashea por bloques un conjunto de archivos de referencia y guarda
+# el índice (Bloom filter + tabla ordenada) en disco.
+# ------------------------------------------------------------
+def cmd_hashset(args):
+    info = build_reference_index(args.refs, args.out, block_size=args.block_size)
+    print(f"Indexed {info['blocks_indexed']} blocks from {info['files']} reference files.")
+    print(f"Saved index to {args.out}")
+
+# ------------------------------------------------------------
+# Comando: MATCH
+# Busca en toda la imagen (incluido el espacio no asignado) bloques
+# idénticos a los de los archivos de referencia.
+# ------------------------------------------------------------
+def cmd_match(args):
+    report = match_image(args.image, args.index, workers=args.workers)
+
+    print(f"Reference files with matching blocks: {len(report)}")
+    for r in report:
+        print(f"- {r['path']}: {r['blocks_matched']}/{r['blocks']} blocks "
+              f"({len(r['matches'])} hits)")
+        for m in r["matches"][:args.show]:
+            print(f"    block {m['file_block']} at offset {m['offset']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.out}")
+
+# ------------------------------------------------------------
+# Comando: SEARCH
+# Busca palabras clave y regex (ASCII/UTF-8/UTF-16) en toda la
+# imagen y, si es EXT, indica el bloque y el inodo de cada acierto.
+# ------------------------------------------------------------
+def cmd_search(args):
+    keywords = list(args.keyword or [])
+    if args.keywords_file:
+        with open(args.keywords_file, encoding="utf-8") as f:
+            keywords.extend(line.rstrip("\n") for line in f if line.strip())
+
+    hits = search_image(
+        args.image,
+        keywords=keywords,
+        regexes=args.regex or [],
+        encodings=args.encodings.split(","),
+        ignore_case=args.ignore_case,
+        workers=args.workers,
+        resolve=not args.no_resolve
+    )
+
+    print(f"Found {len(hits)} hits.")
+    for h in hits:
+        owner = ""
+        if h.get("inode"):
+            inodes = ", ".join(f"inode {o['inode']}" + (" (deleted)" if o["deleted"] else "")
+                               for o in h["owners"])
+            owner = f" [block {h['block']}, {inodes}]"
+        elif "block" in h:
+            owner = f" [block {h['block']}, unallocated/metadata]"
+        print(f"- {h['offset']} {h['encoding']} {h['term']!r}: {h['text']!r}{owner}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(hits, f, indent=2)
+        print(f"Saved results to {args.out}")
+
+# ------------------------------------------------------------
+# Comando: RECOVER-DELETED
+# Recupera los archivos borrados por inodo (pipeline por etapas)
+# con un manifiesto JSONL que permite reanudar.
+# ------------------------------------------------------------
+def cmd_recover_deleted(args):
+    manifest = args.manifest or (args.archive or args.outdir.rstrip("/")) + ".manifest.jsonl"
+    with open_sink(args.archive, out_dir=args.outdir, append=args.resume) as sink:
+        stats = recover_deleted(
+            args.image, sink,
+            manifest_path=manifest,
+            resume=args.resume,
+            include_reused=args.include_reused,
+            use_journal=not args.no_journal,
+            enum_workers=args.enum_workers,
+            map_workers=args.map_workers,
+            write_workers=args.write_workers,
+            queue_size=args.queue_size
+        )
+
+    print(f"Groups: {stats['groups']}  candidates: {stats['candidates']}  "
+          f"already in manifest: {stats['skipped']}")
+    print(f"Recovered: {stats['recovered']}  reused blocks: {stats['reused']}  "
+          f"no block map: {stats['no_blocks']}  errors: {stats['error']}")
+    print(f"Live orphan-list inodes (not recovered): {stats['orphan']}")
+    print(f"Manifest: {manifest}")
+
+# ------------------------------------------------------------
+# Comando: CLASSIFY
+# Clasifica cada bloque (vacío, texto, binario, comprimido/cifrado)
+# y guarda el class map que usan 'scan --classmap' y el mapa de calor.
+# ------------------------------------------------------------
+def cmd_classify(args):
+    info = None
+    # --reuse: si el mapa ya existe, está al día y usa el mismo tamaño de
+    # bloque, solo se cuentan sus clases en lugar de reclasificar la imagen
+    map_path = args.out or classmap_path(args.image)
+    if args.reuse and os.path.exists(map_path) \
+            and os.path.getmtime(map_path) >= os.path.getmtime(args.image):
+        try:
+            h = read_classmap_header(map_path)
+            if (h["block_size"], h["image_size"]) == (args.block_size, os.path.getsize(args.image)):
+                info = {"path": map_path, "blocks": h["blocks"],
+                        "counts": classmap_summary(map_path)}
+        except ValueError:
+            pass
+    if info is None:
+        info = build_classmap(args.image, out_path=args.out,
+                              block_size=args.block_size, workers=args.workers)
+    print(f"Class map: {info['path']} ({info['blocks']} blocks of {args.block_size} bytes)")
+    for name, n in info["counts"].items():
+        print(f"  {name:<13} {n:>12}  ({n * 100 / max(info['blocks'], 1):.2f}%)")
+
+    if args.heatmap:
+        legend = "  ".join(f"'{c}'={name}" for c, name in zip(HEATMAP_CHARS, CLASS_NAMES))
+        print(f"\nHeatmap ({legend}):")
+        for line in render_heatmap(info["path"], width=args.width):
+            print(line)
+
+# ------------------------------------------------------------
+# Comando: VERIFY
+# Verifica los checksums de metadatos (metadata_csum) grupo a
+# grupo y muestra los grupos con metadatos dañados.
+# ------------------------------------------------------------
+def cmd_verify(args):
+    groups = None
+    if args.groups:
+        groups = [int(g) for g in args.groups.split(",")]
+    try:
+        report = verify_metadata(args.image, workers=args.workers, groups=groups)
+    except ValueError as e:
+        # Imagen no EXT o FS sin metadata_csum
+        print(f"Cannot verify {args.image}: {e}")
+        return
+    s = report["summary"]
+
+    print(f"Superblock checksum: {'ok' if report['superblock'] else 'BAD'}")
+    print(f"Groups: {s['groups']} checked, {s['bad_groups']} with errors")
+    print(f"  descriptors bad: {s['bad_descriptors']}  bitmaps bad: {s['bad_bitmaps']}")
+    print(f"  inodes: {s['inodes_checked']} checked, {s['bad_inodes']} bad")
+    print(f"  extent blocks: {s['extent_blocks_checked']} checked, {s['bad_extent_blocks']} bad")
+
+    for g in report["groups"]:
+        if group_ok(g):
+            continue
+        problems = []
+        if not g["descriptor"]:
+            problems.append("descriptor")
+        if g["block_bitmap"] is False:
+            problems.append("block bitmap")
+        if g["inode_bitmap"] is False:
+            problems.append("inode bitmap")
+        if g["bad_inodes"]:
+            problems.append(f"{len(g['bad_inodes'])} inodes {g['bad_inodes'][:10]}")
+        if g["bad_extent_blocks"]:
+            problems.append(f"{len(g['bad_extent_blocks'])} extent blocks")
+        print(f"- group {g['group']}: " + ", ".join(problems))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.out}")
+
 # ------------------------------------------------------------
 # Función principal: parser CLI con subcomandos
 # ------------------------------------------------------------
 def main():
     parser = argparse.ArgumentParser(prog="forensic-tool")
+
+    # ----------- Opciones globales: límite de lectura -----
+    # Para imágenes en almacenamiento compartido (SAN de producción)
+    parser.add_argument("--max-read-mbps", type=float, default=None,
+                        help="limit image reads to N MB/s")
+    parser.add_argument("--max-iops", type=float, default=None,
+                        help="limit image reads to N operations/s")
+    parser.add_argument("--adaptive-io", action="store_true",
+                        help="back off when observed read latency rises")
     sub = parser.add_subparsers(dest="cmd")
 
     # ----------- Comando: scan -----------
     p_scan = sub.add_parser("scan", help="scan image for known signatures")
     p_scan.add_argument("image")           # ruta a la imagen RAW/EXT4
     p_scan.add_argument("--out", help="save JSON results")
+    p_scan.add_argument("--classmap", default=None, help="class map from 'classify'")
+    p_scan.add_argument("--skip-classes", default="zero,uniform",
+                        help="block classes to skip with --classmap")
 
     # ----------- Comando: extract --------
     p_extract = sub.add_parser("extract", help="extract bytes from offset")
@@ -72,21 +431,151 @@ def main():
     p_extract.add_argument("--maxsize", type=int, default=5*1024*1024) # límite máx.
     p_extract.add_argument("--outdir", default="recovered")            # carpeta salida
     p_extract.add_argument("--ext", default=None)                      # extensión opc.
+    p_extract.add_argument("--archive", default=None)   # contenedor .tar/.pack opc.
+    p_extract.add_argument("--append", action="store_true")
+    p_extract.add_argument("--reassemble", action="store_true", help="reassemble fragmented JPEG/PNG")
+
+    # ----------- Comando: carve ----------
+    p_carve = sub.add_parser("carve", help="batch-extract scan hits into a folder or archive")
+    p_carve.add_argument("image")
+    p_carve.add_argument("--scan", default=None, help="JSON from 'scan --out' (default: rescan)")
+    p_carve.add_argument("--maxsize", type=int, default=5*1024*1024)
+    p_carve.add_argument("--outdir", default="recovered")
+    p_carve.add_argument("--archive", default=None, help="write into a .tar or .pack")
+    p_carve.add_argument("--append", action="store_true", help="append/resume an existing archive")
+    p_carve.add_argument("--reassemble", action="store_true", help="reassemble fragmented JPEG/PNG")
 
     # ----------- Comando: superblock -----
     p_sb = sub.add_parser("superblock", help="print ext4 superblock summary")
     p_sb.add_argument("image")
+    p_sb.add_argument("--backup", action="store_true", help="locate and use backup superblock copies")
+
+    # ----------- Comando: journal --------
+    p_j = sub.add_parser("journal", help="index jbd2 journal / historic inode versions")
+    p_j.add_argument("image")
+    p_j.add_argument("--inode", type=int, default=None)  # inodo a consultar
+    p_j.add_argument("--out", help="save JSON results")
+
+    # ----------- Comando: timeline -------
+    p_tl = sub.add_parser("timeline", help="MAC(B) timeline of all inodes")
+    p_tl.add_argument("image")
+    p_tl.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    p_tl.add_argument("--out", help="output file (default: stdout)")
+    p_tl.add_argument("--max-events", type=int, default=1000000)  # eventos en memoria
+    p_tl.add_argument("--tmpdir", default=None)                     # runs temporales
+
+    # ----------- Comando: hashmap --------
+    p_hm = sub.add_parser("hashmap", help="build per-block hash map of an image")
+    p_hm.add_argument("image")
+    p_hm.add_argument("--out", default=None, help="default: <image>.blockmap")
+    p_hm.add_argument("--block-size", type=int, default=4096)
+    p_hm.add_argument("--workers", type=int, default=None)
+
+    # ----------- Comando: diffscan -------
+    p_ds = sub.add_parser("diffscan", help="scan only blocks changed since a previous block map")
+    p_ds.add_argument("image")
+    p_ds.add_argument("--prev", required=True, help="block map of the previous image")
+    p_ds.add_argument("--workers", type=int, default=None)
+    p_ds.add_argument("--out", help="save JSON results")
+
+    # ----------- Comando: hashset --------
+    p_hs = sub.add_parser("hashset", help="build block-hash index of reference files")
+    p_hs.add_argument("refs", nargs="+")      # archivos o carpetas de referencia
+    p_hs.add_argument("--out", required=True)
+    p_hs.add_argument("--block-size", type=int, default=4096)
+
+    # ----------- Comando: match ----------
+    p_m = sub.add_parser("match", help="find blocks of reference files in the image")
+    p_m.add_argument("image")
+    p_m.add_argument("--index", required=True)
+    p_m.add_argument("--workers", type=int, default=None)
+    p_m.add_argument("--show", type=int, default=5)   # aciertos a listar por archivo
+    p_m.add_argument("--out", help="save JSON results")
+
+    # ----------- Comando: search ---------
+    p_se = sub.add_parser("search", help="keyword/regex search (ASCII, UTF-8, UTF-16LE/BE)")
+    p_se.add_argument("image")
+    p_se.add_argument("-k", "--keyword", action="append", help="literal keyword (repeatable)")
+    p_se.add_argument("-r", "--regex", action="append", help="Python regex (repeatable)")
+    p_se.add_argument("--keywords-file", default=None, help="one keyword per line")
+    p_se.add_argument("-i", "--ignore-case", action="store_true")
+    p_se.add_argument("--encodings", default=",".join(ENCODINGS))
+    p_se.add_argument("--workers", type=int, default=None)
+    p_se.add_argument("--no-resolve", action="store_true", help="skip block/inode lookup")
+    p_se.add_argument("--out", help="save JSON results")
+
+    # ----------- Comando: recover-deleted -
+    p_rd = sub.add_parser("recover-deleted", help="recover deleted files by inode (staged pipeline)")
+    p_rd.add_argument("image")
+    p_rd.add_argument("--outdir", default="recovered")
+    p_rd.add_argument("--archive", default=None, help="write into a .tar or .pack")
+    p_rd.add_argument("--manifest", default=None, help="default: <outdir|archive>.manifest.jsonl")
+    p_rd.add_argument("--resume", action="store_true", help="skip inodes already in the manifest")
+    p_rd.add_argument("--include-reused", action="store_true",
+                      help="also write files whose blocks are allocated again")
+    p_rd.add_argument("--no-journal", action="store_true", help="do not look up block maps in the journal")
+    p_rd.add_argument("--enum-workers", type=int, default=2)
+    p_rd.add_argument("--map-workers", type=int, default=4)
+    p_rd.add_argument("--write-workers", type=int, default=4)
+    p_rd.add_argument("--queue-size", type=int, default=256)
+
+    # ----------- Comando: classify -------
+    p_cl = sub.add_parser("classify", help="classify blocks (zero/text/binary/high-entropy)")
+    p_cl.add_argument("image")
+    p_cl.add_argument("--out", default=None, help="default: <image>.classmap")
+    p_cl.add_argument("--block-size", type=int, default=4096)
+    p_cl.add_argument("--workers", type=int, default=None)
+    p_cl.add_argument("--reuse", action="store_true", help="reuse an up-to-date class map instead of rebuilding it")
+    p_cl.add_argument("--heatmap", action="store_true", help="print a text heatmap")
+    p_cl.add_argument("--width", type=int, default=64)
+
+    # ----------- Comando: verify ---------
+    p_v = sub.add_parser("verify", help="verify metadata checksums (metadata_csum) per group")
+    p_v.add_argument("image")
+    p_v.add_argument("--workers", type=int, default=None)
+    p_v.add_argument("--groups", default=None, help="comma-separated group numbers")
+    p_v.add_argument("--out", help="save JSON report")
 
     # Parsear línea de comandos
     args = parser.parse_args()
 
+    # Configurar el límite de lectura para todos los comandos
+    if args.max_read_mbps or args.max_iops or args.adaptive_io:
+        set_default_throttle(ReadThrottle(
+            max_bytes_per_sec=args.max_read_mbps * 1024 * 1024 if args.max_read_mbps else None,
+            max_iops=args.max_iops,
+            adaptive=args.adaptive_io
+        ))
+
     # Llamar al comando correspondiente
     if args.cmd == "scan":
         cmd_scan(args)
     elif args.cmd == "extract":
         cmd_extract(args)
+    elif args.cmd == "carve":
+        cmd_carve(args)
     elif args.cmd == "superblock":
         cmd_superblock(args)
+    elif args.cmd == "journal":
+        cmd_journal(args)
+    elif args.cmd == "timeline":
+        cmd_timeline(args)
+    elif args.cmd == "hashmap":
+        cmd_hashmap(args)
+    elif args.cmd == "diffscan":
+        cmd_diffscan(args)
+    elif args.cmd == "hashset":
+        cmd_hashset(args)
+    elif args.cmd == "match":
+        cmd_match(args)
+    elif args.cmd == "search":
+        cmd_search(args)
+    elif args.cmd == "recover-deleted":
+        cmd_recover_deleted(args)
+    elif args.cmd == "classify":
+        cmd_classify(args)
+    elif args.cmd == "verify":
+        cmd_verify(args)
     else:
         parser.print_help()
 
@@ -1,15 +1,20 @@
 # src/ext4_parser.py
-import struct
+import os, copy, struct, threading
+from bisect import bisect_right
 from .img_reader import DiskImage
 
 # -------------------------------------------------------------------
 # SUPERBLOCK
 # -------------------------------------------------------------------
-def read_superblock(path):
+def read_superblock(path, fallback=True):
     """
     Lee el superblock clásico de EXT2/EXT3/EXT4, el cual siempre se
     encuentra a partir del offset 1024 dentro de la imagen del disco.
 
+    Si el superblock primario está dañado y fallback=True, se buscan
+    las copias de respaldo (ver find_backup_superblock) y se usa la
+    más consistente; en ese caso "s_source" lo indica.
+
     Retorna un diccionario con:
       - tamaño de bloque
       - tamaño de inodo
@@ -17,14 +22,34 @@ def read_superblock(path):
       - cantidad total de bloques
       - inodos por grupo
       - número mágico (0xEF53)
+      - s_offset / s_gdt_offset: de dónde se leyó el superblock y dónde
+        está la tabla de descriptores de grupo a usar
     """
 
     d = DiskImage(path)
-    sb = d.read(1024, 1024)  # El superblock ocupa 1024 bytes fijos
+    raw = d.read(1024, 1024)  # El superblock ocupa 1024 bytes fijos
 
-    if len(sb) < 1024:
+    if len(raw) < 1024:
         raise ValueError("superblock too small or image too small")
 
+    sb = parse_superblock_bytes(raw)
+    if superblock_plausible(sb) or not fallback:
+        sb["s_offset"] = 1024
+        sb["s_gdt_offset"] = group_descriptor_table_offset(sb["s_block_size"])
+        sb["s_source"] = "primary"
+        return sb
+
+    found = find_backup_superblock(path)
+    if found is None:
+        raise ValueError("primary superblock invalid and no backup superblock found")
+    return found["superblock"]
+
+
+def parse_superblock_bytes(sb):
+    """
+    Interpreta los 1024 bytes de un superblock (primario o de respaldo).
+    """
+
     # Campos principales del superblock (offsets estándar)
     s_inodes_count      = struct.unpack_from("<I", sb, 0)[0]
     s_blocks_count_lo   = struct.unpack_from("<I", sb, 4)[0]
@@ -35,9 +60,31 @@ def read_superblock(path):
     # Tamaño del inodo: EXT4 permite tamaños mayores a 128
     s_inode_size        = struct.unpack_from("<H", sb, 88)[0]
     s_magic             = struct.unpack_from("<H", sb, 56)[0]
-
-    # Cálculo del tamaño real del bloque
-    block_size = 1024 << s_log_block_size
+    s_blocks_per_group  = struct.unpack_from("<I", sb, 32)[0]
+
+    # Flags de características: determinan extents, 64bit, checksums, etc.
+    s_feature_compat    = struct.unpack_from("<I", sb, 0x5C)[0]
+    s_feature_incompat  = struct.unpack_from("<I", sb, 0x60)[0]
+    s_feature_ro_compat = struct.unpack_from("<I", sb, 0x64)[0]
+    s_journal_inum      = struct.unpack_from("<I", sb, 0xE0)[0]
+    # Primer inodo no reservado (0 en la revisión 0 → 11)
+    s_first_ino         = struct.unpack_from("<I", sb, 0x54)[0] or 11
+    # Tamaño del descriptor de grupo (solo válido con la feature 64bit)
+    s_desc_size         = struct.unpack_from("<H", sb, 0xFE)[0]
+    s_blocks_count_hi   = struct.unpack_from("<I", sb, 0x150)[0]
+    # Grupo en el que está esta copia (0 en el primario)
+    s_block_group_nr    = struct.unpack_from("<H", sb, 0x5A)[0]
+    s_uuid              = sb[0x68:0x78]
+    # sparse_super2: únicos dos grupos con copia de respaldo
+    s_backup_bgs        = struct.unpack_from("<II", sb, 0x24C)
+    # metadata_csum: tipo de checksum (1 = crc32c) y semilla precalculada
+    s_checksum_type     = sb[0x175]
+    s_checksum_seed     = struct.unpack_from("<I", sb, 0x270)[0]
+    # meta_bg: primer "meta grupo" cuyos descriptores no están en la GDT contigua
+    s_first_meta_bg     = struct.unpack_from("<I", sb, 0x104)[0]
+
+    # Cálculo del tamaño real del bloque (valores absurdos → 0)
+    block_size = 1024 << s_log_block_size if s_log_block_size <= 6 else 0
 
     # EXT2/3 default: inodes de 128 bytes si el campo no fue configurado
     if s_inode_size == 0:
@@ -51,10 +98,92 @@ def read_superblock(path):
         "s_block_size": block_size,
         "s_inodes_per_group": s_inodes_per_group,
         "s_inode_size": s_inode_size,
-        "s_magic": hex(s_magic)
+        "s_magic": hex(s_magic),
+        "s_blocks_per_group": s_blocks_per_group,
+        "s_feature_compat": s_feature_compat,
+        "s_feature_incompat": s_feature_incompat,
+        "s_feature_ro_compat": s_feature_ro_compat,
+        "s_journal_inum": s_journal_inum,
+        "s_first_ino": s_first_ino,
+        "s_desc_size": s_desc_size,
+        "s_blocks_count_hi": s_blocks_count_hi,
+        "s_block_group_nr": s_block_group_nr,
+        "s_uuid": s_uuid.hex(),
+        "s_backup_bgs": list(s_backup_bgs),
+        "s_checksum_type": s_checksum_type,
+        "s_checksum_seed": s_checksum_seed,
+        "s_first_meta_bg": s_first_meta_bg
     }
 
 
+def superblock_plausible(sb):
+    """
+    Validación rápida de un superblock parseado: magic y campos de
+    geometría dentro de rangos posibles.
+    """
+    bs = sb["s_block_size"]
+    return (
+        sb["s_magic"] == hex(0xEF53)
+        and bs >= 1024
+        and sb["s_inodes_count"] > 0
+        and sb["s_blocks_count_lo"] > 0
+        and 0 < sb["s_blocks_per_group"] <= 8 * bs
+        and 0 < sb["s_inodes_per_group"] <= 8 * bs
+        and 128 <= sb["s_inode_size"] <= bs
+        and sb["s_inode_size"] & (sb["s_inode_size"] - 1) == 0
+        and sb["s_first_data_block"] == (1 if bs == 1024 else 0)
+    )
+
+
+# -------------------------------------------------------------------
+# FEATURE FLAGS
+# -------------------------------------------------------------------
+COMPAT_SPARSE_SUPER2 = 0x200
+RO_COMPAT_SPARSE_SUPER = 0x1
+RO_COMPAT_GDT_CSUM = 0x10
+RO_COMPAT_METADATA_CSUM = 0x400
+INCOMPAT_EXTENTS = 0x40
+INCOMPAT_64BIT   = 0x80
+INCOMPAT_META_BG = 0x10
+INCOMPAT_FLEX_BG = 0x200
+INCOMPAT_CSUM_SEED = 0x2000
+BG_INODE_UNINIT  = 0x1            # bg_flags: tabla/bitmap de inodos sin inicializar
+BG_BLOCK_UNINIT  = 0x2            # bg_flags: bitmap de bloques sin inicializar
+EXT4_EXTENTS_FL  = 0x80000       # i_flags: el inodo usa árbol de extents
+EXT4_INLINE_DATA_FL = 0x10000000 # i_flags: datos dentro del propio inodo
+EXT4_EXTENT_MAGIC = 0xF30A
+
+
+def group_descriptor_size(sb):
+    """
+    Devuelve el tamaño en bytes de cada descriptor de grupo.
+
+      - sin la feature 64bit → 32 bytes (formato clásico)
+      - con 64bit            → s_desc_size (normalmente 64)
+    """
+    if sb.get("s_feature_incompat", 0) & INCOMPAT_64BIT and sb.get("s_desc_size", 0) >= 32:
+        return sb["s_desc_size"]
+    return 32
+
+
+def blocks_count(sb):
+    """
+    Número total de bloques (combinando s_blocks_count_hi si es 64bit).
+    """
+    count = sb["s_blocks_count_lo"]
+    if sb.get("s_feature_incompat", 0) & INCOMPAT_64BIT:
+        count |= sb.get("s_blocks_count_hi", 0) << 32
+    return count
+
+
+def group_count(sb):
+    """
+    Número de grupos de bloques del sistema de archivos.
+    """
+    data_blocks = blocks_count(sb) - sb["s_first_data_block"]
+    return max(1, -(-data_blocks // sb["s_blocks_per_group"]))
+
+
 # -------------------------------------------------------------------
 # GROUP DESCRIPTOR TABLE LOCATION
 # -------------------------------------------------------------------
@@ -72,91 +201,542 @@ def group_descriptor_table_offset(block_size):
     return gd_block * block_size
 
 
+def group_has_superblock(sb, g):
+    """
+    Indica si el grupo g guarda una copia del superblock (y de la GDT):
+    todos los grupos sin sparse_super; con sparse_super el 0, el 1 y
+    las potencias de 3, 5 y 7; con sparse_super2 el 0 y s_backup_bgs.
+    """
+    if g == 0:
+        return True
+    if sb.get("s_feature_compat", 0) & COMPAT_SPARSE_SUPER2:
+        return g in sb.get("s_backup_bgs", ())
+    if not sb.get("s_feature_ro_compat", 0) & RO_COMPAT_SPARSE_SUPER:
+        return True
+    for base in (3, 5, 7):
+        n = g
+        while n % base == 0:
+            n //= base
+        if n == 1:
+            return True
+    return g == 1
+
+
+def _meta_bg_block(sb, mg):
+    # Bloque de descriptores del meta grupo mg (feature meta_bg)
+    g = mg * (sb["s_block_size"] // group_descriptor_size(sb))
+    return g * sb["s_blocks_per_group"] + sb["s_first_data_block"] + group_has_superblock(sb, g)
+
+
+def group_descriptor_offset(sb, g, gdt_offset=None):
+    """
+    Offset absoluto del descriptor del grupo g, teniendo en cuenta
+    meta_bg (ver read_gdt_bytes).
+    """
+    bs = sb["s_block_size"]
+    desc_size = group_descriptor_size(sb)
+    if gdt_offset is None:
+        gdt_offset = sb.get("s_gdt_offset") or group_descriptor_table_offset(bs)
+
+    mg, index = divmod(g, bs // desc_size)
+    if not sb.get("s_feature_incompat", 0) & INCOMPAT_META_BG or mg < sb.get("s_first_meta_bg", 0):
+        return gdt_offset + g * desc_size
+    return _meta_bg_block(sb, mg) * bs + index * desc_size
+
+
+def read_gdt_bytes(d, sb, gdt_offset=None):
+    """
+    Lee los bytes de todos los descriptores de grupo, en orden de grupo.
+
+    Sin meta_bg la tabla es contigua a partir de gdt_offset. Con meta_bg
+    solo lo son los primeros s_first_meta_bg bloques; a partir de ahí,
+    cada "meta grupo" (los grupos cuyos descriptores caben en un bloque)
+    guarda su bloque de descriptores al comienzo de su primer grupo,
+    detrás del superblock de respaldo si ese grupo lo tiene.
+
+    Si una lectura queda corta se devuelve lo leído hasta ahí: el
+    llamador detecta la tabla truncada por la longitud.
+    """
+    bs = sb["s_block_size"]
+    desc_size = group_descriptor_size(sb)
+    size = group_count(sb) * desc_size
+    if gdt_offset is None:
+        gdt_offset = sb.get("s_gdt_offset") or group_descriptor_table_offset(bs)
+
+    if not sb.get("s_feature_incompat", 0) & INCOMPAT_META_BG:
+        return d.read(gdt_offset, size)
+
+    n_blocks = -(-size // bs)
+    first_meta = min(sb.get("s_first_meta_bg", 0), n_blocks)
+    data = d.read(gdt_offset, first_meta * bs)
+    if len(data) < first_meta * bs:
+        return data[:size]
+
+    for mg in range(first_meta, n_blocks):
+        chunk = d.read(_meta_bg_block(sb, mg) * bs, bs)
+        data += chunk
+        if len(chunk) < bs:
+            break
+    return data[:size]
+
+
 # -------------------------------------------------------------------
 # GROUP DESCRIPTOR
 # -------------------------------------------------------------------
-def read_group_descriptor(path, block_size, index=0):
+def read_group_descriptor(path, block_size, index=0, desc_size=32, gdt_offset=None):
     """
-    Lee un descriptor de grupo EXT2/3/4 (formato legacy de 32 bytes).
+    Lee un descriptor de grupo EXT2/3/4.
     Cada descriptor almacena:
       - bg_block_bitmap     → bloque donde está el bitmap de bloques
       - bg_inode_bitmap     → bloque donde está el bitmap de inodos
       - bg_inode_table      → bloque donde comienza la tabla de inodos
 
-    *Esta versión lee solo los primeros 32 bytes (formato clásico).*
+    Con desc_size = 32 se usa el formato clásico. Si el sistema tiene la
+    feature 64bit (desc_size >= 64) se combinan también las mitades altas
+    de cada puntero de bloque.
+
+    gdt_offset permite leer una copia de respaldo de la tabla.
     """
 
+    if gdt_offset is None:
+        gdt_offset = group_descriptor_table_offset(block_size)
+
     d = DiskImage(path)
-    gd_off = group_descriptor_table_offset(block_size) + index * 32
-    data = d.read(gd_off, 32)
+    gd_off = gdt_offset + index * desc_size
+    data = d.read(gd_off, desc_size)
 
-    if len(data) < 32:
+    if len(data) < desc_size:
         raise ValueError("group descriptor area too small")
 
+    return parse_group_descriptor(data, desc_size)
+
+
+def parse_group_descriptor(data, desc_size=32, offset=0):
+    """
+    Interpreta un descriptor de grupo a partir de sus bytes crudos.
+    Con desc_size >= 64 (feature 64bit) se combinan también las mitades
+    altas de cada puntero de bloque.
+    """
     bg_block_bitmap, bg_inode_bitmap, bg_inode_table = \
-        struct.unpack_from("<III", data, 0)
+        struct.unpack_from("<III", data, offset)
+
+    # EXT4 64bit: bg_*_hi en los offsets 0x20, 0x24 y 0x28
+    if desc_size >= 64:
+        hi_block_bitmap, hi_inode_bitmap, hi_inode_table = \
+            struct.unpack_from("<III", data, offset + 0x20)
+        bg_block_bitmap |= hi_block_bitmap << 32
+        bg_inode_bitmap |= hi_inode_bitmap << 32
+        bg_inode_table  |= hi_inode_table << 32
+
+    # bg_flags: INODE_UNINIT / BLOCK_UNINIT / INODE_ZEROED
+    bg_flags = struct.unpack_from("<H", data, offset + 0x12)[0]
 
     return {
         "bg_block_bitmap": bg_block_bitmap,
         "bg_inode_bitmap": bg_inode_bitmap,
-        "bg_inode_table": bg_inode_table
+        "bg_inode_table": bg_inode_table,
+        "bg_flags": bg_flags
     }
 
 
+def read_group_descriptors(path, sb=None):
+    """
+    Lee TODA la tabla de descriptores de grupo con una sola lectura.
+
+    Retorna una lista de dicts (uno por grupo) con el mismo formato
+    que read_group_descriptor().
+    """
+    if sb is None:
+        sb = read_superblock(path)
+
+    desc_size = group_descriptor_size(sb)
+    count = group_count(sb)
+
+    data = read_gdt_bytes(DiskImage(path), sb)
+
+    if len(data) < count * desc_size:
+        raise ValueError("group descriptor table truncated")
+
+    return [parse_group_descriptor(data, desc_size, g * desc_size) for g in range(count)]
+
+
 # -------------------------------------------------------------------
-# INODE PARSER
+# BITMAP DE BLOQUES
 # -------------------------------------------------------------------
-def read_inode(path, inode_num):
+BITMAP_CACHE_GROUPS = 256
+
+
+class BlockBitmap:
     """
-    Lee un inodo EXT4 a partir de su número (1-based indexing).
-    Esta implementación MVP soporta únicamente:
-        → inodos dentro del grupo 0
+    Acceso al bitmap de bloques por grupo, con caché acotada.
+    Los grupos BLOCK_UNINIT se tratan como libres.
+    """
+
+    def __init__(self, path, sb, gds):
+        self.d = DiskImage(path)
+        self.sb = sb
+        self.gds = gds
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def _group_bitmap(self, g):
+        with self.lock:
+            bitmap = self.cache.get(g)
+        if bitmap is not None:
+            return bitmap
+
+        gd = self.gds[g]
+        if gd["bg_flags"] & BG_BLOCK_UNINIT:
+            bitmap = b""
+        else:
+            bitmap = self.d.read(gd["bg_block_bitmap"] * self.sb["s_block_size"],
+                                 self.sb["s_blocks_per_group"] // 8)
+
+        with self.lock:
+            if len(self.cache) >= BITMAP_CACHE_GROUPS:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[g] = bitmap
+        return bitmap
+
+    def allocated(self, phys, length):
+        """
+        Cuenta los bloques del tramo [phys, phys + length) marcados
+        como ocupados en el bitmap actual.
+        """
+        bpg = self.sb["s_blocks_per_group"]
+        first = self.sb["s_first_data_block"]
+        count = 0
+        block = phys
+        end = phys + length
+        while block < end:
+            g, bit = divmod(block - first, bpg)
+            if g >= len(self.gds):
+                break
+            n = min(end - block, bpg - bit)
+            bitmap = self._group_bitmap(g)
+            if bitmap:
+                # Popcount del tramo de bits [bit, bit + n)
+                bits = int.from_bytes(bitmap[bit >> 3:(bit + n + 7) >> 3], "little")
+                count += bin((bits >> (bit & 7)) & ((1 << n) - 1)).count("1")
+            block += n
+        return count
+
+
+# -------------------------------------------------------------------
+# LECTURA MASIVA DE TABLAS DE INODOS
+# -------------------------------------------------------------------
+def iter_inode_tables(path, sb=None, groups=None):
+    """
+    Recorre las tablas de inodos grupo por grupo, leyendo cada tabla
+    completa con UNA lectura secuencial (en lugar de un read por inodo).
+
+    Genera tuplas:
+      (grupo, número_del_primer_inodo, bytes_de_la_tabla)
+
+    El inodo i-ésimo de la tabla está en table[i*inode_size:(i+1)*inode_size]
+    y su número es primer_inodo + i. La memoria usada queda acotada al
+    tamaño de la tabla de un grupo.
+    """
+    if sb is None:
+        sb = read_superblock(path)
+
+    block_size = sb["s_block_size"]
+    ipg = sb["s_inodes_per_group"]
+    table_size = ipg * sb["s_inode_size"]
+    gds = read_group_descriptors(path, sb)
+
+    with DiskImage(path).open() as f:
+        for g in (range(len(gds)) if groups is None else groups):
+            f.seek(gds[g]["bg_inode_table"] * block_size)
+            yield g, g * ipg + 1, f.read(table_size)
+
+
+# -------------------------------------------------------------------
+# SUPERBLOCKS Y GDT DE RESPALDO
+# -------------------------------------------------------------------
+BACKUP_BLOCK_SIZES = (1024, 2048, 4096, 65536)
+
+
+def sparse_backup_groups(n_groups):
+    """
+    Grupos con copia de respaldo en el layout sparse_super:
+    el grupo 1 y las potencias de 3, 5 y 7.
+    """
+    groups = {1} if n_groups > 1 else set()
+    for base in (3, 5, 7):
+        g = base
+        while g < n_groups:
+            groups.add(g)
+            g *= base
+    return sorted(groups)
+
+
+def backup_superblock_candidates(image_size):
+    """
+    Calcula las posiciones candidatas de superblocks de respaldo para
+    cada tamaño de bloque probable, suponiendo la geometría por defecto
+    de mke2fs (bloques por grupo = 8 × tamaño de bloque).
+
+    Incluye los grupos de sparse_super y, para sparse_super2, el
+    último grupo (donde mke2fs pone la segunda copia).
+
+    Retorna [(block_size, grupo, offset), ...].
+    """
+    candidates = []
+    for bs in BACKUP_BLOCK_SIZES:
+        bpg = 8 * bs
+        first_data_block = 1 if bs == 1024 else 0
+        n_groups = -(-(image_size // bs - first_data_block) // bpg)
+        groups = set(sparse_backup_groups(n_groups))
+        if n_groups > 1:
+            groups.add(n_groups - 1)
+        for g in sorted(groups):
+            offset = (g * bpg + first_data_block) * bs
+            if offset + 1024 <= image_size:
+                candidates.append((bs, g, offset))
+    return candidates
+
+
+def _probe_superblock(d, bs, group, offset):
+    """
+    Lee y valida una copia candidata: además de ser plausible, la copia
+    tiene que "estar donde dice estar" (grupo y tamaño de bloque).
+    """
+    raw = d.read(offset, 1024)
+    if len(raw) < 1024:
+        return None
+    sb = parse_superblock_bytes(raw)
+    if not superblock_plausible(sb) or sb["s_block_size"] != bs:
+        return None
+    if sb["s_block_group_nr"] != group:
+        return None
+    if (group * sb["s_blocks_per_group"] + sb["s_first_data_block"]) * bs != offset:
+        return None
+    return sb
+
+
+def _superblock_key(sb):
+    # Campos que deben coincidir en todas las copias del mismo FS
+    return (sb["s_uuid"], sb["s_inodes_count"], sb["s_blocks_count_lo"],
+            sb["s_blocks_count_hi"], sb["s_block_size"], sb["s_blocks_per_group"],
+            sb["s_inodes_per_group"], sb["s_inode_size"], sb["s_feature_incompat"],
+            sb["s_feature_ro_compat"])
+
+
+GDT_SAMPLE_HEAD = 64         # descriptores iniciales puntuados siempre
+GDT_SAMPLE_STRIDED = 192     # descriptores repartidos por el resto de la tabla
+
+
+def gdt_sample_groups(count):
+    """
+    Grupos que se puntúan en cada copia de la GDT: los primeros
+    GDT_SAMPLE_HEAD y, del resto, unos GDT_SAMPLE_STRIDED a paso fijo.
+    """
+    head = min(count, GDT_SAMPLE_HEAD)
+    stride = max(1, -(-(count - head) // GDT_SAMPLE_STRIDED))
+    return list(range(head)) + list(range(head, count, stride))
+
+
+def score_group_descriptor_table(d, sb, gdt_offset):
+    """
+    Puntúa una copia de la GDT: número de descriptores cuyos punteros
+    (bitmaps y tabla de inodos) caen dentro del sistema de archivos y,
+    sin flex_bg, dentro de su propio grupo.
+
+    Solo se puntúa una muestra (gdt_sample_groups), la misma para todas
+    las copias, así el coste no crece con el tamaño del volumen.
+    """
+    desc_size = group_descriptor_size(sb)
+    count = group_count(sb)
+    sample = gdt_sample_groups(count)
+
+    # Se leen solo los descriptores de la muestra; el último descriptor
+    # de la tabla se lee siempre para detectar una copia truncada
+    descs = {}
+    with d.open(sequential=False, drop_cache=False) as f:
+        for g in sample + [count - 1]:
+            f.seek(group_descriptor_offset(sb, g, gdt_offset))
+            raw = f.read(desc_size)
+            if len(raw) < desc_size:
+                return 0
+            descs[g] = raw
+
+    total_blocks = blocks_count(sb)
+    bpg = sb["s_blocks_per_group"]
+    fdb = sb["s_first_data_block"]
+    table_blocks = -(-sb["s_inodes_per_group"] * sb["s_inode_size"] // sb["s_block_size"])
+    flex = sb["s_feature_incompat"] & INCOMPAT_FLEX_BG
+
+    score = 0
+    for g in sample:
+        gd = parse_group_descriptor(descs[g], desc_size)
+        ptrs = (gd["bg_block_bitmap"], gd["bg_inode_bitmap"], gd["bg_inode_table"])
+        if not all(0 < p < total_blocks for p in ptrs):
+            continue
+        if gd["bg_inode_table"] + table_blocks > total_blocks:
+            continue
+        if not flex:
+            lo, hi = g * bpg + fdb, (g + 1) * bpg + fdb
+            if not all(lo <= p < hi for p in ptrs):
+                continue
+        score += 1
+    return score
+
+
+_backup_cache = {}
+_backup_cache_lock = threading.Lock()
+
+
+def find_backup_superblock(path):
+    """
+    Recupera la geometría de un sistema EXT con el superblock primario
+    dañado, sin escanear la imagen completa:
+
+      1. Calcula las posiciones de respaldo posibles (sparse_super y
+         sparse_super2) para cada tamaño de bloque probable.
+      2. Lee solo esas posiciones y valida cada copia.
+      3. Agrupa las copias válidas por sus campos de identidad y se
+         queda con el grupo mayoritario (el más consistente).
+      4. Puntúa las copias de la GDT (primaria y de respaldo) y elige
+         la que tiene más descriptores coherentes.
+
+    Retorna None si no hay ninguna copia válida, o un dict con:
+      - superblock : superblock elegido (con s_offset, s_gdt_offset, s_source)
+      - group      : grupo de la copia elegida
+      - votes      : copias que coinciden con la elegida
+      - copies     : [(grupo, offset), ...] de todas las copias válidas
+      - gdt_group  : grupo de la GDT elegida (0 = primaria)
+      - gdt_score  : descriptores coherentes en esa GDT (sobre la muestra)
+
+    El resultado se cachea por (ruta, tamaño, mtime): read_superblock se
+    llama en cada comando y en cada read_inode, y sobre una imagen dañada
+    el sondeo de respaldos no debe repetirse.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _backup_cache_lock:
+        if key not in _backup_cache:
+            _backup_cache[key] = _probe_backup_superblock(path)
+        found = _backup_cache[key]
+    # Copia: los llamadores pueden modificar el superblock devuelto
+    return copy.deepcopy(found)
+
+
+def _probe_backup_superblock(path):
+    # Sondeo real de find_backup_superblock (sin caché)
+    d = DiskImage(path)
+    valid = []
+    seen = set()
+
+    for bs, group, offset in backup_superblock_candidates(d.size):
+        sb = _probe_superblock(d, bs, group, offset)
+        if sb is not None:
+            valid.append((group, offset, sb))
+            seen.add(offset)
+
+    # sparse_super2: las copias indican sus dos grupos de respaldo
+    for _group, _offset, sb in list(valid):
+        if sb["s_feature_compat"] & COMPAT_SPARSE_SUPER2:
+            for g in sb["s_backup_bgs"]:
+                offset = (g * sb["s_blocks_per_group"] + sb["s_first_data_block"]) * sb["s_block_size"]
+                if g and offset not in seen:
+                    extra = _probe_superblock(d, sb["s_block_size"], g, offset)
+                    seen.add(offset)
+                    if extra is not None:
+                        valid.append((g, offset, extra))
+
+    if not valid:
+        return None
+
+    # Copia más consistente: la de la clave con más votos (empate → grupo menor)
+    votes = {}
+    for _group, _offset, sb in valid:
+        key = _superblock_key(sb)
+        votes[key] = votes.get(key, 0) + 1
+    best_key = max(votes, key=lambda k: votes[k])
+    consensus = sorted((v for v in valid if _superblock_key(v[2]) == best_key),
+                       key=lambda v: v[0])
+    group, offset, sb = consensus[0]
+
+    # GDT: la primaria y la que sigue a cada superblock de respaldo
+    bs = sb["s_block_size"]
+    gdt_candidates = [(0, group_descriptor_table_offset(bs))]
+    for g, _off, _sb in consensus:
+        gdt_block = g * sb["s_blocks_per_group"] + sb["s_first_data_block"] + 1
+        gdt_candidates.append((g, gdt_block * bs))
+
+    best_gdt = None
+    for g, gdt_offset in gdt_candidates:
+        score = score_group_descriptor_table(d, sb, gdt_offset)
+        if best_gdt is None or score > best_gdt[2]:
+            best_gdt = (g, gdt_offset, score)
+
+    sb["s_offset"] = offset
+    sb["s_gdt_offset"] = best_gdt[1]
+    sb["s_source"] = f"backup group {group}"
+
+    return {
+        "superblock": sb,
+        "group": group,
+        "votes": votes[best_key],
+        "copies": [(g, off) for g, off, _sb in valid],
+        "gdt_group": best_gdt[0],
+        "gdt_score": best_gdt[2]
+    }
+
+
+# -------------------------------------------------------------------
+# INODE LOCATION
+# -------------------------------------------------------------------
+def locate_inode(path, inode_num, sb=None):
+    """
+    Calcula la posición física de un inodo dentro de la imagen.
 
     Pasos:
-      1. Leer superblock (para obtener tamaño de bloque e inodo)
-      2. Leer descriptor de grupo (localizar tabla de inodos)
-      3. Calcular offset absoluto del inodo
-      4. Parsear campos estándar del inodo
-      5. Parsear la lista i_block (15 punteros)
-      6. Combinar i_size_low + i_size_high (EXT4) si aplica
+      1. Leer superblock (si no se entrega ya parseado)
+      2. Calcular grupo e índice dentro del grupo
+      3. Leer el descriptor de ese grupo (localizar tabla de inodos)
+      4. Calcular offset absoluto del inodo
+
+    Retorna:
+      (offset_absoluto, superblock, descriptor_de_grupo)
     """
 
-    # --- Leer configuración general del sistema de archivos ---
-    sb = read_superblock(path)
+    if sb is None:
+        sb = read_superblock(path)
+
     block_size = sb["s_block_size"]
     inode_size = sb["s_inode_size"]
     inodes_per_group = sb["s_inodes_per_group"]
-    total_inodes = sb["s_inodes_count"]
 
     # Validación básica
-    if inode_num < 1 or inode_num > total_inodes:
+    if inode_num < 1 or inode_num > sb["s_inodes_count"]:
         raise ValueError("inode number out of range")
 
     # Calcular grupo e índice dentro del grupo
     group = (inode_num - 1) // inodes_per_group
     index = (inode_num - 1) % inodes_per_group
 
-    # MVP → solo se soporta el grupo 0
-    if group != 0:
-        raise NotImplementedError(
-            "Only group 0 supported in this MVP. Extend to multi-group later."
-        )
+    gd = read_group_descriptor(path, block_size, desc_size=group_descriptor_size(sb),
+                               gdt_offset=group_descriptor_offset(sb, group))
 
-    # Leer descriptor de grupo
-    gd = read_group_descriptor(path, block_size, index=0)
+    # Offset exacto del inodo = inicio de la tabla + índice * tamaño
+    inode_offset = gd["bg_inode_table"] * block_size + index * inode_size
+    return inode_offset, sb, gd
 
-    # Localizar la tabla de inodos en la imagen
-    inode_table_block = gd["bg_inode_table"]
-    inode_table_offset = inode_table_block * block_size
 
-    # Calcular el offset exacto del inodo a leer
-    inode_offset = inode_table_offset + index * inode_size
+# -------------------------------------------------------------------
+# INODE FIELDS
+# -------------------------------------------------------------------
+def parse_inode_bytes(raw, inode_size):
+    """
+    Interpreta los bytes crudos de un inodo (formato EXT2/EXT3/EXT4).
 
-    # Leer bytes del inodo
-    d = DiskImage(path)
-    raw = d.read(inode_offset, inode_size)
+    Se separa de read_inode() para poder reutilizarlo sobre copias del
+    inodo que no están en la tabla de inodos (por ejemplo, en el journal).
+    """
 
-    if len(raw) < inode_size:
+    if len(raw) < 128:
         raise ValueError("inode data incomplete / image truncated")
 
     # ----------------------------------------------------------------
@@ -190,19 +770,241 @@ def read_inode(path, inode_num):
 
     full_size = (i_size_high << 32) | i_size_lo
 
-    # Retornar metadatos del inodo
     return {
-        "inode_num": inode_num,
         "i_mode": hex(i_mode),
         "i_uid": i_uid,
         "i_gid": i_gid,
         "i_size": full_size,
+        "i_atime": i_atime,
+        "i_ctime": i_ctime,
+        "i_mtime": i_mtime,
+        "i_dtime": i_dtime,
         "i_links_count": i_links_count,
         "i_blocks": i_blocks,
         "i_flags": hex(i_flags),
-        "i_block": i_block,
+        "i_block": i_block
+    }
+
+
+# -------------------------------------------------------------------
+# INODE PARSER
+# -------------------------------------------------------------------
+def read_inode(path, inode_num):
+    """
+    Lee un inodo EXT4 a partir de su número (1-based indexing).
+
+    Pasos:
+      1. Localizar el inodo (superblock + descriptor de su grupo)
+      2. Leer los bytes del inodo
+      3. Parsear campos estándar del inodo
+      4. Parsear la lista i_block (15 punteros)
+      5. Combinar i_size_low + i_size_high (EXT4) si aplica
+    """
+
+    inode_offset, sb, gd = locate_inode(path, inode_num)
+    inode_size = sb["s_inode_size"]
+
+    # Leer bytes del inodo
+    d = DiskImage(path)
+    raw = d.read(inode_offset, inode_size)
+
+    if len(raw) < inode_size:
+        raise ValueError("inode data incomplete / image truncated")
+
+    inode = {"inode_num": inode_num}
+    inode.update(parse_inode_bytes(raw, inode_size))
+    inode.update({
         "inode_raw_offset": inode_offset,
         "inode_size": inode_size,
         "superblock": sb,
         "group_descriptor": gd
-    }
+    })
+    return inode
+
+
+# -------------------------------------------------------------------
+# MAPA DE BLOQUES (EXTENTS + PUNTEROS CLÁSICOS)
+# -------------------------------------------------------------------
+def inode_block_runs(path, inode):
+    """
+    Traduce los punteros de un inodo a una lista de tramos contiguos:
+
+        [(bloque_lógico, bloque_físico, longitud), ...]
+
+    Soporta:
+      - árbol de extents EXT4 (i_flags & EXT4_EXTENTS_FL)
+      - punteros clásicos: 12 directos + indirecto simple, doble y triple
+
+    'inode' es el diccionario devuelto por read_inode().
+    """
+
+    block_size = inode["superblock"]["s_block_size"]
+    d = DiskImage(path)
+    i_block_raw = struct.pack("<15I", *inode["i_block"])
+
+    if int(inode["i_flags"], 16) & EXT4_EXTENTS_FL:
+        runs = _extent_runs(d, i_block_raw, block_size)
+    else:
+        runs = _indirect_runs(d, inode["i_block"], block_size)
+
+    runs.sort()
+    return runs
+
+
+def _extent_runs(d, node, block_size, depth_limit=8):
+    """
+    Recorre recursivamente un nodo del árbol de extents.
+    Cada nodo empieza con una cabecera de 12 bytes (magic 0xF30A).
+    """
+    magic, entries, _max, depth = struct.unpack_from("<HHHH", node, 0)
+    if magic != EXT4_EXTENT_MAGIC:
+        raise ValueError("invalid extent header")
+
+    runs = []
+    for i in range(entries):
+        off = 12 + i * 12
+        if depth == 0:
+            # Hoja: ee_block, ee_len, ee_start_hi, ee_start_lo
+            ee_block, ee_len, ee_start_hi, ee_start_lo = \
+                struct.unpack_from("<IHHI", node, off)
+            # ee_len > 32768 indica un extent no inicializado
+            if ee_len > 32768:
+                ee_len -= 32768
+            runs.append((ee_block, (ee_start_hi << 32) | ee_start_lo, ee_len))
+        else:
+            if depth_limit <= 0:
+                raise ValueError("extent tree too deep")
+            # Índice: ei_block, ei_leaf_lo, ei_leaf_hi
+            _ei_block, leaf_lo, leaf_hi = struct.unpack_from("<IIH", node, off)
+            child = d.read(((leaf_hi << 32) | leaf_lo) * block_size, block_size)
+            runs.extend(_extent_runs(d, child, block_size, depth_limit - 1))
+    return runs
+
+
+def _indirect_runs(d, i_block, block_size):
+    """
+    Expande los punteros clásicos EXT2/3 (directos + indirectos)
+    y agrupa bloques físicos consecutivos en tramos.
+    """
+    per_block = block_size // 4
+    runs = []
+
+    def add(logical, phys):
+        if phys == 0:
+            return
+        if runs:
+            l0, p0, n = runs[-1]
+            if l0 + n == logical and p0 + n == phys:
+                runs[-1] = (l0, p0, n + 1)
+                return
+        runs.append((logical, phys, 1))
+
+    def walk(ptr, level, logical):
+        # Los huecos (puntero 0) se saltan sin expandirse
+        data = d.read(ptr * block_size, block_size).ljust(block_size, b"\0")
+        for i, p in enumerate(struct.unpack_from(f"<{per_block}I", data)):
+            if p == 0:
+                continue
+            child_logical = logical + i * per_block ** (level - 1)
+            if level == 1:
+                add(child_logical, p)
+            else:
+                walk(p, level - 1, child_logical)
+
+    for i in range(12):
+        add(i, i_block[i])
+
+    logical = 12
+    for level, ptr in ((1, i_block[12]), (2, i_block[13]), (3, i_block[14])):
+        if ptr:
+            walk(ptr, level, logical)
+        logical += per_block ** level
+
+    return runs
+
+
+# -------------------------------------------------------------------
+# ÍNDICE INVERSO: BLOQUE FÍSICO → INODO
+# -------------------------------------------------------------------
+def build_block_owner_index(path, sb=None):
+    """
+    Construye un índice inverso bloque físico → (inodo, bloque lógico)
+    recorriendo todas las tablas de inodos con la lectura masiva.
+
+    Se omiten los inodos sin bloques (vacíos, symlinks rápidos) y los
+    de datos inline, y los grupos INODE_UNINIT (su tabla no está
+    inicializada). Los inodos con un mapa de bloques inválido (por
+    ejemplo, extents ya borrados) se ignoran.
+
+    Los inodos borrados (sin enlaces o libres en el bitmap de inodos)
+    que conservan sus extents también se indexan: sus tramos pueden
+    solaparse con los de inodos vivos que reutilizaron esos bloques.
+
+    Retorna un dict:
+      - starts : lista ordenada de bloques iniciales (para bisect)
+      - ends   : ends[i] = mayor fin de tramo entre runs[0..i]
+      - runs   : [(bloque_físico, longitud, inodo, bloque_lógico, borrado), ...]
+    """
+    if sb is None:
+        sb = read_superblock(path)
+
+    inode_size = sb["s_inode_size"]
+    ipg = sb["s_inodes_per_group"]
+    gds = read_group_descriptors(path, sb)
+    groups = [g for g, gd in enumerate(gds) if not gd["bg_flags"] & BG_INODE_UNINIT]
+    d = DiskImage(path)
+    runs = []
+
+    for group, first_inode, table in iter_inode_tables(path, sb, groups):
+        ibitmap = d.read(gds[group]["bg_inode_bitmap"] * sb["s_block_size"], -(-ipg // 8))
+        for i in range(len(table) // inode_size):
+            inode_num = first_inode + i
+            if inode_num > sb["s_inodes_count"]:
+                break
+            raw = table[i * inode_size:(i + 1) * inode_size]
+            if raw[:2] == b"\0\0":      # i_mode = 0 → inodo no usado
+                continue
+
+            fields = parse_inode_bytes(raw, inode_size)
+            if fields["i_blocks"] == 0 or int(fields["i_flags"], 16) & EXT4_INLINE_DATA_FL:
+                continue
+
+            fields["superblock"] = sb
+            try:
+                inode_runs = inode_block_runs(path, fields)
+            except (ValueError, struct.error):
+                continue
+
+            in_use = i // 8 < len(ibitmap) and ibitmap[i // 8] >> (i % 8) & 1
+            deleted = fields["i_links_count"] == 0 or not in_use
+            for logical, phys, length in inode_runs:
+                runs.append((phys, length, inode_num, logical, deleted))
+
+    runs.sort()
+    ends, top = [], 0
+    for phys, length, *_rest in runs:
+        top = max(top, phys + length)
+        ends.append(top)
+    return {"starts": [r[0] for r in runs], "ends": ends, "runs": runs}
+
+
+def lookup_block_owners(index, block):
+    """
+    Busca TODOS los inodos cuyos tramos contienen un bloque físico.
+    Se recorren hacia atrás los tramos que empiezan antes del bloque
+    mientras el fin máximo acumulado (ends) todavía lo alcance.
+
+    Retorna [(inodo, bloque_lógico, borrado), ...] con los vivos
+    primero; lista vacía si el bloque no pertenece a ningún inodo
+    (por ejemplo, espacio no asignado o metadatos).
+    """
+    owners = []
+    runs, ends = index["runs"], index["ends"]
+    i = bisect_right(index["starts"], block) - 1
+    while i >= 0 and ends[i] > block:
+        phys, length, inode_num, logical, deleted = runs[i]
+        if block < phys + length:
+            owners.append((inode_num, logical + (block - phys), deleted))
+        i -= 1
+    owners.sort(key=lambda o: (o[2], o[0]))
+    return owners
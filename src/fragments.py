@@ -0,0 +1,707 @@
+# src/fragments.py
+import re, zlib, struct
+from bisect import bisect_right
+from .img_reader import DiskImage
+from .ext4_parser import read_superblock, read_group_descriptors, BlockBitmap
+from .unallocated_scanner import SIGNATURES
+
+# ------------------------------------------------------------
+# Reensamblado de JPEG/PNG fragmentados
+#
+# extract_from_offset() supone que el archivo es contiguo. En un
+# volumen muy usado, muchas imágenes quedan partidas en varios
+# fragmentos y lo que se recupera a partir del primero es basura.
+#
+# Este módulo valida el formato de forma INCREMENTAL para encontrar
+# el punto de ruptura:
+#   - JPEG: decodificación Huffman del scan (código inválido, índice
+#           de coeficiente > 63, marcador inesperado o RST fuera de orden)
+#   - PNG : CRC de cada chunk (o cabecera de chunk imposible)
+#
+# Después busca el bloque de continuación hacia adelante, dentro de
+# una ventana (max_gap), solo en bloques libres según el bitmap de
+# bloques y descartando en bloque con filtros baratos (ceros, firma de
+# otro archivo, marcadores JPEG imposibles). Cada candidato se valida
+# retomando el decodificador desde un punto de control cercano a la
+# ruptura, así que nunca se vuelve a decodificar el archivo entero y
+# el coste es lineal en el número de candidatos (no cuadrático).
+#
+# Limitaciones: solo fragmentos alineados a bloque y hacia adelante,
+# solo JPEG baseline (los progresivos se reportan "unsupported"). Si
+# el hueco contiene entropía de otro JPEG con las mismas tablas
+# Huffman, el código se resincroniza y una continuación falsa puede
+# decodificar sin error: el resultado queda como "unresolved".
+# ------------------------------------------------------------
+DEFAULT_BLOCK_SIZE = 4096
+DEFAULT_MAX_SIZE = 20 * 1024 * 1024      # tamaño máximo de un archivo reensamblado
+DEFAULT_MAX_GAP = 32 * 1024 * 1024       # ventana de búsqueda tras cada ruptura
+DEFAULT_MAX_FRAGMENTS = 8
+MAX_CANDIDATES = 4096                    # candidatos (tras el prefiltro) por ruptura
+JPEG_TEST_BYTES = 8192                   # bytes que debe decodificar un candidato JPEG
+JPEG_ERROR_LAG = 16                      # bloques entre la ruptura real y el error detectado
+CHECKPOINT_STEP = 1024                   # bytes entre puntos de control del decodificador
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_HEADER_NEED = 1024 * 1024            # bytes leídos si la ruptura cae en una cabecera de chunk
+
+# Un 0xFF dentro de datos JPEG solo puede ir seguido de 00 (relleno),
+# RST0-7 o EOI: cualquier otro marcador descarta el bloque candidato
+JPEG_BAD_MARKER = re.compile(rb"\xff[^\x00\xd0-\xd7\xd9\xff]")
+
+
+# ------------------------------------------------------------
+# Validación JPEG (baseline, Huffman)
+# ------------------------------------------------------------
+class _JpegStop(Exception):
+    def __init__(self, status, pos):
+        self.status = status
+        self.pos = pos
+
+
+def _huffman_lookup(counts, symbols):
+    """
+    Tabla de decodificación directa de 65536 entradas indexada por los
+    16 bits siguientes del flujo: (longitud << 8) | símbolo, o 0 si
+    ningún código empieza así.
+    """
+    table = [0] * 65536
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            if code >= 1 << length:
+                raise ValueError("invalid huffman table")
+            first = code << (16 - length)
+            entry = (length << 8) | symbols[k]
+            table[first:first + (1 << (16 - length))] = [entry] * (1 << (16 - length))
+            code += 1
+            k += 1
+        code <<= 1
+    return table
+
+
+def _parse_dht(seg, tables):
+    pos = 0
+    while pos < len(seg):
+        if pos + 17 > len(seg):
+            raise ValueError("truncated DHT")
+        tc, th = seg[pos] >> 4, seg[pos] & 0xF
+        counts = seg[pos + 1:pos + 17]
+        total = sum(counts)
+        if tc > 1 or th > 3 or total > 256 or pos + 17 + total > len(seg):
+            raise ValueError("invalid DHT")
+        tables[(tc, th)] = _huffman_lookup(counts, seg[pos + 17:pos + 17 + total])
+        pos += 17 + total
+
+
+def _parse_sof(seg):
+    if len(seg) < 6:
+        raise ValueError("truncated SOF")
+    precision, height, width, ncomp = struct.unpack_from(">BHHB", seg, 0)
+    if precision not in (8, 12) or width == 0 or height == 0 \
+            or not 1 <= ncomp <= 4 or len(seg) < 6 + 3 * ncomp:
+        raise ValueError("invalid SOF")
+    comps = {}
+    for i in range(ncomp):
+        cid, hv, _tq = struct.unpack_from(">BBB", seg, 6 + 3 * i)
+        h, v = hv >> 4, hv & 0xF
+        if not (1 <= h <= 4 and 1 <= v <= 4):
+            raise ValueError("invalid sampling factors")
+        comps[cid] = (h, v)
+    return {"width": width, "height": height, "comps": comps,
+            "hmax": max(h for h, _v in comps.values()),
+            "vmax": max(v for _h, v in comps.values())}
+
+
+def _parse_sos(seg, frame, tables):
+    if frame is None or len(seg) < 1:
+        raise ValueError("SOS before SOF")
+    ns = seg[0]
+    if not 1 <= ns <= 4 or len(seg) < 4 + 2 * ns:
+        raise ValueError("invalid SOS")
+    ss, se, a = seg[1 + 2 * ns], seg[2 + 2 * ns], seg[3 + 2 * ns]
+    if (ss, se, a) != (0, 63, 0):
+        raise ValueError("invalid SOS")
+
+    blocks = []
+    for i in range(ns):
+        cid, t = seg[1 + 2 * i], seg[2 + 2 * i]
+        if cid not in frame["comps"] or (0, t >> 4) not in tables or (1, t & 0xF) not in tables:
+            raise ValueError("SOS references unknown component or table")
+        h, v = frame["comps"][cid]
+        pair = (tables[(0, t >> 4)], tables[(1, t & 0xF)])
+        blocks.extend([pair] * (h * v if ns > 1 else 1))
+
+    hmax, vmax = frame["hmax"], frame["vmax"]
+    if ns > 1:
+        total = -(-frame["width"] // (8 * hmax)) * -(-frame["height"] // (8 * vmax))
+    else:
+        h, v = frame["comps"][seg[1]]
+        total = -(-(-(-frame["width"] * h // hmax)) // 8) * -(-(-(-frame["height"] * v // vmax)) // 8)
+    return {"blocks": blocks, "total": total}
+
+
+def _decode_scan(data, scan, restart, state, limit, checkpoints, ctx):
+    """
+    Decodifica (sin reconstruir píxeles) el flujo Huffman de un scan.
+    state = (pos, bitbuf, bitcnt, mcu, rst_next). Retorna la posición
+    del marcador que sigue al scan o lanza _JpegStop.
+    """
+    pos, bitbuf, bitcnt, mcu, rst_next = state
+    n = len(data)
+    total = scan["total"]
+    blocks = scan["blocks"]
+    marker_pos = None
+    eod = False
+
+    def fill():
+        # Carga bytes hasta tener > 24 bits, deshaciendo el relleno FF00
+        # y deteniéndose en el primer marcador
+        nonlocal pos, bitbuf, bitcnt, marker_pos, eod
+        while bitcnt <= 24 and marker_pos is None and not eod:
+            if pos >= n:
+                eod = True
+                break
+            b = data[pos]
+            if b == 0xFF:
+                if pos + 1 >= n:
+                    eod = True
+                    break
+                nb = data[pos + 1]
+                if nb == 0:
+                    pos += 2
+                elif nb == 0xFF:
+                    pos += 1
+                    continue
+                else:
+                    marker_pos = pos
+                    break
+            else:
+                pos += 1
+            bitbuf = ((bitbuf << 8) | b) & 0xFFFFFFFF
+            bitcnt += 8
+
+    def fail():
+        if eod:
+            raise _JpegStop("truncated", n)
+        if marker_pos is not None:
+            raise _JpegStop("error", marker_pos)
+        raise _JpegStop("error", pos - bitcnt // 8)
+
+    while mcu < total:
+        if restart and mcu and mcu % restart == 0:
+            # Fin de intervalo: solo relleno y después RSTn en orden
+            fill()
+            if marker_pos is None or bitcnt >= 8:
+                if eod:
+                    raise _JpegStop("truncated", n)
+                raise _JpegStop("error", pos - bitcnt // 8)
+            if data[marker_pos + 1] != 0xD0 + rst_next:
+                raise _JpegStop("error", marker_pos)
+            pos = marker_pos + 2
+            bitbuf = bitcnt = 0
+            marker_pos = None
+            rst_next = (rst_next + 1) & 7
+
+        if limit is not None and pos >= limit:
+            raise _JpegStop("limit", pos)
+        if checkpoints is not None and marker_pos is None and not eod \
+                and (not checkpoints or pos - checkpoints[-1][0] >= CHECKPOINT_STEP):
+            checkpoints.append((pos, bitbuf, bitcnt, mcu, rst_next, scan, ctx))
+
+        for dc, ac in blocks:
+            # Coeficiente DC: categoría (Huffman) + bits adicionales
+            if bitcnt < 16:
+                fill()
+            peek = (bitbuf >> (bitcnt - 16)) & 0xFFFF if bitcnt >= 16 else (bitbuf << (16 - bitcnt)) & 0xFFFF
+            e = dc[peek]
+            length = e >> 8
+            if length == 0 or length > bitcnt:
+                fail()
+            bitcnt -= length
+            s = e & 0xFF
+            if s > 11:
+                raise _JpegStop("error", pos - bitcnt // 8)
+            if s:
+                if bitcnt < s:
+                    fill()
+                    if s > bitcnt:
+                        fail()
+                bitcnt -= s
+
+            # Coeficientes AC: (run, size) hasta EOB o el coeficiente 63
+            k = 1
+            while k < 64:
+                if bitcnt < 16:
+                    fill()
+                peek = (bitbuf >> (bitcnt - 16)) & 0xFFFF if bitcnt >= 16 else (bitbuf << (16 - bitcnt)) & 0xFFFF
+                e = ac[peek]
+                length = e >> 8
+                if length == 0 or length > bitcnt:
+                    fail()
+                bitcnt -= length
+                r, s = (e >> 4) & 0xF, e & 0xF
+                if s == 0:
+                    if r != 15:
+                        break            # EOB
+                    k += 16
+                    continue
+                k += r
+                if k > 63 or s > 10:
+                    raise _JpegStop("error", pos - bitcnt // 8)
+                if bitcnt < s:
+                    fill()
+                    if s > bitcnt:
+                        fail()
+                bitcnt -= s
+                k += 1
+            if k > 64:
+                raise _JpegStop("error", pos - bitcnt // 8)
+        mcu += 1
+
+    # Tras la última MCU solo puede haber relleno y un marcador
+    fill()
+    if marker_pos is None or bitcnt >= 8:
+        if eod:
+            raise _JpegStop("truncated", n)
+        raise _JpegStop("error", pos - bitcnt // 8)
+    return marker_pos
+
+
+def validate_jpeg(data, limit=None, resume=None):
+    """
+    Valida un JPEG baseline de forma incremental.
+
+    Parámetros:
+      data   : bytes del archivo (a partir de FFD8)
+      limit  : detenerse (con éxito) al superar este offset
+      resume : punto de control de una validación anterior desde el
+               que continuar (ver "checkpoints")
+
+    Retorna un dict:
+      - status      : complete | error | truncated | limit | unsupported
+      - pos         : fin del archivo (complete) o posición del error
+      - checkpoints : estados del decodificador cada ~CHECKPOINT_STEP bytes
+    """
+    checkpoints = []
+
+    def result(status, pos):
+        return {"status": status, "pos": pos, "checkpoints": checkpoints}
+
+    n = len(data)
+    if resume is None:
+        if data[:2] != b"\xff\xd8":
+            return result("error", 0)
+        ctx = {"tables": {}, "frame": None, "restart": 0}
+        pos = 2
+    else:
+        pos, bitbuf, bitcnt, mcu, rst_next, scan, ctx = resume
+        ctx = dict(ctx, tables=dict(ctx["tables"]))
+        try:
+            pos = _decode_scan(data, scan, ctx["restart"], (pos, bitbuf, bitcnt, mcu, rst_next),
+                               limit, checkpoints, ctx)
+        except _JpegStop as stop:
+            return result(stop.status, stop.pos)
+
+    while True:
+        if limit is not None and pos >= limit:
+            return result("limit", pos)
+        if pos + 2 > n:
+            return result("truncated", n)
+        if data[pos] != 0xFF:
+            return result("error", pos)
+        m = data[pos + 1]
+        if m == 0xFF:                   # relleno antes de un marcador
+            pos += 1
+            continue
+        if m == 0xD9:
+            return result("complete", pos + 2)
+        if m in (0x00, 0x01, 0xD8) or 0xD0 <= m <= 0xD7:
+            return result("error", pos)
+        if pos + 4 > n:
+            return result("truncated", n)
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        end = pos + 2 + length
+        if length < 2:
+            return result("error", pos)
+        if end > n:
+            return result("truncated", n)
+        seg = data[pos + 4:end]
+
+        try:
+            if m in (0xC0, 0xC1):
+                ctx["frame"] = _parse_sof(seg)
+            elif 0xC2 <= m <= 0xCF and m not in (0xC4, 0xC8, 0xCC):
+                # Progresivo, sin pérdida o aritmético: no se valida
+                return result("unsupported", pos)
+            elif m == 0xC4:
+                _parse_dht(seg, ctx["tables"])
+            elif m == 0xDD:
+                if length != 4:
+                    raise ValueError("invalid DRI")
+                ctx["restart"] = struct.unpack_from(">H", seg)[0]
+            elif m == 0xDA:
+                scan = _parse_sos(seg, ctx["frame"], ctx["tables"])
+                # Copia de las tablas: un DHT posterior no altera los checkpoints
+                snapshot = dict(ctx, tables=dict(ctx["tables"]))
+                end = _decode_scan(data, scan, ctx["restart"], (end, 0, 0, 0, 0),
+                                   limit, checkpoints, snapshot)
+        except ValueError:
+            return result("error", pos)
+        except _JpegStop as stop:
+            return result(stop.status, stop.pos)
+        pos = end
+
+
+# ------------------------------------------------------------
+# Validación PNG (CRC por chunk)
+# ------------------------------------------------------------
+def _png_header_ok(data, pos):
+    """
+    Cabecera de chunk plausible: longitud < 2^31 y tipo de 4 letras ASCII
+    con el bit reservado (tercera letra) en mayúscula.
+    """
+    if pos + 8 > len(data):
+        return False
+    length = struct.unpack_from(">I", data, pos)[0]
+    ctype = data[pos + 4:pos + 8]
+    return length < 0x80000000 and ctype.isalpha() and ctype.isascii() and 65 <= ctype[2] <= 90
+
+
+def validate_png(data, start=8, limit=None):
+    """
+    Valida un PNG chunk a chunk (cabecera + CRC) desde 'start'.
+
+    Retorna un dict:
+      - status      : complete | error | truncated | limit
+      - pos         : fin del archivo (complete) o inicio del chunk erróneo
+      - chunk_end   : fin del chunk erróneo (solo si falló el CRC)
+    """
+    if data[:8] != PNG_SIGNATURE:
+        return {"status": "error", "pos": 0, "chunk_end": None}
+
+    n = len(data)
+    pos = start
+    while True:
+        if limit is not None and pos >= limit:
+            return {"status": "limit", "pos": pos, "chunk_end": None}
+        if pos + 8 > n:
+            return {"status": "truncated", "pos": n, "chunk_end": None}
+        if not _png_header_ok(data, pos) or (pos == 8 and data[12:16] != b"IHDR"):
+            return {"status": "error", "pos": pos, "chunk_end": None}
+        length = struct.unpack_from(">I", data, pos)[0]
+        end = pos + 12 + length
+        if end > n:
+            return {"status": "truncated", "pos": n, "chunk_end": None}
+        if zlib.crc32(data[pos + 4:pos + 8 + length]) != struct.unpack_from(">I", data, end - 4)[0]:
+            return {"status": "error", "pos": pos, "chunk_end": end}
+        if data[pos + 4:pos + 8] == b"IEND":
+            return {"status": "complete", "pos": end, "chunk_end": None}
+        pos = end
+
+
+# ------------------------------------------------------------
+# Búsqueda de candidatos
+# ------------------------------------------------------------
+def _load_bitmap(image_path):
+    """
+    Bitmap de bloques y tamaño de bloque si la imagen es EXT; si no,
+    (None, DEFAULT_BLOCK_SIZE) y se consideran todos los bloques.
+    """
+    try:
+        sb = read_superblock(image_path)
+        return BlockBitmap(image_path, sb, read_group_descriptors(image_path, sb)), sb["s_block_size"]
+    except (ValueError, IndexError):
+        return None, DEFAULT_BLOCK_SIZE
+
+
+def _candidate_blocks(window, window_off, block_size, fmt, used, bitmap):
+    """
+    Prefiltro por bloque sobre la ventana ya leída. Descarta:
+      - bloques usados por fragmentos anteriores del archivo
+      - bloques asignados según el bitmap (si se usa)
+      - bloques de ceros o de un único byte repetido
+      - bloques que empiezan con la firma de otro archivo
+      - JPEG: bloques con un marcador imposible dentro de datos Huffman
+    Genera offsets (relativos a la ventana) de los candidatos.
+    """
+    signatures = [s["sig"] for s in SIGNATURES]
+    found = 0
+    for rel in range(0, len(window) - block_size + 1, block_size):
+        absolute = window_off + rel
+        if any(start <= absolute < start + length for start, length in used):
+            continue
+        if bitmap is not None and bitmap.allocated(absolute // block_size, 1):
+            continue
+        blk = window[rel:rel + block_size]
+        if blk.count(blk[:1]) == block_size:
+            continue
+        if any(blk.startswith(sig) for sig in signatures):
+            continue
+        if fmt == "jpeg":
+            m = JPEG_BAD_MARKER.search(blk)
+            eoi = blk.find(b"\xff\xd9")
+            if m is not None and (eoi == -1 or m.start() < eoi):
+                continue
+        yield rel
+        found += 1
+        if found >= MAX_CANDIDATES:
+            return
+
+
+def _fragment_map(fragments, size):
+    """
+    Convierte [(inicio_en_archivo, offset_en_imagen), ...] en
+    tramos [(offset_en_imagen, longitud), ...].
+    """
+    out = []
+    for i, (start, img_off) in enumerate(fragments):
+        end = fragments[i + 1][0] if i + 1 < len(fragments) else size
+        if end > start:
+            out.append((img_off, end - start))
+    return out
+
+
+def _aligned_breaks(fragments, lo, hi, block_size):
+    """
+    Rupturas posibles en [lo, hi] (de mayor a menor): posiciones del
+    archivo que caen en frontera de bloque de la imagen. Todas están en
+    el último fragmento, así que se calculan aritméticamente.
+    """
+    start, img_off = fragments[-1]
+    base = img_off - start              # offset_en_imagen = k + base
+    top = hi - (hi + base) % block_size
+    return list(range(top, lo - 1, -block_size))
+
+
+# ------------------------------------------------------------
+# reassemble()
+# ------------------------------------------------------------
+def detect_format(data):
+    if data.startswith(PNG_SIGNATURE):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    return None
+
+
+def reassemble(image_path, offset, max_size=DEFAULT_MAX_SIZE, max_gap=DEFAULT_MAX_GAP,
+               max_fragments=DEFAULT_MAX_FRAGMENTS, free_only=True):
+    """
+    Reconstruye un JPEG o PNG que empieza en 'offset' aunque esté
+    fragmentado.
+
+    Parámetros:
+      image_path    : ruta a la imagen
+      offset        : inicio del archivo (resultado de scan_for_signatures)
+      max_size      : tamaño máximo del archivo reensamblado
+      max_gap       : bytes a explorar tras cada ruptura buscando la continuación
+      max_fragments : fragmentos máximos
+      free_only     : si el inicio está en espacio libre, buscar la
+                      continuación solo en bloques libres (bitmap EXT)
+
+    Supuestos: los fragmentos empiezan en frontera de bloque y cada
+    continuación está DESPUÉS de la ruptura (como suele asignar ext4).
+    En PNG, un mismo chunk no puede estar partido en más de dos fragmentos.
+
+    Retorna un dict:
+      - offset, format
+      - status    : complete | truncated | unresolved | unsupported | invalid
+      - size      : bytes del archivo reensamblado
+      - fragments : [(offset_en_imagen, longitud), ...]
+    """
+    d = DiskImage(image_path)
+    image_size = d.size
+    data = d.read(offset, min(max_size, image_size - offset))
+    fmt = detect_format(data)
+    if fmt is None:
+        return {"offset": offset, "format": None, "status": "invalid", "size": 0, "fragments": []}
+
+    bitmap, bs = _load_bitmap(image_path)
+    if bitmap is not None and (not free_only or bitmap.allocated(offset // bs, 1)):
+        bitmap = None
+
+    fragments = [(0, offset)]
+    checkpoints = []
+
+    def done(status, size):
+        return {"offset": offset, "format": fmt, "status": status, "size": size,
+                "fragments": _fragment_map(fragments, size)}
+
+    v = validate_jpeg(data) if fmt == "jpeg" else validate_png(data)
+    if fmt == "jpeg":
+        checkpoints = v["checkpoints"]
+
+    while True:
+        if v["status"] == "complete":
+            return done("complete", v["pos"])
+        if v["status"] == "unsupported":
+            return done("unsupported", len(data))
+        if v["status"] == "truncated":
+            return done("truncated", len(data))
+        if len(fragments) >= max_fragments:
+            return done("unresolved", v["pos"])
+
+        # Rupturas posibles: fronteras de bloque antes del error
+        err = v["pos"]
+        if fmt == "png":
+            lo = err
+            hi = v["chunk_end"] - 1 if v["chunk_end"] else err + 8
+        else:
+            lo, hi = max(1, err - JPEG_ERROR_LAG * bs), err
+        lo = max(lo, fragments[-1][0] + 1)
+        breaks = _aligned_breaks(fragments, lo, hi, bs)
+
+        found = _search_continuation(d, data, fmt, breaks, fragments, checkpoints,
+                                     bs, bitmap, max_gap, image_size, v)
+        if found is None:
+            # Sin continuación: se conserva la parte validada
+            return done("unresolved", breaks[-1] if breaks else err)
+
+        k, cont_off = found
+        fragments = [f for f in fragments if f[0] < k] + [(k, cont_off)]
+        data = data[:k] + d.read(cont_off, min(max_size - k, image_size - cont_off))
+
+        # Revalidar solo desde antes de la ruptura, no desde el principio
+        if fmt == "png":
+            v = validate_png(data, start=v["pos"])
+        else:
+            checkpoints = [c for c in checkpoints if c[0] <= k]
+            v = validate_jpeg(data, resume=checkpoints[-1]) if checkpoints else validate_jpeg(data)
+            checkpoints = checkpoints + v["checkpoints"]
+
+
+def _search_continuation(d, data, fmt, breaks, fragments, checkpoints, bs, bitmap,
+                         max_gap, image_size, v):
+    """
+    Prueba cada ruptura k (de la más cercana al error a la más lejana)
+    contra los bloques candidatos que siguen al fragmento actual.
+
+    La ventana se lee y se prefiltra UNA sola vez para todas las
+    rupturas; cada ruptura solo considera los candidatos posteriores a
+    ella (nunca la continuación contigua, que ya se sabe inválida).
+
+    Retorna (k, offset_continuación) o None.
+    """
+    if not breaks:
+        return None
+
+    # Bytes que necesita un candidato para validarse
+    if fmt == "png":
+        # Resto del chunk roto + la cabecera siguiente; si se rompió la
+        # cabecera, hay que leer el chunk entero desde la ruptura
+        need = (v["chunk_end"] - min(breaks) + 8) if v["chunk_end"] else PNG_HEADER_NEED
+    else:
+        need = JPEG_TEST_BYTES
+    if need > DEFAULT_MAX_SIZE:
+        return None
+
+    # Todas las rupturas caen en el último fragmento: offsets lineales
+    base = fragments[-1][1] - fragments[-1][0]
+    first_k = min(breaks)
+    win_off = first_k + base
+    span = max(breaks) - first_k
+    window = d.read(win_off, min(span + max_gap + need, image_size - win_off))
+    used = _fragment_map(fragments, first_k)
+    candidates = list(_candidate_blocks(window, win_off, bs, fmt, used, bitmap))
+
+    if fmt == "png":
+        return _png_search(data, window, win_off, candidates, breaks, base, bs, max_gap, v)
+
+    for k in breaks:
+        k_off = k + base
+
+        # Punto de control del decodificador JPEG anterior a la ruptura
+        i = bisect_right([c[0] for c in checkpoints], k) - 1
+        cp = checkpoints[i] if i >= 0 else None
+
+        for rel in candidates:
+            if win_off + rel <= k_off or rel - (k_off - win_off) > max_gap:
+                continue
+            cand = window[rel:rel + need]
+
+            # JPEG: retomar el decodificador desde el checkpoint y exigir
+            # que decodifique sin errores la mitad de los bytes de prueba.
+            # Solo se copia desde el checkpoint (posiciones desplazadas)
+            if cp:
+                joined = data[cp[0]:k] + cand
+                nv = validate_jpeg(joined, limit=k - cp[0] + need // 2, resume=(0,) + cp[1:])
+            else:
+                joined = data[:k] + cand
+                nv = validate_jpeg(joined, limit=k + need // 2)
+            if nv["status"] in ("limit", "complete"):
+                return k, win_off + rel
+    return None
+
+
+def _png_search(data, window, win_off, candidates, breaks, base, bs, max_gap, v):
+    """
+    Busca la continuación de un chunk PNG roto.
+
+    Todo se evalúa sobre la ventana sin copiarla. Si la ruptura cae en
+    los datos del chunk, la cabecera del chunk siguiente queda siempre
+    en la misma posición dentro del bloque: se buscan una sola vez las
+    posiciones con una cabecera plausible y solo los candidatos que
+    encajan con alguna pagan el CRC del resto del chunk (continuando
+    el CRC del prefijo, que se extiende de forma incremental entre
+    rupturas consecutivas).
+    """
+    chunk, chunk_end = v["pos"], v["chunk_end"]
+    mv = memoryview(window)
+    n = len(window)
+
+    # CRC del chunk desde su tipo hasta cada ruptura (en orden creciente)
+    prefix = {}
+    if chunk_end:
+        crc, pos = 0, chunk + 4
+        for k in sorted(breaks):
+            if k >= chunk + 8:
+                crc = zlib.crc32(data[pos:k], crc)
+                pos = k
+                prefix[k] = crc
+
+        # Fin del chunk roto = inicio del siguiente (o fin de la ventana)
+        phase = (chunk_end + base) % bs
+        headers = [p for p in range(phase, n + 1, bs) if p + 8 > n or (
+            _png_header_ok(window, p) and struct.unpack_from(">I", window, p)[0] < DEFAULT_MAX_SIZE)]
+    cand_set = set(candidates)
+
+    for k in breaks:
+        k_rel = k + base - win_off
+        if k in prefix:
+            rest = chunk_end - k             # bytes del chunk que faltan (CRC incluido)
+            for p in headers:
+                rel = p - rest
+                if rel <= k_rel or rel - k_rel > max_gap or rel not in cand_set:
+                    continue
+                if zlib.crc32(mv[rel:p - 4], prefix[k]) == struct.unpack_from(">I", window, p - 4)[0]:
+                    return k, win_off + rel
+            continue
+
+        for rel in candidates:
+            if rel <= k_rel or rel - k_rel > max_gap:
+                continue
+            if _png_header_break_ok(data, window, mv, rel, chunk, k):
+                return k, win_off + rel
+    return None
+
+
+def _png_header_break_ok(data, window, mv, rel, chunk, k):
+    """
+    La ruptura cae dentro de la cabecera del chunk (quedan p < 8 bytes
+    de ella en el fragmento anterior): se valida el chunk completo.
+    """
+    p = k - chunk
+    if rel + 8 - p > len(window):
+        return False
+    header = data[chunk:k] + window[rel:rel + 8 - p]
+    if not _png_header_ok(header, 0):
+        return False
+    end = rel + 12 + struct.unpack_from(">I", header, 0)[0] - p
+    if end > len(window):
+        return False
+    if p >= 4:
+        crc = zlib.crc32(mv[rel:end - 4], zlib.crc32(data[chunk + 4:k]))
+    else:
+        crc = zlib.crc32(mv[rel + 4 - p:end - 4])
+    return crc == struct.unpack_from(">I", window, end - 4)[0]
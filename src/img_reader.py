@@ -1,17 +1,247 @@
-import os, struct
+import os, struct, threading, time
+
+# ------------------------------------------------------------
+# Control de ancho de banda / IOPS para lecturas de la imagen
+#
+# Cuando la imagen vive en un volumen compartido (SAN de producción),
+# un escaneo sin límites compite con la carga real. ReadThrottle es un
+# token bucket de bytes/s y operaciones/s; en modo adaptativo reduce
+# el ritmo cuando la latencia de lectura observada sube.
+# ------------------------------------------------------------
+class ReadThrottle:
+    """
+    Token bucket para lecturas.
+
+    Parámetros:
+      max_bytes_per_sec : límite de ancho de banda (None = sin límite)
+      max_iops          : límite de lecturas por segundo (None = sin límite)
+      adaptive          : si es True, baja el ritmo cuando la latencia
+                          por MB supera BACKOFF_FACTOR veces la mínima
+                          observada y lo recupera poco a poco después
+      burst_seconds     : ráfaga permitida (capacidad del bucket)
+    """
+
+    BACKOFF_FACTOR = 2.0     # latencia actual / latencia base que dispara el backoff
+    BACKOFF_STEP = 0.7       # multiplicador del ritmo en cada backoff
+    RECOVER_STEP = 1.05      # multiplicador del ritmo al recuperarse
+    ADJUST_INTERVAL = 0.5    # segundos mínimos entre ajustes
+    MIN_FRACTION = 0.05      # el ritmo nunca baja de este % del máximo
+
+    def __init__(self, max_bytes_per_sec=None, max_iops=None, adaptive=False, burst_seconds=0.25):
+        self.max_rate = max_bytes_per_sec
+        self.rate = max_bytes_per_sec
+        self.max_iops = max_iops
+        self.adaptive = adaptive
+        self.burst_seconds = burst_seconds
+
+        self.byte_tokens = (self.rate or 0) * burst_seconds
+        self.op_tokens = (max_iops or 0) * burst_seconds
+        self.last = time.monotonic()
+
+        # Estado del modo adaptativo (segundos por MB)
+        self.ewma_latency = None
+        self.base_latency = None
+        self.ewma_throughput = None
+        self.last_adjust = self.last
+
+        # El throttle global se comparte entre los hilos del pipeline de
+        # recover-deleted: el estado del bucket se modifica bajo este lock
+        # (nunca se mantiene durante el sleep)
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # El lock no se puede serializar (el throttle viaja a los pools)
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def split(self, parts):
+        """
+        Reparte el límite entre 'parts' procesos (por ejemplo, un pool),
+        para que el total agregado respete el límite configurado.
+        """
+        parts = max(1, parts)
+        return ReadThrottle(
+            self.max_rate / parts if self.max_rate else None,
+            self.max_iops / parts if self.max_iops else None,
+            self.adaptive, self.burst_seconds
+        )
+
+    def acquire(self, nbytes):
+        """
+        Bloquea (sleep) hasta que haya tokens para leer nbytes en 1 operación.
+        Los tokens pueden quedar negativos: la deuda se paga en la siguiente.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last
+            self.last = now
+
+            wait = 0.0
+            if self.rate:
+                cap = self.rate * self.burst_seconds
+                self.byte_tokens = min(cap, self.byte_tokens + elapsed * self.rate) - nbytes
+                if self.byte_tokens < 0:
+                    wait = -self.byte_tokens / self.rate
+            if self.max_iops:
+                cap = self.max_iops * self.burst_seconds
+                self.op_tokens = min(cap, self.op_tokens + elapsed * self.max_iops) - 1
+                if self.op_tokens < 0:
+                    wait = max(wait, -self.op_tokens / self.max_iops)
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def observe(self, latency, nbytes):
+        """
+        Registra la latencia de una lectura (modo adaptativo).
+        """
+        if not self.adaptive or nbytes <= 0 or latency <= 0:
+            return
+
+        with self.lock:
+            self._observe(latency, nbytes)
+
+    def _observe(self, latency, nbytes):
+        per_mb = latency * (1024 * 1024) / max(nbytes, 4096)
+        alpha = 0.2
+        self.ewma_latency = per_mb if self.ewma_latency is None else \
+            (1 - alpha) * self.ewma_latency + alpha * per_mb
+        throughput = nbytes / latency
+        self.ewma_throughput = throughput if self.ewma_throughput is None else \
+            (1 - alpha) * self.ewma_throughput + alpha * throughput
+
+        # La latencia base es la mínima observada (sube muy despacio para
+        # adaptarse si el almacenamiento cambia)
+        if self.base_latency is None or self.ewma_latency < self.base_latency:
+            self.base_latency = self.ewma_latency
+        else:
+            self.base_latency *= 1.001
+
+        now = time.monotonic()
+        if now - self.last_adjust < self.ADJUST_INTERVAL:
+            return
+        self.last_adjust = now
+
+        if self.ewma_latency > self.base_latency * self.BACKOFF_FACTOR:
+            # Sin límite configurado se parte del rendimiento observado
+            current = self.rate or self.ewma_throughput
+            floor = (self.max_rate or self.ewma_throughput) * self.MIN_FRACTION
+            self.rate = max(floor, current * self.BACKOFF_STEP)
+        elif self.rate:
+            self.rate *= self.RECOVER_STEP
+            if self.max_rate:
+                self.rate = min(self.rate, self.max_rate)
+
+
+# Límite por defecto para todas las lecturas (configurado desde cli.py)
+_default_throttle = None
+
+
+def set_default_throttle(throttle):
+    global _default_throttle
+    _default_throttle = throttle
+
+
+def get_default_throttle():
+    return _default_throttle
+
+
+# ------------------------------------------------------------
+# ThrottledFile
+# ------------------------------------------------------------
+class ThrottledFile:
+    """
+    Archivo binario de solo lectura que aplica un ReadThrottle y
+    posix_fadvise (cuando el sistema lo soporta):
+
+      - SEQUENTIAL : read-ahead más agresivo para escaneos lineales
+      - DONTNEED   : libera de la page cache lo ya leído, para no
+                     desalojar la caché de la que dependen otros procesos
+    """
+
+    DROP_BATCH = 8 * 1024 * 1024   # bytes leídos antes de liberar la caché
+
+    def __init__(self, path, throttle=None, sequential=True, drop_cache=True):
+        self.f = open(path, "rb")
+        self.throttle = throttle
+        self.fadvise = hasattr(os, "posix_fadvise")
+        self.drop_cache = drop_cache and self.fadvise
+        self._drop_start = None
+        self._drop_end = None
+
+        if sequential and self.fadvise:
+            os.posix_fadvise(self.f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def read(self, size=-1):
+        pos = self.f.tell()
+        if self.throttle is not None and size > 0:
+            self.throttle.acquire(size)
+
+        t0 = time.monotonic()
+        data = self.f.read(size)
+        if self.throttle is not None:
+            if size < 0:
+                self.throttle.acquire(len(data))
+            self.throttle.observe(time.monotonic() - t0, len(data))
+
+        if self.drop_cache and data:
+            self._track(pos, pos + len(data))
+        return data
+
+    def _track(self, start, end):
+        # Se acumulan tramos contiguos para no hacer un fadvise por lectura
+        if self._drop_end != start:
+            self._flush_drop()
+            self._drop_start = start
+        self._drop_end = end
+        if self._drop_end - self._drop_start >= self.DROP_BATCH:
+            self._flush_drop()
+
+    def _flush_drop(self):
+        if self._drop_start is not None and self._drop_end > self._drop_start:
+            os.posix_fadvise(self.f.fileno(), self._drop_start,
+                             self._drop_end - self._drop_start, os.POSIX_FADV_DONTNEED)
+        self._drop_start = self._drop_end = None
+
+    def seek(self, offset, whence=0):
+        return self.f.seek(offset, whence)
+
+    def tell(self):
+        return self.f.tell()
+
+    def close(self):
+        if not self.f.closed:
+            if self.drop_cache:
+                self._flush_drop()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 class DiskImage:
     """
     Representa una imagen de disco RAW (por ejemplo, un archivo .img).
     Proporciona métodos seguros para:
-      - leer por offset
+      - leer por offset (respetando el límite de lectura configurado)
+      - abrir la imagen para lecturas secuenciales largas
       - obtener tamaño del archivo
       - extraer el superblock EXT4
     """
 
-    def __init__(self, path):
+    def __init__(self, path, throttle=None):
         self.path = path
         self._size = None
+        # Si no se indica, se usa el límite global configurado por el CLI
+        self.throttle = throttle if throttle is not None else get_default_throttle()
 
         # Verificación básica: ¿el archivo existe?
         if not os.path.exists(path):
@@ -36,11 +266,20 @@ class DiskImage:
         if offset < 0 or size < 0:
             raise ValueError("offset and size must be non-negative")
 
-        # Abrimos el archivo en modo binario y buscamos el offset exacto
-        with open(self.path, "rb") as f:
+        # Abrimos el archivo en modo binario y buscamos el offset exacto.
+        # Lecturas puntuales (metadatos): sin read-ahead secuencial ni DONTNEED
+        with self.open(sequential=False, drop_cache=False) as f:
             f.seek(offset)
             return f.read(size)
 
+    # ------------------------------------------------------------
+    # open()
+    # Abre la imagen para lecturas largas (escaneos, extracción),
+    # aplicando el límite de lectura y los hints de fadvise.
+    # ------------------------------------------------------------
+    def open(self, sequential=True, drop_cache=True):
+        return ThrottledFile(self.path, self.throttle, sequential, drop_cache)
+
     # ------------------------------------------------------------
     # read_superblock()
     # Lee el superblock EXT4 desde offset fijo 1024.
@@ -0,0 +1,350 @@
+# src/journal.py
+import struct
+from bisect import bisect_right
+from .img_reader import DiskImage
+from .ext4_parser import read_superblock, read_inode, inode_block_runs, \
+    locate_inode, parse_inode_bytes
+from .checksums import csum_seed, inode_checksum_ok
+
+# ------------------------------------------------------------
+# Constantes del journal JBD2 (ext3/ext4)
+#
+# OJO: a diferencia del resto de EXT4, todas las estructuras
+# del journal están en BIG-ENDIAN.
+# ------------------------------------------------------------
+JBD2_MAGIC = 0xC03B3998
+
+JBD2_DESCRIPTOR_BLOCK = 1
+JBD2_COMMIT_BLOCK     = 2
+JBD2_SUPERBLOCK_V1    = 3
+JBD2_SUPERBLOCK_V2    = 4
+JBD2_REVOKE_BLOCK     = 5
+
+# Flags incompat del superblock del journal
+JBD2_FEATURE_INCOMPAT_REVOKE  = 0x1
+JBD2_FEATURE_INCOMPAT_64BIT   = 0x2
+JBD2_FEATURE_INCOMPAT_CSUM_V2 = 0x8
+JBD2_FEATURE_INCOMPAT_CSUM_V3 = 0x10
+
+# Flags de cada tag del descriptor
+JBD2_FLAG_ESCAPE    = 0x1   # el bloque tenía el magic JBD2 y fue "escapado"
+JBD2_FLAG_SAME_UUID = 0x2   # si NO está, le siguen 16 bytes de UUID
+JBD2_FLAG_DELETED   = 0x4
+JBD2_FLAG_LAST_TAG  = 0x8
+
+# Tamaño de la ventana de lectura al recorrer el journal
+WINDOW_SIZE = 1024 * 1024
+
+
+# ------------------------------------------------------------
+# MAPEO bloque lógico del journal → offset físico en la imagen
+# ------------------------------------------------------------
+class JournalMap:
+    """
+    Traduce bloques lógicos del journal (inodo 8) a offsets absolutos
+    de la imagen, usando los tramos de su árbol de extents.
+    """
+
+    def __init__(self, runs, block_size):
+        self.runs = runs
+        self.block_size = block_size
+        self._starts = [r[0] for r in runs]
+
+    def offset(self, jblock):
+        i = bisect_right(self._starts, jblock) - 1
+        if i >= 0:
+            logical, phys, length = self.runs[i]
+            if jblock < logical + length:
+                return (phys + jblock - logical) * self.block_size
+        raise ValueError(f"journal block {jblock} not mapped")
+
+
+# ------------------------------------------------------------
+# SUPERBLOCK DEL JOURNAL
+# ------------------------------------------------------------
+def read_journal_superblock(path):
+    """
+    Lee el superblock del journal (bloque lógico 0 del inodo de journal).
+
+    Retorna un diccionario con los campos necesarios para recorrerlo:
+      - s_blocksize, s_maxlen, s_first
+      - s_sequence, s_start (0 = journal limpio)
+      - flags de features (64bit, checksums v2/v3, revoke)
+      - journal_map: objeto JournalMap para localizar bloques
+    """
+
+    sb = read_superblock(path)
+    if sb["s_journal_inum"] == 0:
+        raise ValueError("filesystem has no internal journal")
+
+    jinode = read_inode(path, sb["s_journal_inum"])
+    jmap = JournalMap(inode_block_runs(path, jinode), sb["s_block_size"])
+
+    with DiskImage(path).open(sequential=False, drop_cache=False) as f:
+        f.seek(jmap.offset(0))
+        raw = f.read(1024)
+
+    if len(raw) < 1024:
+        raise ValueError("journal superblock truncated")
+
+    magic, blocktype, _seq = struct.unpack_from(">III", raw, 0)
+    if magic != JBD2_MAGIC or blocktype not in (JBD2_SUPERBLOCK_V1, JBD2_SUPERBLOCK_V2):
+        raise ValueError("invalid jbd2 superblock")
+
+    s_blocksize, s_maxlen, s_first, s_sequence, s_start = \
+        struct.unpack_from(">IIIII", raw, 12)
+
+    # Los campos de features solo existen en la versión 2
+    compat = incompat = ro_compat = 0
+    if blocktype == JBD2_SUPERBLOCK_V2:
+        compat, incompat, ro_compat = struct.unpack_from(">III", raw, 0x24)
+
+    return {
+        "s_blocktype": blocktype,
+        "s_blocksize": s_blocksize,
+        "s_maxlen": s_maxlen,
+        "s_first": s_first,
+        "s_sequence": s_sequence,
+        "s_start": s_start,
+        "s_feature_compat": compat,
+        "s_feature_incompat": incompat,
+        "s_feature_ro_compat": ro_compat,
+        "journal_inode": sb["s_journal_inum"],
+        "journal_map": jmap,
+        "superblock": sb
+    }
+
+
+def journal_tag_bytes(incompat):
+    """
+    Tamaño de cada tag del descriptor según las features del journal
+    (misma regla que jbd2_journal_tag_bytes() del kernel).
+    """
+    if incompat & JBD2_FEATURE_INCOMPAT_CSUM_V3:
+        return 16
+    size = 12
+    if incompat & JBD2_FEATURE_INCOMPAT_CSUM_V2:
+        size += 2
+    if incompat & JBD2_FEATURE_INCOMPAT_64BIT:
+        return size
+    return size - 4
+
+
+# ------------------------------------------------------------
+# build_journal_index()
+# ------------------------------------------------------------
+def build_journal_index(path):
+    """
+    Recorre el journal UNA sola vez y construye un índice:
+
+        bloque_fs → [copias registradas en el journal]
+
+    Se procesan:
+      - bloques descriptor : cada tag indica a qué bloque del FS
+                             corresponde el siguiente bloque de datos
+      - bloques commit     : marcan la transacción como confirmada
+      - bloques revoke     : bloques anulados por transacciones posteriores
+
+    El recorrido es lineal sobre todo el área del journal (no solo desde
+    s_start), por lo que también se indexan transacciones antiguas que
+    ya fueron aplicadas: justamente las que contienen versiones previas
+    al borrado de inodos y extents.
+
+    Retorna un dict con:
+      - journal      : superblock del journal
+      - blocks       : {bloque_fs: [entrada, ...]} ordenadas por transacción
+      - transactions : {secuencia: {"committed", "commit_time", "blocks"}}
+      - revoked      : {bloque_fs: secuencia más alta que lo revoca}
+
+    Cada entrada guarda la posición de la copia (no los datos), para que
+    el índice ocupe poca memoria incluso con journals grandes.
+    """
+
+    jsb = read_journal_superblock(path)
+    jmap = jsb["journal_map"]
+    bs = jsb["s_blocksize"]
+    first = jsb["s_first"]
+    maxlen = jsb["s_maxlen"]
+    incompat = jsb["s_feature_incompat"]
+
+    tag_bytes = journal_tag_bytes(incompat)
+    csum = incompat & (JBD2_FEATURE_INCOMPAT_CSUM_V2 | JBD2_FEATURE_INCOMPAT_CSUM_V3)
+    # Con checksums, los últimos 4 bytes del descriptor/revoke son una "tail"
+    tail = 4 if csum else 0
+    record_bytes = 8 if incompat & JBD2_FEATURE_INCOMPAT_64BIT else 4
+
+    blocks = {}
+    transactions = {}
+    revoked = {}
+
+    def wrap(j):
+        # El journal es circular entre s_first y s_maxlen
+        return first + (j - first) % (maxlen - first)
+
+    with DiskImage(path).open() as f:
+        # Ventana de lectura: evita un seek+read por cada bloque
+        cache = {"start": None, "data": b""}
+
+        def read_block(j):
+            off = jmap.offset(j)
+            start = cache["start"]
+            if start is None or not (start <= off and off + bs <= start + len(cache["data"])):
+                f.seek(off)
+                cache["start"] = off
+                cache["data"] = f.read(WINDOW_SIZE)
+                start = off
+            return cache["data"][off - start:off - start + bs]
+
+        j = first
+        while j < maxlen:
+            raw = read_block(j)
+            if len(raw) < 12:
+                break
+
+            magic, blocktype, seq = struct.unpack_from(">III", raw, 0)
+            if magic != JBD2_MAGIC:
+                j += 1
+                continue
+
+            txn = transactions.setdefault(
+                seq, {"committed": False, "commit_time": None, "blocks": 0}
+            )
+
+            if blocktype == JBD2_DESCRIPTOR_BLOCK:
+                pos = 12
+                data_j = j + 1
+                while pos + tag_bytes <= bs - tail:
+                    if tag_bytes == 16:
+                        blocknr, flags, blocknr_hi = struct.unpack_from(">III", raw, pos)
+                    else:
+                        # journal_block_tag_t: blocknr, checksum(16), flags(16), blocknr_high
+                        blocknr, _csum, flags = struct.unpack_from(">IHH", raw, pos)
+                        blocknr_hi = 0
+                        if incompat & JBD2_FEATURE_INCOMPAT_64BIT:
+                            blocknr_hi = struct.unpack_from(">I", raw, pos + 8)[0]
+                    fs_block = (blocknr_hi << 32) | blocknr
+
+                    jblock = wrap(data_j)
+                    blocks.setdefault(fs_block, []).append({
+                        "transaction": seq,
+                        "journal_block": jblock,
+                        "offset": jmap.offset(jblock),
+                        "escaped": bool(flags & JBD2_FLAG_ESCAPE),
+                        "committed": False
+                    })
+                    txn["blocks"] += 1
+                    data_j += 1
+
+                    pos += tag_bytes
+                    if not flags & JBD2_FLAG_SAME_UUID:
+                        pos += 16
+                    if flags & JBD2_FLAG_LAST_TAG:
+                        break
+
+                # Saltar los bloques de datos: su contenido no se interpreta
+                j = data_j
+                continue
+
+            if blocktype == JBD2_COMMIT_BLOCK:
+                txn["committed"] = True
+                if len(raw) >= 0x3C:
+                    txn["commit_time"] = struct.unpack_from(">Q", raw, 0x30)[0]
+
+            elif blocktype == JBD2_REVOKE_BLOCK:
+                r_count = struct.unpack_from(">I", raw, 12)[0]
+                end = min(r_count, bs - tail)
+                fmt = ">Q" if record_bytes == 8 else ">I"
+                for pos in range(16, end - record_bytes + 1, record_bytes):
+                    fs_block = struct.unpack_from(fmt, raw, pos)[0]
+                    if seq > revoked.get(fs_block, -1):
+                        revoked[fs_block] = seq
+
+            j += 1
+
+    # Propagar el estado de commit a cada copia y ordenar por transacción
+    for entries in blocks.values():
+        for e in entries:
+            e["committed"] = transactions[e["transaction"]]["committed"]
+        entries.sort(key=lambda e: (e["transaction"], e["journal_block"]))
+
+    return {
+        "journal": jsb,
+        "blocks": blocks,
+        "transactions": transactions,
+        "revoked": revoked
+    }
+
+
+# ------------------------------------------------------------
+# read_journal_block()
+# ------------------------------------------------------------
+def read_journal_block(path, entry, block_size):
+    """
+    Devuelve los bytes de una copia de bloque registrada en el journal.
+
+    Si el tag tenía JBD2_FLAG_ESCAPE, el bloque original empezaba con el
+    magic JBD2 y el kernel lo sobrescribió con ceros: aquí se restaura.
+    """
+    with DiskImage(path).open(sequential=False, drop_cache=False) as f:
+        f.seek(entry["offset"])
+        data = f.read(block_size)
+    if entry["escaped"]:
+        data = struct.pack(">I", JBD2_MAGIC) + data[4:]
+    return data
+
+
+# ------------------------------------------------------------
+# read_inode_versions()
+# ------------------------------------------------------------
+def read_inode_versions(path, inode_num, index=None):
+    """
+    Variante de read_inode() que devuelve las versiones HISTÓRICAS de un
+    inodo guardadas en el journal (por ejemplo, la copia previa al borrado).
+
+    Parámetros:
+      path      : ruta a la imagen
+      inode_num : número de inodo (1-based)
+      index     : índice de build_journal_index(); si se reutiliza entre
+                  consultas, cada búsqueda es O(1) sin volver a leer el journal
+
+    Retorna una lista (ordenada por transacción) de dicts con los campos
+    del inodo más:
+      - transaction, journal_block, committed
+      - revoked : True si una transacción posterior revocó el bloque
+      - csum_ok : checksum del inodo (metadata_csum) correcto; None si
+                  el FS no tiene checksums
+    """
+
+    if index is None:
+        index = build_journal_index(path)
+
+    sb = index["journal"]["superblock"]
+    block_size = sb["s_block_size"]
+    inode_size = sb["s_inode_size"]
+
+    inode_offset, _sb, _gd = locate_inode(path, inode_num, sb=sb)
+    table_block = inode_offset // block_size
+    within = inode_offset % block_size
+
+    versions = []
+    revoked_by = index["revoked"].get(table_block, -1)
+    seed = csum_seed(sb)
+
+    for entry in index["blocks"].get(table_block, []):
+        data = read_journal_block(path, entry, block_size)
+        raw = data[within:within + inode_size]
+        if len(raw) < inode_size:
+            continue
+
+        version = {"inode_num": inode_num}
+        version.update(parse_inode_bytes(raw, inode_size))
+        version.update({
+            "transaction": entry["transaction"],
+            "journal_block": entry["journal_block"],
+            "committed": entry["committed"],
+            "revoked": entry["transaction"] < revoked_by,
+            "csum_ok": None if seed is None else inode_checksum_ok(raw, inode_num, seed)
+        })
+        versions.append(version)
+
+    return versions
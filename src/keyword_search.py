@@ -0,0 +1,413 @@
+# src/keyword_search.py
+import os, re
+from multiprocessing import Pool
+from .img_reader import DiskImage, get_default_throttle, set_default_throttle
+from .ext4_parser import read_superblock, build_block_owner_index, lookup_block_owners
+
+try:
+    from re import _parser as sre_parse
+except ImportError:            # Python < 3.11
+    import sre_parse
+
+# ------------------------------------------------------------
+# Búsqueda de palabras clave y expresiones regulares en la imagen
+#
+# Todas las palabras clave y regex se compilan en UN solo patrón de
+# bytes que cubre ASCII/UTF-8, UTF-16LE y UTF-16BE. Cada variante
+# va en su propio grupo, de modo que un único recorrido por chunk
+# encuentra todos los términos en todas las codificaciones.
+#
+# Para UTF-16 las regex se traducen átomo a átomo: cada carácter
+# (literal, clase, '.') pasa a ocupar 2 bytes (átomo + \x00). Las
+# clases de caracteres y '.' solo cubren U+0000..U+00FF en UTF-16.
+#
+# \b y \B no se traducen (sobre bytes tratarían las letras no ASCII
+# como separadores): el patrón de bytes se busca sin ellos y cada
+# acierto se confirma decodificándolo y aplicando la regex original.
+# ------------------------------------------------------------
+ENCODINGS = ("utf-8", "utf-16le", "utf-16be")
+
+SEGMENT_SIZE = 16 * 1024 * 1024    # bytes por tarea del pool
+DEFAULT_OVERLAP = 1024             # longitud máxima garantizada de un acierto
+PREVIEW_BYTES = 200
+CONFIRM_MARGIN = 64                # bytes decodificados tras un acierto con \b / \B
+
+_CATEGORIES = {
+    "CATEGORY_DIGIT": b"\\d", "CATEGORY_NOT_DIGIT": b"\\D",
+    "CATEGORY_SPACE": b"\\s", "CATEGORY_NOT_SPACE": b"\\S",
+    "CATEGORY_WORD": b"\\w", "CATEGORY_NOT_WORD": b"\\W",
+}
+
+_ANCHORS = {
+    "AT_BEGINNING": b"^", "AT_BEGINNING_STRING": b"\\A",
+    "AT_END": b"$", "AT_END_STRING": b"\\Z",
+}
+
+
+# ------------------------------------------------------------
+# Traducción de regex a patrones de bytes por codificación
+# ------------------------------------------------------------
+def _char(c, enc, icase=False):
+    """
+    Un carácter literal en la codificación indicada. Con icase, las
+    letras no ASCII se expanden a ambas variantes (re.IGNORECASE sobre
+    bytes solo pliega mayúsculas ASCII).
+    """
+    ch = chr(c)
+    variants = {ch}
+    if icase and c > 0x7F:
+        variants |= {ch.lower(), ch.upper()}
+    encoded = [re.escape(v.encode(enc, errors="surrogatepass")) for v in sorted(variants)
+               if len(v) == 1]
+    if len(encoded) == 1:
+        return encoded[0]
+    return b"(?:" + b"|".join(encoded) + b")"
+
+
+def _unit(atom, enc):
+    """Átomo de 1 byte → unidad de código de la codificación."""
+    if enc == "utf-16le":
+        return b"(?:" + atom + b")\\x00"
+    if enc == "utf-16be":
+        return b"\\x00(?:" + atom + b")"
+    return atom
+
+
+def _class_byte(c, enc):
+    # En clases solo se admiten caracteres de 1 unidad (ASCII en UTF-8)
+    limit = 0x7F if enc == "utf-8" else 0xFF
+    if c > limit:
+        raise ValueError(f"character {chr(c)!r} not supported inside a class for {enc}")
+    return re.escape(bytes([c]))
+
+
+def _class(items, enc):
+    out = b"["
+    for op, av in items:
+        name = str(op)
+        if name == "NEGATE":
+            out += b"^"
+        elif name == "LITERAL":
+            out += _class_byte(av, enc)
+        elif name == "RANGE":
+            out += _class_byte(av[0], enc) + b"-" + _class_byte(av[1], enc)
+        elif name == "CATEGORY":
+            out += _CATEGORIES[str(av)]
+        else:
+            raise ValueError(f"unsupported class item {name}")
+    return out + b"]"
+
+
+def _uses_boundary(items):
+    """True si el árbol de sre_parse contiene \\b o \\B."""
+    for op, av in items:
+        if str(op) == "AT" and str(av) in ("AT_BOUNDARY", "AT_NON_BOUNDARY"):
+            return True
+        subs = av if isinstance(av, (list, tuple)) else (av,)
+        for sub in subs:
+            if isinstance(sub, sre_parse.SubPattern) and _uses_boundary(sub):
+                return True
+            if isinstance(sub, list) and sub and isinstance(sub[0], sre_parse.SubPattern):
+                if any(_uses_boundary(alt) for alt in sub):
+                    return True
+    return False
+
+
+def _flags_prefix(flags):
+    letters = b""
+    if flags & re.IGNORECASE:
+        letters += b"i"
+    if flags & re.MULTILINE:
+        letters += b"m"
+    if flags & re.DOTALL:
+        letters += b"s"
+    return letters
+
+
+def _emit(items, enc, icase=False):
+    """
+    Regenera como patrón de bytes un árbol de sre_parse, adaptado a 'enc'.
+    Los grupos de captura del usuario se convierten en no capturantes.
+    """
+    out = b""
+    for op, av in items:
+        name = str(op)
+        if name == "LITERAL":
+            out += _char(av, enc, icase)
+        elif name == "NOT_LITERAL":
+            out += _unit(b"[^" + _class_byte(av, enc) + b"]", enc)
+        elif name == "ANY":
+            out += _unit(b".", enc)
+        elif name == "IN":
+            out += _unit(_class(av, enc), enc)
+        elif name == "BRANCH":
+            out += b"(?:" + b"|".join(_emit(alt, enc, icase) for alt in av[1]) + b")"
+        elif name == "SUBPATTERN":
+            _group, add_flags, del_flags, sub = av
+            on, off = _flags_prefix(add_flags), _flags_prefix(del_flags)
+            prefix = b"(?" + on + (b"-" + off if off else b"") + b":" if on or off else b"(?:"
+            sub_icase = (icase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            out += prefix + _emit(sub, enc, sub_icase) + b")"
+        elif name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            lo, hi, sub = av
+            if hi == sre_parse.MAXREPEAT:
+                quant = {0: b"*", 1: b"+"}.get(lo, b"{%d,}" % lo)
+            elif lo == hi:
+                quant = b"{%d}" % lo
+            else:
+                quant = b"{%d,%d}" % (lo, hi)
+            if name == "MIN_REPEAT":
+                quant += b"?"
+            elif name == "POSSESSIVE_REPEAT":
+                quant += b"+"
+            out += b"(?:" + _emit(sub, enc, icase) + b")" + quant
+        elif name == "ATOMIC_GROUP":
+            out += b"(?>" + _emit(av, enc, icase) + b")"
+        elif name in ("ASSERT", "ASSERT_NOT"):
+            direction, sub = av
+            kind = (b"=" if name == "ASSERT" else b"!")
+            out += (b"(?<" if direction < 0 else b"(?") + kind + _emit(sub, enc, icase) + b")"
+        elif name == "AT":
+            at = str(av)
+            if at in ("AT_BOUNDARY", "AT_NON_BOUNDARY"):
+                # Se omite: sobre bytes, \w solo cubre ASCII. Los aciertos
+                # de estos términos se confirman con la regex original
+                # (ver _confirm)
+                pass
+            else:
+                out += _ANCHORS[at]
+        else:
+            raise ValueError(f"unsupported regex construct: {name}")
+    return out
+
+
+def translate_regex(pattern, enc, ignore_case=False):
+    """
+    Traduce una regex (str) a un patrón de bytes que busca su texto
+    codificado en 'enc' (utf-8, utf-16le o utf-16be).
+    """
+    tree = sre_parse.parse(pattern)
+    flags = tree.state.flags | (re.IGNORECASE if ignore_case else 0)
+    body = _emit(list(tree), enc, bool(flags & re.IGNORECASE))
+    prefix = _flags_prefix(flags)
+    return b"(?" + prefix + b":" + body + b")" if prefix else body
+
+
+# ------------------------------------------------------------
+# Compilación del matcher combinado
+# ------------------------------------------------------------
+def compile_matcher(keywords=(), regexes=(), encodings=ENCODINGS, ignore_case=False):
+    """
+    Compila palabras clave y regex en un único patrón de bytes.
+
+    Retorna (patrón_compilado, etiquetas) donde etiquetas[i] describe
+    el grupo i+1: {"term", "type", "encoding", "pattern", "confirm"};
+    "pattern" es la variante compilada por separado y "confirm" la
+    regex original (str) si usa \\b / \\B, o None.
+    """
+    for enc in encodings:
+        if enc not in ENCODINGS:
+            raise ValueError(f"unsupported encoding: {enc}")
+
+    terms = [(k, "keyword", re.escape(k)) for k in keywords] + \
+            [(r, "regex", r) for r in regexes]
+    if not terms:
+        raise ValueError("no keywords or regexes given")
+
+    parts = []
+    labels = []
+    for term, kind, pattern in terms:
+        confirm = None
+        if _uses_boundary(list(sre_parse.parse(pattern))):
+            confirm = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        for enc in encodings:
+            variant = translate_regex(pattern, enc, ignore_case)
+            parts.append(b"(" + variant + b")")
+            labels.append({"term": term, "type": kind, "encoding": enc,
+                           "pattern": re.compile(variant), "confirm": confirm})
+
+    return re.compile(b"|".join(parts)), labels
+
+
+# ------------------------------------------------------------
+# Búsqueda en paralelo
+# ------------------------------------------------------------
+_worker_matcher = None
+
+
+def _init_worker(spec, throttle=None):
+    # Cada proceso compila el matcher una sola vez
+    global _worker_matcher
+    _worker_matcher = compile_matcher(*spec)
+    if throttle is not None:
+        set_default_throttle(throttle)
+
+
+def _confirm(label, window, p, e):
+    """
+    Aplica la regex original (str) de 'label' en la posición p,
+    decodificando unos bytes de contexto a cada lado para que \\b y
+    \\B vean los caracteres vecinos. Retorna el fin del acierto en
+    bytes, o None si la regex original no encaja ahí.
+    """
+    enc = label["encoding"]
+    errors = "surrogateescape" if enc == "utf-8" else "surrogatepass"
+    # 4 bytes bastan para el carácter anterior completo. Tras el acierto
+    # se deja margen: la regex original puede extenderse más que la
+    # variante de bytes (p. ej. \\w+ sobre letras no ASCII)
+    pre = window[max(0, p - 4):p].decode(enc, errors)
+    end = min(len(window), e + CONFIRM_MARGIN)
+    if enc != "utf-8":
+        end -= (end - p) % 2
+    text = pre + window[p:end].decode(enc, errors)
+    m = label["confirm"].match(text, len(pre))
+    if m is None:
+        return None
+    return p + len(m.group().encode(enc, errors))
+
+
+def _search_segment(task):
+    """
+    Tarea del pool: busca en [start, end) leyendo 'overlap' bytes extra
+    para completar aciertos que cruzan el final del segmento. Solo se
+    reportan los aciertos que EMPIEZAN dentro del segmento, así cada
+    acierto aparece una única vez.
+
+    El patrón combinado localiza la siguiente posición con algún
+    acierto; en esa posición se prueban también las demás variantes,
+    para no perder términos que se solapan (p. ej. una palabra clave
+    dentro de un email que encaja con una regex). Un mismo término no
+    se reporta de nuevo dentro de su propio acierto anterior.
+
+    En UTF-16 solo se aceptan aciertos en offsets pares: el texto de
+    un archivo queda alineado a 2 bytes (los bloques lo están).
+    """
+    image_path, start, end, overlap = task
+    matcher, labels = _worker_matcher
+
+    with DiskImage(image_path).open() as f:
+        f.seek(start)
+        window = f.read(end - start + overlap)
+
+    hits = []
+    limit = end - start
+    last_end = [0] * len(labels)
+    pos = 0
+
+    while pos < limit:
+        m = matcher.search(window, pos)
+        if m is None or m.start() >= limit:
+            break
+        p = m.start()
+        pos = p + 1
+
+        for i in range(m.lastindex - 1, len(labels)):
+            label = labels[i]
+            if p < last_end[i]:
+                continue
+            if label["encoding"] != "utf-8" and (start + p) % 2:
+                continue
+            if i == m.lastindex - 1:
+                e = m.end()
+            else:
+                mm = label["pattern"].match(window, p)
+                if mm is None:
+                    continue
+                e = mm.end()
+            if label["confirm"] is not None:
+                e = _confirm(label, window, p, e)
+                if e is None:
+                    continue
+            if e == p:
+                continue
+            last_end[i] = e
+
+            raw = window[p:min(e, p + PREVIEW_BYTES)]
+            hits.append({
+                "offset": start + p,
+                "length": e - p,
+                "term": label["term"],
+                "type": label["type"],
+                "encoding": label["encoding"],
+                "text": raw.decode(label["encoding"], errors="replace")
+            })
+    return hits
+
+
+def search_image(image_path, keywords=(), regexes=(), encodings=ENCODINGS,
+                 ignore_case=False, workers=None, overlap=DEFAULT_OVERLAP, resolve=True):
+    """
+    Busca palabras clave y regex en toda la imagen RAW.
+
+    Parámetros:
+      image_path  : ruta a la imagen
+      keywords    : lista de textos literales
+      regexes     : lista de expresiones regulares (sintaxis de Python)
+      encodings   : codificaciones a cubrir (utf-8, utf-16le, utf-16be)
+      ignore_case : búsqueda sin distinguir mayúsculas (ASCII/Latin-1)
+      workers     : procesos del pool (por defecto, todos los CPUs)
+      overlap     : solapamiento entre segmentos; aciertos más largos
+                    pueden quedar cortados en el borde de un segmento
+      resolve     : si es True y la imagen es EXT, añade a cada acierto
+                    el bloque y el inodo dueño
+
+    Retorna una lista de dicts ordenada por offset:
+      offset, length, term, type, encoding, text
+      (+ block, inode, file_block si resolve=True)
+    """
+
+    spec = (tuple(keywords), tuple(regexes), tuple(encodings), ignore_case)
+    # Validar el patrón antes de lanzar procesos
+    compile_matcher(*spec)
+
+    size = os.path.getsize(image_path)
+    tasks = [(image_path, off, min(off + SEGMENT_SIZE, size), overlap)
+             for off in range(0, size, SEGMENT_SIZE)]
+
+    hits = []
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(spec)
+        for t in tasks:
+            hits.extend(_search_segment(t))
+    else:
+        # El límite de lectura se reparte entre los procesos del pool
+        throttle = get_default_throttle()
+        if throttle is not None:
+            throttle = throttle.split(workers or os.cpu_count() or 1)
+        with Pool(workers, initializer=_init_worker, initargs=(spec, throttle)) as pool:
+            for seg_hits in pool.imap(_search_segment, tasks):
+                hits.extend(seg_hits)
+
+    if resolve and hits:
+        resolve_owners(image_path, hits)
+
+    return hits
+
+
+def resolve_owners(image_path, hits):
+    """
+    Añade a cada acierto el bloque EXT y los inodos (y bloque lógico)
+    que lo contienen. Un bloque puede tener varios dueños: un inodo
+    vivo y los inodos borrados que aún conservan extents sobre él.
+    "inode"/"file_block" corresponden al primer dueño (los vivos van
+    primero). Si la imagen no es un sistema EXT válido, los aciertos
+    quedan sin resolver.
+    """
+    try:
+        sb = read_superblock(image_path)
+        if sb["s_magic"] != hex(0xEF53):
+            return hits
+        index = build_block_owner_index(image_path, sb)
+    except (ValueError, IndexError):
+        return hits
+
+    block_size = sb["s_block_size"]
+    for h in hits:
+        block = h["offset"] // block_size
+        owners = lookup_block_owners(index, block)
+        h["block"] = block
+        h["inode"] = owners[0][0] if owners else None
+        h["file_block"] = owners[0][1] if owners else None
+        h["owners"] = [{"inode": ino, "file_block": fb, "deleted": deleted}
+                       for ino, fb, deleted in owners]
+    return hits
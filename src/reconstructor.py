@@ -1,12 +1,13 @@
 # src/reconstructor.py
-import os
-import hashlib
+from .sinks import DirectorySink
+from .img_reader import DiskImage
+from .fragments import reassemble, DEFAULT_MAX_SIZE
 
 # ============================================================
 # EXTRACCIÓN POR OFFSET (recuperación a partir de un desplazamiento)
 # ============================================================
 
-def extract_from_offset(image_path, offset, max_size=10*1024*1024, out_dir="recovered", ext=".bin"):
+def extract_from_offset(image_path, offset, max_size=10*1024*1024, out_dir="recovered", ext=".bin", sink=None):
     """
     Extrae bytes crudos desde un OFFSET específico dentro de la imagen RAW.
 
@@ -18,41 +19,39 @@ def extract_from_offset(image_path, offset, max_size=10*1024*1024, out_dir="reco
       image_path : ruta del archivo IMG
       offset     : posición absoluta desde donde empezar a leer
       max_size   : límite superior de bytes a extraer
-      out_dir    : carpeta de salida
+      out_dir    : carpeta de salida (si no se indica sink)
       ext        : extensión opcional para el archivo recuperado
+      sink       : destino opcional (ver sinks.py: TarSink, PackSink...)
 
     Retorna:
       (ruta_archivo_recuperado, sha256_hex)
     """
 
-    os.makedirs(out_dir, exist_ok=True)
+    if sink is None:
+        sink = DirectorySink(out_dir)
 
     # El archivo de salida lleva por nombre recovered_<offset>.ext
-    out_path = os.path.join(out_dir, f"recovered_{offset}{ext}")
+    name = f"recovered_{offset}{ext}"
 
-    # Abrimos la imagen y el archivo de salida
-    with open(image_path, "rb") as fin, open(out_path, "wb") as fout:
-        fin.seek(offset)              # Mover puntero al offset deseado
-        remaining = max_size
-        chunk = 65536                 # Lectura por trozos de 64 KB
+    # El SHA-256 (integridad forense) se calcula mientras se escribe
+    with DiskImage(image_path).open() as fin:
+        return sink.add(name, read_range(fin, offset, max_size))
 
-        # Bucle de extracción
-        while remaining > 0:
-            data = fin.read(min(chunk, remaining))
-            if not data:
-                break
-            fout.write(data)
-            remaining -= len(data)
 
-    # ------------------------------------------------------------
-    # Calcular SHA-256 del archivo recuperado (integridad forense)
-    # ------------------------------------------------------------
-    h = hashlib.sha256()
-    with open(out_path, "rb") as f:
-        for b in iter(lambda: f.read(65536), b""):
-            h.update(b)
+def read_range(fin, offset, max_size, chunk=65536):
+    """
+    Genera los bytes de [offset, offset + max_size) en trozos de 64 KB.
+    """
+    fin.seek(offset)              # Mover puntero al offset deseado
+    remaining = max_size
 
-    return out_path, h.hexdigest()
+    # Bucle de extracción
+    while remaining > 0:
+        data = fin.read(min(chunk, remaining))
+        if not data:
+            break
+        yield data
+        remaining -= len(data)
 
 
 
@@ -60,7 +59,7 @@ def extract_from_offset(image_path, offset, max_size=10*1024*1024, out_dir="reco
 # EXTRACCIÓN POR LISTA DE BLOQUES (RECUPERACIÓN A PARTIR DE INODOS)
 # ============================================================
 
-def extract_from_blocks(image_path, block_list, block_size, out_dir="recovered", filename="recovered_by_inode"):
+def extract_from_blocks(image_path, block_list, block_size, out_dir="recovered", filename="recovered_by_inode", sink=None):
     """
     Reconstruye un archivo a partir de una LISTA DE BLOQUES ext4.
 
@@ -75,6 +74,7 @@ def extract_from_blocks(image_path, block_list, block_size, out_dir="recovered",
       block_size : tamaño de un bloque ext4 (típicamente 4096)
       out_dir    : carpeta donde escribir el archivo reconstruido
       filename   : nombre del archivo resultante
+      sink       : destino opcional (ver sinks.py: TarSink, PackSink...)
 
     Retorna:
       (ruta_archivo_recuperado, sha256_hex)
@@ -84,37 +84,123 @@ def extract_from_blocks(image_path, block_list, block_size, out_dir="recovered",
       - Un valor '0' significa fin de lista (sin bloques indirectos).
     """
 
-    os.makedirs(out_dir, exist_ok=True)
-    out_path = os.path.join(out_dir, filename)
+    if sink is None:
+        sink = DirectorySink(out_dir)
+
+    with DiskImage(image_path).open(sequential=False) as fin:
+        return sink.add(filename, read_blocks(fin, block_list, block_size))
+
+
+def read_blocks(fin, block_list, block_size):
+    """
+    Genera el contenido de cada bloque de la lista, en orden.
+    """
+
+    # Procesar cada puntero de bloque
+    for b in block_list:
+
+        if b == 0:
+            # Un bloque nulo indica que no hay más contenido
+            break
 
-    with open(image_path, "rb") as fin, open(out_path, "wb") as fout:
+        # Calcular el offset real dentro de la imagen
+        offset = b * block_size
 
-        # Procesar cada puntero de bloque
-        for b in block_list:
+        fin.seek(offset)
+        data = fin.read(block_size)
 
-            if b == 0:
-                # Un bloque nulo indica que no hay más contenido
-                break
+        if not data:
+            # Si el bloque no existe (imagen truncada), se aborta
+            break
 
-            # Calcular el offset real dentro de la imagen
-            offset = b * block_size
+        # Entregamos el bloque físico al sink (archivo reconstruido)
+        yield data
 
-            fin.seek(offset)
-            data = fin.read(block_size)
 
-            if not data:
-                # Si el bloque no existe (imagen truncada), se aborta
-                break
 
-            # Escribimos el bloque físico en el archivo reconstruido
-            fout.write(data)
+# ============================================================
+# EXTRACCIÓN DE ARCHIVOS FRAGMENTADOS (JPEG / PNG)
+# ============================================================
+
+def extract_reassembled(image_path, offset, out_dir="recovered", ext=None, sink=None,
+                        max_size=DEFAULT_MAX_SIZE):
+    """
+    Variante de extract_from_offset() para JPEG/PNG fragmentados: el
+    archivo se reensambla con fragments.reassemble() y se escriben sus
+    fragmentos en orden.
+
+    Retorna:
+      (ruta_archivo_recuperado, sha256_hex, resultado_de_reassemble)
+    """
+
+    if sink is None:
+        sink = DirectorySink(out_dir)
 
-    # ------------------------------------------------------------
-    # Calcular SHA-256 del archivo reconstruido
-    # ------------------------------------------------------------
-    h = hashlib.sha256()
-    with open(out_path, "rb") as f:
-        for chunk in iter(lambda: f.read(65536), b""):
-            h.update(chunk)
+    result = reassemble(image_path, offset, max_size=max_size)
+    if ext is None:
+        ext = {"jpeg": ".jpg", "png": ".png"}.get(result["format"], ".bin")
+    name = f"recovered_{offset}{ext}"
+
+    with DiskImage(image_path).open(sequential=False) as fin:
+        location, sha = sink.add(name, read_fragments(fin, result["fragments"]))
+    return location, sha, result
+
+
+def read_fragments(fin, fragments):
+    """
+    Genera los bytes de una lista de fragmentos [(offset, longitud), ...].
+    """
+    for offset, length in fragments:
+        yield from read_range(fin, offset, length)
+
+
+
+# ============================================================
+# EXTRACCIÓN POR LOTES (resultados de scan_for_signatures)
+# ============================================================
+
+def extract_batch(image_path, results, sink, max_size=5*1024*1024, resume=True, reassemble_images=False):
+    """
+    Extrae todos los hallazgos de scan_for_signatures() hacia un sink.
+
+    Parámetros:
+      image_path : ruta al archivo IMG
+      results    : lista de dicts con al menos "offset" y "ext"
+      sink       : destino (DirectorySink, TarSink o PackSink)
+      max_size   : límite de bytes por artefacto
+      resume     : si es True, se saltan los artefactos que el sink ya
+                   contiene (permite reanudar una extracción interrumpida)
+      reassemble_images : reensamblar los JPEG/PNG fragmentados en lugar
+                   de copiar max_size bytes contiguos
+
+    Retorna una lista de dicts: offset, location, sha256, skipped (y,
+    para imágenes reensambladas, status y fragments).
+    """
 
-    return out_path, h.hexdigest()
+    extracted = []
+
+    # Un único descriptor de la imagen para todo el lote
+    with DiskImage(image_path).open(sequential=False) as fin:
+        for r in results:
+            name = f"recovered_{r['offset']}{r.get('ext') or '.bin'}"
+
+            if resume and sink.contains(name):
+                extracted.append({"offset": r["offset"], "location": sink.location(name),
+                                  "sha256": None, "skipped": True})
+                continue
+
+            entry = {"offset": r["offset"], "skipped": False}
+            chunks = None
+            if reassemble_images and r.get("ext") in (".jpg", ".png"):
+                result = reassemble(image_path, r["offset"], max_size=max_size)
+                if result["status"] not in ("invalid", "unsupported"):
+                    entry.update({"status": result["status"], "fragments": result["fragments"]})
+                    chunks = read_fragments(fin, result["fragments"])
+            if chunks is None:
+                chunks = read_range(fin, r["offset"], max_size)
+
+            location, sha = sink.add(name, chunks)
+            entry.update({"location": location, "sha256": sha})
+            extracted.append(entry)
+
+    return extracted
@@ -0,0 +1,404 @@
+# src/recover_deleted.py
+import os, json, queue, struct, threading
+from .img_reader import DiskImage
+from .sinks import DirectorySink
+from .ext4_parser import read_superblock, read_group_descriptors, parse_inode_bytes, \
+    inode_block_runs, BlockBitmap, EXT4_INLINE_DATA_FL, BG_INODE_UNINIT
+from .journal import build_journal_index, read_journal_block
+from .checksums import csum_seed, inode_checksum_ok
+
+# ------------------------------------------------------------
+# Recuperación de archivos borrados por inodo (pipeline por etapas)
+#
+#   1. enumerar : lee bitmap + tabla de inodos de cada grupo y emite
+#                 los inodos borrados (i_mode != 0 con el bit libre en
+#                 el bitmap o sin enlaces). Los inodos vivos con dtime
+#                 puesto están en la lista de huérfanos (dtime = siguiente
+#                 huérfano): no se recuperan, se anotan como "orphan"
+#   2. mapear   : traduce el árbol de extents / punteros a tramos de
+#                 bloques; si el inodo ya no tiene bloques se intenta
+#                 con su última copia en el journal
+#   3. verificar: cruza los tramos con el bitmap de bloques actual
+#                 para detectar bloques reutilizados por otro archivo
+#   4. escribir : copia los bloques al sink calculando el SHA-256
+#
+# Las etapas se conectan con colas ACOTADAS y cada una tiene su propio
+# grupo de hilos: mientras unos hilos esperan al disco, otros decodifican.
+# La memoria queda limitada por el tamaño de las colas (más una tabla
+# de inodos por hilo enumerador), sea cual sea el número de inodos.
+#
+# Cada inodo procesado se registra en un manifiesto JSONL; al reanudar
+# se saltan los inodos ya presentes en él.
+# ------------------------------------------------------------
+DEFAULT_QUEUE_SIZE = 256
+READ_CHUNK = 1024 * 1024
+
+_DONE = object()      # marca de fin de cola
+
+
+# ------------------------------------------------------------
+# Manifiesto reanudable
+# ------------------------------------------------------------
+class Manifest:
+    """
+    Manifiesto JSONL con una línea por inodo procesado.
+    Al abrirlo en modo reanudar se cargan los inodos ya terminados
+    (una última línea incompleta, por un corte, se descarta).
+    """
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            valid = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.done.add(entry["inode"])
+                    valid += len(line)
+            self.f = open(path, "r+")
+            self.f.truncate(valid)
+            self.f.seek(valid)
+        else:
+            self.f = open(path, "w")
+
+    def record(self, entry):
+        with self.lock:
+            self.f.write(json.dumps(entry) + "\n")
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+# ------------------------------------------------------------
+# Etapas
+# ------------------------------------------------------------
+class _StageControl:
+    """
+    Estado compartido por las etapas: el primer error fatal de un hilo
+    y el evento que detiene el trabajo del resto.
+    """
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+
+    def fail(self, exc):
+        with self.lock:
+            if self.error is None:
+                self.error = exc
+        self.stop.set()
+
+
+def _run_stage(worker, in_q, out_q, workers, next_workers, control):
+    """
+    Arranca 'workers' hilos que consumen in_q. Cuando el último hilo
+    termina, coloca una marca de fin por cada hilo de la etapa siguiente.
+
+    Si worker() lanza una excepción, se guarda en 'control' y todas las
+    etapas dejan de procesar: los hilos siguen vaciando sus colas hasta
+    la marca de fin, así ninguna etapa anterior queda bloqueada en un
+    put() sobre una cola llena.
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def loop():
+        try:
+            while True:
+                item = in_q.get()
+                if item is _DONE:
+                    break
+                if control.stop.is_set():
+                    continue
+                try:
+                    worker(item)
+                except Exception as e:
+                    control.fail(e)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and out_q is not None:
+                for _ in range(next_workers):
+                    out_q.put(_DONE)
+
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def _read_runs(f, runs, size, block_size):
+    """
+    Genera el contenido del archivo a partir de sus tramos, en orden
+    lógico, rellenando con ceros los huecos (archivos dispersos) y
+    cortando en i_size.
+    """
+    def zeros(gap):
+        while gap > 0:
+            n = min(gap, READ_CHUNK)
+            yield b"\0" * n
+            gap -= n
+
+    pos = 0
+    for logical, phys, length in runs:
+        start = logical * block_size
+        if start >= size:
+            break
+        if start > pos:
+            yield from zeros(start - pos)
+            pos = start
+
+        f.seek(phys * block_size)
+        remaining = min(length * block_size, size - pos)
+        while remaining > 0:
+            data = f.read(min(READ_CHUNK, remaining))
+            if not data:
+                return
+            yield data
+            pos += len(data)
+            remaining -= len(data)
+
+    # Hueco final (archivo disperso que termina sin bloques asignados)
+    yield from zeros(size - pos)
+
+
+def recover_deleted(image_path, sink=None, manifest_path="recover_manifest.jsonl",
+                    resume=True, include_reused=False, use_journal=True,
+                    enum_workers=2, map_workers=4, write_workers=4,
+                    queue_size=DEFAULT_QUEUE_SIZE, groups=None):
+    """
+    Recupera los archivos borrados cuyos mapas de bloques siguen siendo
+    legibles (en el inodo o en el journal).
+
+    Parámetros:
+      image_path     : ruta a la imagen
+      sink           : destino (DirectorySink, TarSink, PackSink)
+      manifest_path  : manifiesto JSONL reanudable
+      resume         : si es True, se saltan los inodos del manifiesto
+      include_reused : escribir también los archivos con bloques ya
+                       reutilizados (su contenido es parcialmente ajeno)
+      use_journal    : buscar el mapa de bloques previo al borrado en el journal
+      *_workers      : hilos de cada etapa
+      queue_size     : capacidad de cada cola entre etapas
+      groups         : limitar la enumeración a estos grupos
+
+    Cada línea del manifiesto tiene: inode, status, size, mode, dtime,
+    source ("inode" o "journal"), blocks, reused_blocks y, si se escribió,
+    location y sha256. Estados: recovered, reused, no_blocks, error y
+    orphan (inodo vivo en la lista de huérfanos; solo se anota, con
+    next_orphan en lugar de dtime).
+
+    Retorna un dict con el número de inodos por estado.
+    Si un hilo falla de forma fatal (p. ej. disco lleno al escribir el
+    manifiesto), el pipeline se detiene y la excepción se relanza.
+    """
+
+    if sink is None:
+        sink = DirectorySink("recovered")
+
+    sb = read_superblock(image_path)
+    block_size = sb["s_block_size"]
+    inode_size = sb["s_inode_size"]
+    ipg = sb["s_inodes_per_group"]
+    gds = read_group_descriptors(image_path, sb)
+    bitmap = BlockBitmap(image_path, sb, gds)
+    # Con metadata_csum, las copias del journal se filtran por checksum
+    seed = csum_seed(sb)
+
+    journal = None
+    if use_journal:
+        try:
+            journal = build_journal_index(image_path)
+        except ValueError:
+            journal = None
+
+    manifest = Manifest(manifest_path, resume)
+    # Los contenedores (.tar/.pack) se escriben de forma secuencial
+    sink_lock = None if isinstance(sink, DirectorySink) else threading.Lock()
+
+    stats = {"groups": 0, "candidates": 0, "skipped": 0, "recovered": 0,
+             "reused": 0, "no_blocks": 0, "error": 0, "orphan": 0}
+    stats_lock = threading.Lock()
+
+    def count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    def finish(info, status, **extra):
+        entry = {"inode": info["inode"], "status": status}
+        entry.update({k: info[k] for k in ("size", "mode", "dtime", "source", "blocks",
+                                           "reused_blocks") if k in info})
+        entry.update(extra)
+        manifest.record(entry)
+        count(status)
+
+    q_groups = queue.Queue()
+    q_map = queue.Queue(queue_size)
+    q_check = queue.Queue(queue_size)
+    q_write = queue.Queue(queue_size)
+
+    # --------------------------------------------------------
+    # 1. Enumerar inodos borrados de un grupo
+    # --------------------------------------------------------
+    def enumerate_group(g):
+        gd = gds[g]
+        count("groups")
+        if gd["bg_flags"] & BG_INODE_UNINIT:
+            return
+        d = DiskImage(image_path)
+        ibitmap = d.read(gd["bg_inode_bitmap"] * block_size, -(-ipg // 8))
+        table = d.read(gd["bg_inode_table"] * block_size, ipg * inode_size)
+
+        for i in range(len(table) // inode_size):
+            inode_num = g * ipg + i + 1
+            if inode_num > sb["s_inodes_count"]:
+                break
+            off = i * inode_size
+            mode, = struct.unpack_from("<H", table, off)
+            dtime, = struct.unpack_from("<I", table, off + 20)
+            links, = struct.unpack_from("<H", table, off + 26)
+            # Solo archivos regulares (los directorios se tratan aparte)
+            if mode & 0xF000 != 0x8000:
+                continue
+            in_use = i < len(ibitmap) * 8 and ibitmap[i >> 3] & (1 << (i & 7))
+            if in_use and links:
+                # Vivo; con dtime puesto está en la lista de huérfanos
+                # (truncado pendiente) y sus bloques siguen siendo suyos
+                if dtime and inode_num not in manifest.done:
+                    finish({"inode": inode_num, "mode": hex(mode)}, "orphan", next_orphan=dtime)
+                continue
+            if inode_num in manifest.done:
+                count("skipped")
+                continue
+            count("candidates")
+            q_map.put((inode_num, table[off:off + inode_size]))
+
+    # --------------------------------------------------------
+    # 2. Mapear bloques (inodo y, si hace falta, journal)
+    # --------------------------------------------------------
+    def journal_versions(inode_num):
+        g, i = divmod(inode_num - 1, ipg)
+        offset = gds[g]["bg_inode_table"] * block_size + i * inode_size
+        table_block, within = divmod(offset, block_size)
+        for entry in reversed(journal["blocks"].get(table_block, [])):
+            data = read_journal_block(image_path, entry, block_size)
+            raw = data[within:within + inode_size]
+            if len(raw) < inode_size:
+                continue
+            if seed is not None and not inode_checksum_ok(raw, inode_num, seed):
+                continue
+            yield raw
+
+    def block_runs(fields):
+        if fields["i_blocks"] == 0 or int(fields["i_flags"], 16) & EXT4_INLINE_DATA_FL:
+            return []
+        fields["superblock"] = sb
+        try:
+            return inode_block_runs(image_path, fields)
+        except (ValueError, struct.error):
+            return []
+
+    def map_inode(item):
+        inode_num, raw = item
+        fields = parse_inode_bytes(raw, inode_size)
+        info = {"inode": inode_num, "size": fields["i_size"], "mode": fields["i_mode"],
+                "dtime": fields["i_dtime"], "source": "inode"}
+        try:
+            runs = block_runs(fields)
+            if not runs and journal is not None:
+                # Copia más reciente del inodo con el mapa de bloques intacto
+                for old_raw in journal_versions(inode_num):
+                    old = parse_inode_bytes(old_raw, inode_size)
+                    if old["i_mode"] != fields["i_mode"]:
+                        continue
+                    runs = block_runs(old)
+                    if runs:
+                        info.update({"size": old["i_size"], "source": "journal"})
+                        break
+        except Exception as e:
+            finish(info, "error", error=str(e))
+            return
+
+        if not runs:
+            finish(info, "no_blocks")
+            return
+        info["runs"] = runs
+        info["blocks"] = sum(r[2] for r in runs)
+        q_check.put(info)
+
+    # --------------------------------------------------------
+    # 3. Verificar reutilización contra el bitmap de bloques
+    # --------------------------------------------------------
+    def check_inode(info):
+        try:
+            info["reused_blocks"] = sum(bitmap.allocated(phys, n) for _l, phys, n in info["runs"])
+        except Exception as e:
+            finish(info, "error", error=str(e))
+            return
+        if info["reused_blocks"] and not include_reused:
+            finish(info, "reused")
+            return
+        q_write.put(info)
+
+    # --------------------------------------------------------
+    # 4. Copiar, hashear y escribir
+    # --------------------------------------------------------
+    local = threading.local()
+    open_files = []
+
+    def write_inode(info):
+        if not hasattr(local, "f"):
+            # Un descriptor de la imagen por hilo escritor
+            local.f = DiskImage(image_path).open(sequential=False)
+            open_files.append(local.f)
+        name = f"inode_{info['inode']}.bin"
+        status = "reused" if info["reused_blocks"] else "recovered"
+        if sink.contains(name):
+            # Escrito en una ejecución anterior que se cortó antes de
+            # registrarlo en el manifiesto: no duplicar el miembro
+            finish(info, status, location=sink.location(name), already_in_sink=True)
+            return
+        chunks = _read_runs(local.f, info["runs"], info["size"], block_size)
+        try:
+            if sink_lock is None:
+                location, sha = sink.add(name, chunks)
+            else:
+                with sink_lock:
+                    location, sha = sink.add(name, chunks)
+        except Exception as e:
+            finish(info, "error", error=str(e))
+            return
+        finish(info, status, location=location, sha256=sha)
+
+    control = _StageControl()
+    threads = []
+    threads += _run_stage(enumerate_group, q_groups, q_map, enum_workers, map_workers, control)
+    threads += _run_stage(map_inode, q_map, q_check, map_workers, 1, control)
+    threads += _run_stage(check_inode, q_check, q_write, 1, write_workers, control)
+    threads += _run_stage(write_inode, q_write, None, write_workers, 0, control)
+
+    try:
+        for g in (range(len(gds)) if groups is None else groups):
+            q_groups.put(g)
+        for _ in range(enum_workers):
+            q_groups.put(_DONE)
+        for t in threads:
+            t.join()
+    finally:
+        for f in open_files:
+            f.close()
+        manifest.close()
+
+    # Error fatal en algún hilo (p. ej. disco lleno al escribir el manifiesto)
+    if control.error is not None:
+        raise control.error
+    return stats
@@ -0,0 +1,268 @@
+# src/sector_hash.py
+import os, struct, json, mmap, hashlib
+from multiprocessing import Pool
+from .img_reader import DiskImage, get_default_throttle, set_default_throttle
+
+# ------------------------------------------------------------
+# Sector hashing: búsqueda de bloques de archivos conocidos
+#
+# Se hashea cada bloque de un conjunto de archivos de referencia y se
+# guarda en un índice en disco. Luego se recorre la imagen bloque a
+# bloque (incluido el espacio no asignado) y se busca el hash de cada
+# bloque en el índice. Un acierto indica que un fragmento de ese
+# archivo sigue presente en la imagen, aunque el archivo esté borrado.
+#
+# Formato del índice (.sidx):
+#   cabecera : magic(8) | block_size(u32) | bloom_bits(u64) | count(u64)
+#   bloom    : bloom_bits / 8 bytes (prefiltro: descarta casi todos los
+#              bloques sin tocar la tabla exacta)
+#   registros: count × (digest u64, file_id u32, file_block u32),
+#              ordenados por digest (big-endian → orden binario)
+#
+# La lista de archivos de referencia va en <índice>.files.json
+# ------------------------------------------------------------
+INDEX_MAGIC = b"SECTIDX1"
+HEADER = struct.Struct("<8sIQQ")
+RECORD = struct.Struct(">QII")
+
+DEFAULT_BLOCK_SIZE = 4096
+BLOOM_BITS_PER_ENTRY = 16
+BLOOM_HASHES = 3
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def block_digest(data):
+    """
+    Hash de 64 bits de un bloque (BLAKE2b truncado), como entero.
+    """
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def is_low_information(data):
+    """
+    Bloques de un solo byte repetido (ceros, 0xFF...) aparecen en casi
+    cualquier archivo e imagen: no sirven para identificar nada.
+    """
+    return data.count(data[:1]) == len(data)
+
+
+def bloom_positions(digest, bloom_bits):
+    """
+    Posiciones del Bloom filter por doble hashing (Kirsch-Mitzenmacher):
+    pos_i = (h1 + i*h2) mod m, con h1/h2 las dos mitades del digest.
+    """
+    h1 = digest & 0xFFFFFFFF
+    h2 = (digest >> 32) | 1
+    return [(h1 + i * h2) % bloom_bits for i in range(BLOOM_HASHES)]
+
+
+# ------------------------------------------------------------
+# Construcción del índice de referencia
+# ------------------------------------------------------------
+def build_reference_index(ref_paths, out_path, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Hashea por bloques los archivos de referencia y escribe el índice.
+
+    Parámetros:
+      ref_paths  : lista de archivos o carpetas (se recorren recursivamente)
+      out_path   : ruta del índice (.sidx)
+      block_size : debe coincidir con el tamaño de bloque del FS analizado
+
+    Solo se indexan bloques COMPLETOS: el último bloque parcial de un
+    archivo comparte su bloque físico con bytes residuales (slack) y
+    no coincidiría en la imagen. Tampoco se indexan bloques de baja
+    información (un solo byte repetido).
+
+    Retorna un dict con: files, blocks_indexed.
+    """
+
+    files = []
+    for p in ref_paths:
+        if os.path.isdir(p):
+            for root, _dirs, names in os.walk(p):
+                files.extend(os.path.join(root, n) for n in sorted(names))
+        else:
+            files.append(p)
+
+    records = []
+    file_list = []
+    for file_id, fpath in enumerate(files):
+        blocks = 0
+        with open(fpath, "rb") as f:
+            for block_no, data in enumerate(iter(lambda: f.read(block_size), b"")):
+                blocks += 1
+                if len(data) < block_size or is_low_information(data):
+                    continue
+                records.append((block_digest(data), file_id, block_no))
+        file_list.append({"id": file_id, "path": fpath, "blocks": blocks})
+
+    records.sort()
+
+    # Bloom filter: potencia de 2 con ~16 bits por entrada (≈0.05% falsos positivos)
+    bloom_bits = 1024
+    while bloom_bits < len(records) * BLOOM_BITS_PER_ENTRY:
+        bloom_bits *= 2
+    bloom = bytearray(bloom_bits // 8)
+    for digest, _fid, _blk in records:
+        for pos in bloom_positions(digest, bloom_bits):
+            bloom[pos >> 3] |= 1 << (pos & 7)
+
+    with open(out_path, "wb") as out:
+        out.write(HEADER.pack(INDEX_MAGIC, block_size, bloom_bits, len(records)))
+        out.write(bloom)
+        for rec in records:
+            out.write(RECORD.pack(*rec))
+
+    with open(out_path + ".files.json", "w") as f:
+        json.dump(file_list, f, indent=2)
+
+    return {"files": len(file_list), "blocks_indexed": len(records)}
+
+
+# ------------------------------------------------------------
+# Acceso al índice
+# ------------------------------------------------------------
+class ReferenceIndex:
+    """
+    Índice abierto en modo solo lectura. El Bloom filter se carga en
+    memoria y la tabla exacta se consulta por búsqueda binaria sobre
+    un mmap (no se carga entera).
+    """
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        magic, self.block_size, self.bloom_bits, self.count = \
+            HEADER.unpack(self.f.read(HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError("not a sector hash index")
+
+        self.bloom = self.f.read(self.bloom_bits // 8)
+        self.records_off = HEADER.size + len(self.bloom)
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def _digest_at(self, i):
+        return struct.unpack_from(">Q", self.mm, self.records_off + i * RECORD.size)[0]
+
+    def lookup(self, digest):
+        """
+        Devuelve [(file_id, file_block), ...] de los registros con ese digest.
+        """
+        bloom = self.bloom
+        for pos in bloom_positions(digest, self.bloom_bits):
+            if not bloom[pos >> 3] & (1 << (pos & 7)):
+                return []
+
+        # Búsqueda binaria del primer registro >= digest
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._digest_at(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        hits = []
+        while lo < self.count:
+            d, file_id, file_block = RECORD.unpack_from(self.mm, self.records_off + lo * RECORD.size)
+            if d != digest:
+                break
+            hits.append((file_id, file_block))
+            lo += 1
+        return hits
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.f.close()
+
+
+# ------------------------------------------------------------
+# Búsqueda en la imagen (en paralelo)
+# ------------------------------------------------------------
+_worker_index = None
+
+
+def _init_worker(index_path, throttle=None):
+    # Cada proceso del pool abre el índice una sola vez
+    global _worker_index
+    _worker_index = ReferenceIndex(index_path)
+    if throttle is not None:
+        set_default_throttle(throttle)
+
+
+def _match_segment(task):
+    """
+    Tarea del pool: hashea cada bloque del segmento y lo busca en el índice.
+    Retorna [(offset, file_id, file_block), ...].
+    """
+    image_path, offset, length = task
+    index = _worker_index
+    bs = index.block_size
+
+    with DiskImage(image_path).open() as f:
+        f.seek(offset)
+        data = f.read(length)
+
+    view = memoryview(data)
+    matches = []
+    for pos in range(0, len(data) - bs + 1, bs):
+        digest = block_digest(view[pos:pos + bs])
+        for file_id, file_block in index.lookup(digest):
+            matches.append((offset + pos, file_id, file_block))
+    return matches
+
+
+def match_image(image_path, index_path, workers=None):
+    """
+    Recorre la imagen bloque a bloque y reporta los bloques que coinciden
+    con algún bloque de los archivos de referencia.
+
+    Retorna una lista (un elemento por archivo de referencia con aciertos):
+      - path           : archivo de referencia
+      - blocks         : bloques totales del archivo
+      - blocks_matched : bloques distintos del archivo encontrados
+      - matches        : [{"offset", "file_block"}, ...] ordenados por offset
+    """
+    index = ReferenceIndex(index_path)
+    bs = index.block_size
+    index.close()
+
+    with open(index_path + ".files.json") as f:
+        file_list = json.load(f)
+
+    size = os.path.getsize(image_path)
+    segment = max(bs, SEGMENT_SIZE // bs * bs)
+    tasks = [(image_path, off, min(segment, size - off)) for off in range(0, size, segment)]
+
+    grouped = {}
+
+    def collect(matches):
+        for offset, file_id, file_block in matches:
+            grouped.setdefault(file_id, []).append({"offset": offset, "file_block": file_block})
+
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(index_path)
+        try:
+            for t in tasks:
+                collect(_match_segment(t))
+        finally:
+            _worker_index.close()
+    else:
+        # El límite de lectura se reparte entre los procesos del pool
+        throttle = get_default_throttle()
+        if throttle is not None:
+            throttle = throttle.split(workers or os.cpu_count() or 1)
+        with Pool(workers, initializer=_init_worker, initargs=(index_path, throttle)) as pool:
+            for matches in pool.imap(_match_segment, tasks):
+                collect(matches)
+
+    report = []
+    for file_id, matches in sorted(grouped.items()):
+        info = file_list[file_id]
+        report.append({
+            "path": info["path"],
+            "blocks": info["blocks"],
+            "blocks_matched": len({m["file_block"] for m in matches}),
+            "matches": matches
+        })
+    return report
@@ -0,0 +1,290 @@
+# src/sinks.py
+import os, json, time, tarfile, hashlib
+
+# ------------------------------------------------------------
+# Destinos de salida ("sinks") para los artefactos recuperados
+#
+#   - DirectorySink : un archivo por artefacto (comportamiento clásico)
+#   - TarSink       : todos los artefactos dentro de un único .tar
+#   - PackSink      : datos concatenados en un .pack + índice
+#
+# TarSink y PackSink escriben de forma SECUENCIAL en un solo archivo,
+# por lo que el rendimiento queda limitado por el ancho de banda de
+# escritura y no por las operaciones de metadatos del FS de salida.
+#
+# Ambos mantienen un índice JSONL (<archivo>.idx) con una línea por
+# miembro completado: nombre, offset de los datos, tamaño y SHA-256.
+# Ese índice permite añadir miembros (append) y reanudar (resume)
+# una extracción interrumpida.
+# ------------------------------------------------------------
+TAR_BLOCK = 512
+
+
+class MemberWriter:
+    """
+    Escritor de un artefacto: calcula SHA-256 y tamaño mientras se escribe.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.hash.update(data)
+        self.size += len(data)
+
+
+# ------------------------------------------------------------
+# DirectorySink
+# ------------------------------------------------------------
+class DirectorySink:
+    """
+    Escribe cada artefacto como un archivo independiente dentro de out_dir.
+
+    Cada archivo se escribe primero como <nombre>.part y se renombra al
+    terminar: un archivo con el nombre final siempre está completo.
+    """
+
+    def __init__(self, out_dir="recovered"):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+
+    def contains(self, name):
+        return os.path.exists(os.path.join(self.out_dir, name))
+
+    def location(self, name):
+        return os.path.join(self.out_dir, name)
+
+    def add(self, name, chunks):
+        """
+        Escribe los bytes de 'chunks' (iterable) como artefacto 'name'.
+        Retorna (ubicación, sha256_hex).
+        """
+        out_path = self.location(name)
+        part_path = out_path + ".part"
+        with open(part_path, "wb") as fout:
+            w = MemberWriter(fout)
+            for data in chunks:
+                w.write(data)
+        os.replace(part_path, out_path)
+        return out_path, w.hash.hexdigest()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ------------------------------------------------------------
+# Base para contenedores de un solo archivo
+# ------------------------------------------------------------
+class _ContainerSink:
+    """
+    Lógica común de TarSink y PackSink: índice JSONL, append y resume.
+
+    mode:
+      "w" → crea un contenedor nuevo (sobrescribe)
+      "a" → abre uno existente y continúa al final del último miembro
+            completo; un miembro a medio escribir (p. ej. por un corte)
+            se descarta truncando el archivo.
+    """
+
+    def __init__(self, path, mode="w"):
+        if mode not in ("w", "a"):
+            raise ValueError("mode must be 'w' or 'a'")
+
+        self.path = path
+        self.index_path = path + ".idx"
+        self.members = {}
+
+        end = 0
+        if mode == "a" and os.path.exists(path):
+            # Sin índice no se sabe dónde termina el último miembro válido
+            if not os.path.exists(self.index_path):
+                raise ValueError(f"cannot append: index not found ({self.index_path})")
+
+            # Recuperar el índice; ignorar una última línea incompleta
+            with open(self.index_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.members[entry["name"]] = entry
+                    end = max(end, self._member_end(entry))
+            # Reescribir el índice limpio (sin líneas parciales) en un
+            # temporal y reemplazarlo de forma atómica ANTES de truncar
+            # el contenedor: un corte nunca deja un índice vacío o parcial
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as tmp:
+                for entry in self.members.values():
+                    tmp.write(json.dumps(entry) + "\n")
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.index_path)
+
+            self.fileobj = open(path, "r+b")
+            self.fileobj.truncate(end)
+            self.fileobj.seek(end)
+            self.index = open(self.index_path, "a")
+        else:
+            self.fileobj = open(path, "wb")
+            self.index = open(self.index_path, "w")
+
+    def _member_end(self, entry):
+        raise NotImplementedError
+
+    def contains(self, name):
+        return name in self.members
+
+    def location(self, name):
+        return f"{self.path}:{name}"
+
+    def _record(self, name, offset, size, sha):
+        """
+        Registra un miembro completado. Primero se vacía el contenedor y
+        después el índice, para que el índice nunca apunte a datos ausentes.
+        """
+        entry = {"name": name, "offset": offset, "size": size, "sha256": sha}
+        self.fileobj.flush()
+        self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self.members[name] = entry
+
+    def close(self):
+        if self.fileobj.closed:
+            return
+        self._finish()
+        self.fileobj.close()
+        self.index.close()
+
+    def _finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ------------------------------------------------------------
+# TarSink
+# ------------------------------------------------------------
+class TarSink(_ContainerSink):
+    """
+    Escribe los artefactos como miembros de un archivo TAR (formato GNU).
+
+    El tamaño de cada miembro no se conoce hasta terminar de leerlo, así
+    que se escribe una cabecera provisional, se transmiten los datos y
+    luego se reescribe la cabecera con el tamaño real (misma longitud).
+    Así nunca se carga un artefacto completo en memoria ni se copia dos veces.
+    """
+
+    def _member_end(self, entry):
+        padded = -(-entry["size"] // TAR_BLOCK) * TAR_BLOCK
+        return entry["offset"] + padded
+
+    def _header(self, name, size, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o444
+        return info.tobuf(format=tarfile.GNU_FORMAT)
+
+    def add(self, name, chunks):
+        f = self.fileobj
+        mtime = int(time.time())
+        header_off = f.tell()
+
+        # Cabecera provisional (tamaño 0)
+        placeholder = self._header(name, 0, mtime)
+        f.write(placeholder)
+        data_off = f.tell()
+
+        w = MemberWriter(f)
+        for data in chunks:
+            w.write(data)
+
+        # Relleno hasta múltiplo de 512
+        pad = -w.size % TAR_BLOCK
+        if pad:
+            f.write(b"\0" * pad)
+        end = f.tell()
+
+        # Cabecera definitiva con el tamaño real
+        header = self._header(name, w.size, mtime)
+        if len(header) != len(placeholder):
+            raise ValueError("tar header size changed while rewriting")
+        f.seek(header_off)
+        f.write(header)
+        f.seek(end)
+
+        sha = w.hash.hexdigest()
+        self._record(name, data_off, w.size, sha)
+        return self.location(name), sha
+
+    def _finish(self):
+        # Marcador de fin de archivo TAR: dos bloques de ceros
+        self.fileobj.write(b"\0" * (2 * TAR_BLOCK))
+
+
+# ------------------------------------------------------------
+# PackSink
+# ------------------------------------------------------------
+class PackSink(_ContainerSink):
+    """
+    Pack indexado: los datos de cada artefacto se concatenan sin cabeceras
+    en <archivo>.pack y su posición/tamaño/hash se guarda en <archivo>.pack.idx.
+    """
+
+    def _member_end(self, entry):
+        return entry["offset"] + entry["size"]
+
+    def add(self, name, chunks):
+        f = self.fileobj
+        data_off = f.tell()
+
+        w = MemberWriter(f)
+        for data in chunks:
+            w.write(data)
+
+        sha = w.hash.hexdigest()
+        self._record(name, data_off, w.size, sha)
+        return self.location(name), sha
+
+
+def read_pack_member(pack_path, entry):
+    """
+    Devuelve los bytes de un miembro de un pack a partir de su entrada del índice.
+    """
+    with open(pack_path, "rb") as f:
+        f.seek(entry["offset"])
+        return f.read(entry["size"])
+
+
+# ------------------------------------------------------------
+# open_sink()
+# ------------------------------------------------------------
+def open_sink(archive=None, out_dir="recovered", append=False):
+    """
+    Crea el sink adecuado:
+      - archive termina en .tar  → TarSink
+      - archive termina en .pack → PackSink
+      - archive = None           → DirectorySink(out_dir)
+    """
+    if archive is None:
+        return DirectorySink(out_dir)
+
+    mode = "a" if append else "w"
+    if archive.endswith(".tar"):
+        return TarSink(archive, mode)
+    if archive.endswith(".pack"):
+        return PackSink(archive, mode)
+    raise ValueError("archive must end with .tar or .pack")
@@ -0,0 +1,278 @@
+# src/timeline.py
+import os, struct, json, heapq, tempfile
+from array import array
+from datetime import datetime, timezone
+from .ext4_parser import read_superblock, read_group_descriptors, iter_inode_tables, BG_INODE_UNINIT
+
+# ------------------------------------------------------------
+# Timeline MAC(B) de todos los inodos
+#
+# Cada inodo aporta hasta 5 eventos:
+#   a = atime, m = mtime, c = ctime (cambio de metadatos),
+#   d = dtime (borrado), b = crtime (creación, solo inodos grandes)
+#
+# Para no construir millones de dicts en memoria, los eventos se
+# guardan en buffers COLUMNARES de ancho fijo (array) y, cuando se
+# llenan, se ordenan y se vuelcan a disco como "runs" ordenados.
+# Al final se hace un merge externo (heapq.merge) de todos los runs.
+# ------------------------------------------------------------
+EVENT_KINDS = "amcdb"
+
+# Campos fijos del inodo: mode, size_lo, atime, ctime, mtime, dtime, links
+INODE_BASE = struct.Struct("<H2xI4i2xH")
+# Campos "extra" de inodos > 128 bytes (offset 0x80)
+INODE_EXTRA = struct.Struct("<H2xIIIiI")    # extra_isize, ctime/mtime/atime_extra, crtime, crtime_extra
+
+# Registro de ancho fijo en los runs temporales:
+#   seg (int64), nseg (uint32), inodo (uint32), tipo (uint8),
+#   mode (uint16), size (uint64), links (uint16)
+RECORD = struct.Struct("<qIIBHQH")
+
+# Clave de orden empaquetada en un entero (de más a menos significativo):
+#   seg + SEC_BIAS (36 bits), nseg (30), inodo (32), tipo (3), índice (32)
+SEC_BIAS = 1 << 31                # los timestamps base son int32 con signo
+
+CSV_HEADER = "time,epoch,nsec,inode,event,mode,size,links,deleted\n"
+
+
+# ------------------------------------------------------------
+# Decodificación de timestamps
+# ------------------------------------------------------------
+def decode_extra(seconds, extra):
+    """
+    Aplica un campo *_extra de EXT4 a un timestamp de 32 bits:
+      - bits 0-1  : extensión de época (segundos += bits << 32)
+      - bits 2-31 : nanosegundos
+    """
+    return seconds + ((extra & 0x3) << 32), extra >> 2
+
+
+def decode_inode_times(raw, inode_size, offset=0):
+    """
+    Decodifica los timestamps de un inodo a partir de sus bytes crudos.
+
+    Retorna una lista [(tipo, segundos, nanosegundos), ...] sin los
+    timestamps que valen 0 (no inicializados).
+    """
+    mode, size_lo, atime, ctime, mtime, dtime, links = \
+        INODE_BASE.unpack_from(raw, offset)
+
+    atime_ns = ctime_ns = mtime_ns = 0
+    crtime = None
+
+    # Inodos grandes: nanosegundos + crtime si i_extra_isize los cubre
+    if inode_size >= 0x80 + INODE_EXTRA.size:
+        extra_isize, ctime_x, mtime_x, atime_x, crtime_raw, crtime_x = \
+            INODE_EXTRA.unpack_from(raw, offset + 0x80)
+        if extra_isize >= 0x10:
+            ctime, ctime_ns = decode_extra(ctime, ctime_x)
+            mtime, mtime_ns = decode_extra(mtime, mtime_x)
+            atime, atime_ns = decode_extra(atime, atime_x)
+        if extra_isize >= 0x18:
+            crtime = decode_extra(crtime_raw, crtime_x)
+
+    events = []
+    for kind, sec, nsec in (("a", atime, atime_ns), ("m", mtime, mtime_ns),
+                            ("c", ctime, ctime_ns), ("d", dtime, 0)):
+        if sec:
+            events.append((kind, sec, nsec))
+    if crtime and crtime[0]:
+        events.append(("b", crtime[0], crtime[1]))
+    return events
+
+
+# ------------------------------------------------------------
+# Buffer columnar de eventos
+# ------------------------------------------------------------
+class EventBuffer:
+    """
+    Almacena eventos en columnas de ancho fijo (array), mucho más
+    compacto que una lista de dicts o tuplas.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.sec = array("q")
+        self.nsec = array("I")
+        self.inode = array("I")
+        self.kind = array("B")
+        self.mode = array("H")
+        self.size = array("Q")
+        self.links = array("H")
+
+    def __len__(self):
+        return len(self.sec)
+
+    def append(self, sec, nsec, inode, kind, mode, size, links):
+        self.sec.append(sec)
+        self.nsec.append(nsec)
+        self.inode.append(inode)
+        self.kind.append(kind)
+        self.mode.append(mode)
+        self.size.append(size)
+        self.links.append(links)
+
+    def sorted_records(self):
+        """
+        Genera los eventos ordenados por (segundos, nanosegundos, inodo, tipo).
+
+        Cada evento se reduce a UN entero que empaqueta la clave y, en
+        los bits bajos, su índice en las columnas: ordenar enteros no
+        necesita función key ni una tupla por evento.
+        """
+        keys = [((((((s + SEC_BIAS) << 30 | ns) << 32 | ino) << 3 | k) << 32) | i)
+                for i, (s, ns, ino, k)
+                in enumerate(zip(self.sec, self.nsec, self.inode, self.kind))]
+        keys.sort()
+        sec, nsec, inode, kind = self.sec, self.nsec, self.inode, self.kind
+        for key in keys:
+            i = key & 0xFFFFFFFF
+            yield (sec[i], nsec[i], inode[i], kind[i],
+                   self.mode[i], self.size[i], self.links[i])
+
+    def spill(self, tmp_dir):
+        """
+        Ordena el buffer y lo escribe como run temporal de registros fijos.
+        Retorna la ruta del run.
+        """
+        fd, run_path = tempfile.mkstemp(prefix="timeline_run_", suffix=".bin", dir=tmp_dir)
+        with os.fdopen(fd, "wb") as f:
+            for rec in self.sorted_records():
+                f.write(RECORD.pack(*rec))
+        self.clear()
+        return run_path
+
+
+def read_run(run_path, chunk_records=65536):
+    """
+    Lee secuencialmente un run temporal, registro a registro.
+    """
+    with open(run_path, "rb") as f:
+        while True:
+            data = f.read(RECORD.size * chunk_records)
+            if not data:
+                break
+            yield from RECORD.iter_unpack(data)
+
+
+# ------------------------------------------------------------
+# Formateo de salida
+# ------------------------------------------------------------
+def format_time(sec, nsec):
+    """
+    Convierte (segundos, nanosegundos) a ISO-8601 UTC.
+    """
+    try:
+        dt = datetime.fromtimestamp(sec, tz=timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return str(sec)
+    return f"{dt:%Y-%m-%dT%H:%M:%S}.{nsec:09d}Z"
+
+
+def format_event(rec, fmt):
+    sec, nsec, inode, kind, mode, size, links = rec
+    event = EVENT_KINDS[kind]
+    # Un inodo sin enlaces se considera borrado
+    deleted = links == 0
+    if fmt == "ndjson":
+        return json.dumps({
+            "time": format_time(sec, nsec), "epoch": sec, "nsec": nsec,
+            "inode": inode, "event": event, "mode": hex(mode),
+            "size": size, "links": links, "deleted": deleted
+        }) + "\n"
+    return (f"{format_time(sec, nsec)},{sec},{nsec},{inode},{event},"
+            f"{hex(mode)},{size},{links},{int(deleted)}\n")
+
+
+# ------------------------------------------------------------
+# write_timeline()
+# ------------------------------------------------------------
+def write_timeline(path, out, fmt="csv", max_events=1000000, tmp_dir=None):
+    """
+    Genera la timeline MAC(B) de todos los inodos y la escribe en 'out'
+    (un archivo de texto ya abierto) ordenada por tiempo.
+
+    Parámetros:
+      path       : ruta a la imagen
+      out        : objeto archivo de texto donde escribir
+      fmt        : "csv" o "ndjson"
+      max_events : eventos máximos en memoria antes de volcar un run a disco
+      tmp_dir    : carpeta para los runs temporales (por defecto, la del sistema)
+
+    La memoria queda acotada por max_events (más una tabla de inodos),
+    independientemente del tamaño del volumen.
+
+    Retorna el número de eventos escritos.
+    """
+
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError("format must be 'csv' or 'ndjson'")
+
+    sb = read_superblock(path)
+    inode_size = sb["s_inode_size"]
+    total_inodes = sb["s_inodes_count"]
+    first_ino = sb["s_first_ino"]
+    kind_index = {k: i for i, k in enumerate(EVENT_KINDS)}
+
+    # Los grupos con INODE_UNINIT no tienen tabla de inodos inicializada:
+    # su contenido es basura (o ceros) y no aporta eventos reales
+    groups = [g for g, gd in enumerate(read_group_descriptors(path, sb))
+              if not gd["bg_flags"] & BG_INODE_UNINIT]
+
+    buf = EventBuffer()
+    runs = []
+
+    try:
+        # Lectura masiva: una tabla de inodos completa por grupo
+        for _group, first_inode, table in iter_inode_tables(path, sb, groups):
+            count = len(table) // inode_size
+            for i in range(count):
+                inode_num = first_inode + i
+                if inode_num > total_inodes:
+                    break
+
+                off = i * inode_size
+                mode, size_lo, _a, _c, _m, _d, links = INODE_BASE.unpack_from(table, off)
+                # Inodos nunca usados (mode 0) e inodos reservados sin
+                # enlaces: no son evidencia de archivos (ni borrados)
+                if mode == 0 or (inode_num < first_ino and links == 0):
+                    continue
+                events = decode_inode_times(table, inode_size, off)
+                if not events:
+                    continue
+
+                size = size_lo
+                if inode_size >= 0x6c:
+                    size |= struct.unpack_from("<I", table, off + 108)[0] << 32
+
+                for kind, sec, nsec in events:
+                    buf.append(sec, nsec, inode_num, kind_index[kind], mode, size, links)
+
+                if len(buf) >= max_events:
+                    runs.append(buf.spill(tmp_dir))
+
+        if fmt == "csv":
+            out.write(CSV_HEADER)
+
+        # Si todo cupo en memoria no hace falta tocar disco
+        if not runs:
+            stream = buf.sorted_records()
+        else:
+            if len(buf):
+                runs.append(buf.spill(tmp_dir))
+            stream = heapq.merge(*(read_run(r) for r in runs))
+
+        written = 0
+        for rec in stream:
+            out.write(format_event(rec, fmt))
+            written += 1
+        return written
+
+    finally:
+        for r in runs:
+            try:
+                os.remove(r)
+            except OSError:
+                pass
@@ -1,4 +1,6 @@
 import os, struct
+from .img_reader import DiskImage
+from .classify import classmap_ranges, intersect_ranges, DEFAULT_SKIP
 
 # ------------------------------------------------------------
 # Lista de firmas mágicas (magic numbers)
@@ -22,7 +24,8 @@ SIGNATURES = [
 # ------------------------------------------------------------
 # scan_for_signatures()
 # ------------------------------------------------------------
-def scan_for_signatures(image_path, chunk_size=1024*1024):
+def scan_for_signatures(image_path, chunk_size=1024*1024, ranges=None,
+                        class_map=None, skip_classes=DEFAULT_SKIP):
     """
     Escanea una imagen RAW en búsqueda de firmas binarias conocidas
     (file carving por firmas).
@@ -36,6 +39,11 @@ def scan_for_signatures(image_path, chunk_size=1024*1024):
     Parámetros:
       image_path : ruta al archivo IMG o RAW
       chunk_size : tamaño de lectura por bloque (default: 1 MB)
+      ranges     : lista opcional de tramos [(offset, longitud), ...];
+                   si se indica, solo se escanean esos tramos (por ejemplo,
+                   los bloques modificados según blockmap.diff_blockmaps)
+      class_map  : class map opcional (ver classify.py); los bloques de
+                   las clases skip_classes (por defecto, vacíos) no se leen
 
     El escaneo usa ventanas solapadas para evitar que un archivo cuya
     firma esté dividida entre dos chunks quede sin detectar.
@@ -44,51 +52,79 @@ def scan_for_signatures(image_path, chunk_size=1024*1024):
     size = os.path.getsize(image_path)
     results = []
 
-    with open(image_path, "rb") as f:
-        offset = 0
-
-        # Para evitar perder firmas que caen entre dos lecturas,
-        # guardamos los últimos bytes del chunk anterior.
-        overlap = 64
-        prev = b""
-
-        while True:
-
-            # Leer un trozo grande de la imagen (1 MB por defecto)
-            chunk = f.read(chunk_size)
-            if not chunk:
-                break
-
-            # La ventana contiene:
-            #   - últimos 64 bytes del chunk anterior
-            #   - chunk actual
-            window = prev + chunk
-
-            # Buscar todas las firmas dentro de la ventana
-            for sig in SIGNATURES:
-                idx = 0
-                while True:
-                    # Buscar firma dentro de la ventana
-                    found = window.find(sig["sig"], idx)
-                    if found == -1:
-                        break
-
-                    # Calcular offset ABSOLUTO dentro de la imagen
-                    absolute = offset - len(prev) + found
-
-                    # Guardar resultado
-                    results.append({
-                        "name": sig["name"],
-                        "ext": sig["ext"],
-                        "offset": absolute,
-                        "sig": sig["sig"].hex()
-                    })
-
-                    # Continuar buscando más instancias
-                    idx = found + 1
-
-            # Preparar el solapamiento para la siguiente iteración
-            prev = window[-overlap:]
-            offset += len(chunk)
+    if ranges is None:
+        ranges = [(0, size)]
+
+    # Saltar las zonas sin interés según el class map
+    if class_map is not None:
+        ranges = intersect_ranges(sorted(ranges), classmap_ranges(class_map, skip_classes))
+
+    # Lectura secuencial con límite de ancho de banda y hints de fadvise
+    with DiskImage(image_path).open() as f:
+        for start, length in ranges:
+            scan_range(f, start, min(start + length, size), chunk_size, results)
+
+    return results
+
+
+def scan_range(f, start, end, chunk_size, results):
+    """
+    Escanea las firmas que COMIENZAN en [start, end) y las añade a results.
+    Se leen unos bytes más allá de 'end' para completar firmas que
+    empiezan dentro del tramo pero terminan fuera de él.
+    """
+
+    # Para evitar perder firmas que caen entre dos lecturas,
+    # guardamos los últimos bytes del chunk anterior.
+    overlap = 64
+    prev = b""
+    offset = start
+    f.seek(start)
+
+    while offset < end:
+
+        # Leer un trozo grande de la imagen (1 MB por defecto),
+        # más el margen de solapamiento al final del tramo
+        chunk = f.read(min(chunk_size, end + overlap - offset))
+        if not chunk:
+            break
+
+        # La ventana contiene:
+        #   - últimos 64 bytes del chunk anterior
+        #   - chunk actual
+        window = prev + chunk
+
+        # Buscar todas las firmas dentro de la ventana
+        for sig in SIGNATURES:
+            idx = 0
+            while True:
+                # Buscar firma dentro de la ventana
+                found = window.find(sig["sig"], idx)
+                if found == -1:
+                    break
+
+                # Continuar buscando más instancias
+                idx = found + 1
+
+                # Calcular offset ABSOLUTO dentro de la imagen
+                absolute = offset - len(prev) + found
+
+                # Las firmas completas dentro de 'prev' ya se reportaron
+                # en la ventana anterior; las que empiezan fuera del tramo
+                # le corresponden a otro tramo
+                if found + len(sig["sig"]) <= len(prev) or absolute >= end:
+                    continue
+
+                # Guardar resultado
+                results.append({
+                    "name": sig["name"],
+                    "ext": sig["ext"],
+                    "offset": absolute,
+                    "sig": sig["sig"].hex()
+                })
+
+        # Preparar el solapamiento para la siguiente iteración
+        prev = window[-overlap:]
+        offset += len(chunk)
 
     return results
@@ -0,0 +1,159 @@
+# tests/test_fragments.py
+
+import sys, os, zlib, struct, random, hashlib
+
+# Agrega la carpeta raíz del proyecto al PYTHONPATH para que src/ pueda importarse.
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from src.fragments import reassemble            # Reensamblado de JPEG/PNG fragmentados
+from src.img_reader import DiskImage            # Lectura RAW de la imagen
+
+# Imagen RAW de prueba que genera este mismo script
+IMAGE = "fragments_test.img"
+IMAGE_SIZE = 16 * 1024 * 1024
+BLOCK = 4096
+
+rng = random.Random(1234)
+
+
+# ------------------------------------------------------------
+# GENERADORES DE ARCHIVOS DE PRUEBA (sin dependencias externas)
+# ------------------------------------------------------------
+
+def make_png(width=400, height=300):
+    """
+    PNG RGB con píxeles aleatorios y varios chunks IDAT.
+    """
+    def chunk(ctype, data):
+        return struct.pack(">I", len(data)) + ctype + data + struct.pack(">I", zlib.crc32(ctype + data))
+
+    raw = b"".join(b"\0" + rng.randbytes(width * 3) for _ in range(height))
+    idat = zlib.compress(raw, 1)
+    png = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    for i in range(0, len(idat), 65536):
+        png += chunk(b"IDAT", idat[i:i + 65536])
+    return png + chunk(b"IEND", b"")
+
+
+def make_jpeg(width=2048, height=1024):
+    """
+    JPEG baseline en escala de grises con coeficientes aleatorios
+    (no hace falta una DCT real: basta un flujo Huffman válido).
+    Tablas Huffman propias: categorías DC 0-4 y símbolos AC
+    EOB + (run 0, tamaño 1-4).
+    """
+    bits = [0, 2, 3] + [0] * 13          # 2 códigos de 2 bits y 3 de 3 bits
+    dc_syms, ac_syms = [0, 1, 2, 3, 4], [0x00, 0x01, 0x02, 0x03, 0x04]
+
+    def codes(syms):
+        # Códigos canónicos: 00, 01, 100, 101, 110
+        table, code = {}, 0
+        for length, n in enumerate(bits, 1):
+            for _ in range(n):
+                table[syms[len(table)]] = (code, length)
+                code += 1
+            code <<= 1
+        return table
+
+    dc, ac = codes(dc_syms), codes(ac_syms)
+    out, acc, nbits = bytearray(), 0, 0
+
+    def put(value, length):
+        nonlocal acc, nbits
+        acc = (acc << length) | value
+        nbits += length
+        while nbits >= 8:
+            nbits -= 8
+            byte = (acc >> nbits) & 0xFF
+            out.append(byte)
+            if byte == 0xFF:
+                out.append(0x00)         # byte stuffing
+        acc &= (1 << nbits) - 1
+
+    for _ in range((width // 8) * (height // 8)):
+        size = rng.randint(0, 4)
+        put(*dc[size])
+        if size:
+            put(rng.getrandbits(size), size)
+        for _ in range(rng.randint(0, 20)):
+            size = rng.randint(1, 4)
+            put(*ac[size])
+            put(rng.getrandbits(size), size)
+        put(*ac[0x00])                   # EOB
+    if nbits:
+        put((1 << (8 - nbits)) - 1, 8 - nbits)
+
+    def segment(marker, payload):
+        return bytes([0xFF, marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+    dht = bytes(bits)
+    return (b"\xff\xd8"
+            + segment(0xDB, b"\x00" + b"\x01" * 64)
+            + segment(0xC0, struct.pack(">BHHB", 8, height, width, 1) + b"\x01\x11\x00")
+            + segment(0xC4, b"\x00" + dht + bytes(dc_syms))
+            + segment(0xC4, b"\x10" + dht + bytes(ac_syms))
+            + segment(0xDA, b"\x01\x01\x00\x00\x3f\x00")
+            + bytes(out) + b"\xff\xd9")
+
+
+# ------------------------------------------------------------
+# CREAR LA IMAGEN CON LOS ARCHIVOS FRAGMENTADOS
+# ------------------------------------------------------------
+
+def place(image, data, starts, cuts):
+    """
+    Escribe 'data' en la imagen partido en los bloques 'starts'
+    (uno por fragmento), cortando en los bloques 'cuts'.
+    Retorna la lista esperada de fragmentos [(offset, longitud), ...].
+    """
+    bounds = [0] + [c * BLOCK for c in cuts] + [len(data)]
+    fragments = []
+    for start, lo, hi in zip(starts, bounds, bounds[1:]):
+        image[start * BLOCK:start * BLOCK + hi - lo] = data[lo:hi]
+        fragments.append((start * BLOCK, hi - lo))
+    return fragments
+
+
+def main():
+    # El hueco entre fragmentos se llena con datos aleatorios (como
+    # bloques de otros archivos ya borrados)
+    image = bytearray(rng.randbytes(IMAGE_SIZE))
+
+    cases = {
+        "png": (make_png(), [100, 700], [20]),
+        "jpeg": (make_jpeg(), [1500, 1900, 2600], [9, 25]),
+    }
+    expected = {}
+    for name, (data, starts, cuts) in cases.items():
+        expected[name] = (starts[0] * BLOCK, place(image, data, starts, cuts), hashlib.sha256(data).hexdigest())
+
+    with open(IMAGE, "wb") as f:
+        f.write(image)
+
+    print(f"=== Reensamblado de archivos fragmentados en {IMAGE} ===\n")
+
+    # ------------------------------------------------------------
+    # REENSAMBLAR Y COMPARAR HASHES
+    # ------------------------------------------------------------
+
+    failures = 0
+    d = DiskImage(IMAGE)
+    for name, (offset, fragments, sha) in expected.items():
+        result = reassemble(IMAGE, offset)
+        data = b"".join(d.read(off, length) for off, length in result["fragments"])
+        ok = result["status"] == "complete" and hashlib.sha256(data).hexdigest() == sha
+
+        print(f"{name}: {result['status']}, {len(result['fragments'])} fragmentos "
+              f"(esperados {len(fragments)}) → {'OK' if ok else 'FALLO'}")
+        for off, length in result["fragments"]:
+            print(f"  fragmento @ {off} ({length} bytes)")
+        failures += not ok
+
+    os.remove(IMAGE)
+    print("\n=== RESULTADO ===")
+    print("Todo correcto" if not failures else f"{failures} archivo(s) mal reensamblados")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+# tests/test_journal_versions.py
+
+import sys, os
+
+# Agrega la carpeta raíz del proyecto al PYTHONPATH para que src/ pueda importarse.
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from src.journal import build_journal_index, read_inode_versions   # Índice del journal jbd2
+from src.ext4_parser import read_inode                               # Versión actual del inodo
+
+# Nombre de la imagen ext4 previamente generada con create_and_test_demo.py
+IMAGE = "ext4_test.img"
+
+# Inodo cuyo historial se quiere consultar (ver: ls -li /mnt/ext4_demo)
+INODE = 12
+
+print(f"=== Versiones del inodo {INODE} guardadas en el journal ===\n")
+
+# ------------------------------------------------------------
+# INDEXAR EL JOURNAL (una sola pasada)
+# ------------------------------------------------------------
+
+index = build_journal_index(IMAGE)
+
+print("Transacciones encontradas:", len(index["transactions"]))
+print("Bloques del FS con copias en el journal:", len(index["blocks"]))
+
+# ------------------------------------------------------------
+# COMPARAR LA VERSIÓN ACTUAL CON LAS HISTÓRICAS
+# ------------------------------------------------------------
+
+current = read_inode(IMAGE, INODE)
+print("\nVersión actual → size:", current["i_size"], "dtime:", current["i_dtime"])
+
+# Cada consulta reutiliza el índice: no se vuelve a recorrer el journal
+for v in read_inode_versions(IMAGE, INODE, index=index):
+    print(f"txn {v['transaction']} → size: {v['i_size']} dtime: {v['i_dtime']} "
+          f"i_block: {v['i_block']}")